@@ -0,0 +1,8 @@
+#! /usr/bin/env python
+from __future__ import print_function, division, absolute_import
+import sys
+
+from point_tracker import batch_growth
+
+if __name__ == "__main__":
+    sys.exit(batch_growth.main())
@@ -4,10 +4,12 @@ __docformat__ = "restructuredtext"
 import scipy
 from scipy import signal, cos, sin, c_, newaxis
 from .normcross import normcross2d
-from PyQt4.QtCore import QThread, QEvent, QCoreApplication, QPointF, QRectF
+from PyQt4.QtCore import QThread, QEvent, QCoreApplication, QPointF
 from .tracking_undo import AddPoints, MovePoints
 import math
 from .sys_utils import cleanQObject
+from .geometry import affineMatrix, transformCoordinates
+from .debug import timed
 
 
 class NextImage(QEvent):
@@ -45,6 +47,52 @@ class Aborted(QEvent):
         QEvent.__init__(self, QEvent.User)
 
 
+class CellsCleaned(QEvent):
+    """
+    Event notifying the GUI the search for cells to clean is finished.
+
+    If the search failed, `cleaning` is None and `error` is the exception raised.
+    """
+    def __init__(self, data_manager, cleaning, error=None):
+        QEvent.__init__(self, QEvent.User)
+        self.data_manager = data_manager
+        self.cleaning = cleaning
+        self.error = error
+
+
+class FindCellsCleaning(QThread):
+    """
+    Thread looking for the cells to clean, without modifying the data.
+
+    Once done, the thread send the event CellsCleaned to its parent, with the result of
+    `TrackingData.findCellsCleaning` or the error raised. The event is sent even if the search failed.
+
+    Instance variables:
+      - data_manager, TrackingData: object handling the current data
+      - snapshot, TrackingData: snapshot of the data when the thread was created, examined by the thread
+      - processes, int: number of processes used to compute the cells orientation
+    """
+    def __init__(self, data_manager, parent, processes=None):
+        QThread.__init__(self, parent)
+        self.data_manager = data_manager
+        self.snapshot = data_manager.snapshot()
+        self.processes = processes
+
+    def __del__(self):
+        cleanQObject(self)
+
+    def run(self):
+        cleaning = None
+        error = None
+        try:
+            cleaning = self.snapshot.findCellsCleaning(processes=self.processes)
+        except Exception as ex:
+            error = ex
+        finally:
+            self.snapshot = None
+            QCoreApplication.instance().postEvent(self.parent(), CellsCleaned(self.data_manager, cleaning, error))
+
+
 class FindInAll(QThread):
     """
     Thread finding a set of points in a set of images.
@@ -192,6 +240,7 @@ def filterImage(image, filter_size):
     return image
 
 
+@timed("tracking.findTemplate")
 def findTemplate(origin, template_pos, template_size, search_pos, search_size, target):
     """
     Find a template image into another image by normalized cross-correlation.
@@ -244,6 +293,7 @@ class AlgoException(Exception):
         Exception.__init__(self, s)
 
 
+@timed("tracking.alignImages")
 def alignImages(data, alignment_data, translation, rotation):
     """
     Align the images in data using the points found in alignment_data.
@@ -279,24 +329,17 @@ def alignImages(data, alignment_data, translation, rotation):
         a = a[0] - a
     # At last, compute the translation using the reference
     refs = scipy.zeros((len(data), 2), dtype=float)
-    if translation == "Bounding-box centre":
+    if translation in ("Bounding-box centre", "Barycentre"):
         for i, d in enumerate(alignment_data):
             mat, _ = d.matrix().inverted()
-            p1 = None
-            rect = QRectF()
-            for p in d.positions():
-                p = mat.map(p)
-                if p1 is None:
-                    p1 = p
-                else:
-                    rect |= QRectF(p1, p).normalized()
-            mid_pos = rect.center()
-            refs[i, :] = (mid_pos.x(), mid_pos.y())
-    elif translation == "Barycentre":
-        for i, d in enumerate(alignment_data):
-            mat, _ = d.matrix().inverted()
-            mid_pos = mat.map(sum(d.positions(), QPointF())/len(d))
-            refs[i, :] = (mid_pos.x(), mid_pos.y())
+            _, coords = d.coordinates()
+            if len(coords) == 0:  # An image without point keeps its position
+                continue
+            coords = transformCoordinates(affineMatrix(mat), coords)
+            if translation == "Barycentre":
+                refs[i, :] = coords.mean(axis=0)
+            else:
+                refs[i, :] = (coords.min(axis=0) + coords.max(axis=0)) / 2
     else:
         for i, d in enumerate(alignment_data):
             mat, _ = d.matrix().inverted()
@@ -0,0 +1,361 @@
+from __future__ import print_function, division, absolute_import
+"""
+Compute the growth of tracking data files without the interface, for a sweep of configurations.
+
+A configuration is a growth method, with its number of points if the cells are resampled, and a cells selection.
+The configurations are the combinations of the methods and selections given on the command line. Each data file is
+read once; its arrays are then sent once to each worker process, which computes one configuration at a time and
+writes its result file as the images are computed.
+
+The methods are written ``forward``, ``backward`` or ``start``, followed by ``:N`` to resample the cells with N
+points, or by a comma-separated list ``:N1,N2,...`` to sweep them (0 keeps the sparse method). The selections are
+``all``, ``full`` or ``add``, followed by ``:P`` to give the maximum variation of the area, in percent. ``add``
+requires it.
+
+Usage::
+
+    python -m point_tracker.batch_growth -m forward -m forward:50,100 -s all -s add:20 data1.csv data2.csv
+
+Each result is written as ``<data file>-growth-<configuration>.csv``, next to its data file or in the directory given
+with ``-o``.
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+import argparse
+import logging
+import sys
+from .path import path
+from .tracking_data import TrackingData, TrackingDataException
+from . import growth_computation_methods, growth_cache, tracking_binary
+from .growth_computation_methods import GrowthResultException, StreamingResult
+from .growth_parallel import defaultProcesses
+from .utils import processPool
+from . import debug
+from .debug import log_debug
+
+_methods = {"forward": (growth_computation_methods.ForwardMethod, growth_computation_methods.ForwardDenseMethod),
+            "backward": (growth_computation_methods.BackwardMethod, growth_computation_methods.BackwardDenseMethod),
+            "start": (growth_computation_methods.StartMethod, growth_computation_methods.StartDenseMethod)}
+"""
+Sparse and dense classes of each growth method, by name
+"""
+
+_selections = {"all": growth_computation_methods.AllCellsSelection,
+               "full": growth_computation_methods.FullCellsOnlySelection,
+               "add": growth_computation_methods.AddPointsSelection}
+"""
+Cells selection classes, by name
+"""
+
+
+class Configuration(object):
+    """
+    Parameters of one growth computation.
+
+    :IVariables:
+        method : str
+            Name of the growth method, a key of `_methods`
+        nb_points : int
+            Number of points of the resampled cells, 0 for the sparse method
+        selection : str
+            Name of the cells selection, a key of `_selections`
+        max_variation : float
+            Maximum variation of the area of the cells, as a fraction, or None
+        daughter_cells : bool
+            True if the daughter cells are used
+    """
+    __slots__ = ("method", "nb_points", "selection", "max_variation", "daughter_cells")
+
+    def __init__(self, method, nb_points, selection, max_variation, daughter_cells):
+        self.method = method
+        self.nb_points = nb_points
+        self.selection = selection
+        self.max_variation = max_variation
+        self.daughter_cells = daughter_cells
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def name(self):
+        """
+        :returns: the name of the configuration, used in the name of the result file
+        :returntype: str
+        """
+        name = self.method
+        if self.nb_points:
+            name += "-dense%d" % self.nb_points
+        name += "_" + self.selection
+        if self.max_variation is not None:
+            name += "-%g" % (self.max_variation*100)
+        if not self.daughter_cells:
+            name += "_nodaughters"
+        return name
+
+    def createMethod(self):
+        """
+        :returntype: `growth_computation_methods.GrowthMethod`
+        """
+        sparse, dense = _methods[self.method]
+        if self.nb_points:
+            return dense(self.nb_points)
+        return sparse()
+
+    def createSelection(self):
+        """
+        :returntype: `growth_computation_methods.CellsSelection`
+        """
+        cls = _selections[self.selection]
+        if self.selection == "full":
+            return cls(self.daughter_cells)
+        return cls(self.daughter_cells, self.max_variation)
+
+
+def parseMethod(spec):
+    """
+    Parse a method given on the command line, as ``name[:N1,N2,...]``.
+
+    :returns: the name of the method and the numbers of points
+    :returntype: (str, list of int)
+    :raise ValueError: if the specification is invalid
+    """
+    name, _, points = spec.partition(":")
+    name = name.strip().lower()
+    if name not in _methods:
+        raise ValueError("Unknown growth method '%s', use one of: %s" % (name, ", ".join(sorted(_methods))))
+    if not points:
+        return name, [0]
+    nb_points = [int(n) for n in points.split(",")]
+    if any(n < 0 or 0 < n < 3 for n in nb_points):
+        raise ValueError("Invalid number of points in '%s': the cells need at least 3 points" % spec)
+    return name, nb_points
+
+
+def parseSelection(spec):
+    """
+    Parse a cells selection given on the command line, as ``name[:P]`` with P the maximum variation in percent.
+
+    :returns: the name of the selection and the maximum variation, as a fraction
+    :returntype: (str, float)
+    :raise ValueError: if the specification is invalid
+    """
+    name, _, variation = spec.partition(":")
+    name = name.strip().lower()
+    if name not in _selections:
+        raise ValueError("Unknown cells selection '%s', use one of: %s" % (name, ", ".join(sorted(_selections))))
+    if not variation:
+        if name == "add":
+            raise ValueError("The 'add' selection requires a maximum variation, e.g. 'add:20'")
+        return name, None
+    if name == "full":
+        raise ValueError("The 'full' selection doesn't use a maximum variation")
+    return name, float(variation)/100.
+
+
+def configurations(methods, selections, daughter_cells=True):
+    """
+    :returns: the combinations of the methods and selections, without repetition
+    :returntype: list of `Configuration`
+    """
+    result = []
+    names = set()
+    for method, nb_points in methods:
+        for n in nb_points:
+            for selection, max_variation in selections:
+                config = Configuration(method, n, selection, max_variation, daughter_cells)
+                name = config.name()
+                if name not in names:
+                    names.add(name)
+                    result.append(config)
+    return result
+
+
+class _BatchThread(object):
+    """
+    Thread object given to the growth methods, never stopped.
+    """
+    stop = False
+
+    def __init__(self, name):
+        self.name = name
+        self.nb_images = 0
+
+    def stopped(self):
+        return False
+
+    def nextImage(self):
+        self.nb_images += 1
+        log_debug("%s: image %d computed", self.name, self.nb_images)
+
+
+def computeConfiguration(data, list_img, config, filename, incremental=False):
+    """
+    Compute the growth of `data` on the images `list_img` for a configuration, and write it in `filename`.
+
+    :Parameters:
+        incremental : bool
+            If True, the cells whose inputs didn't change since the last computation saved in `filename` are
+            taken from its cache
+
+    :returns: the number of images in the result
+    :returntype: int
+    """
+    method = config.createMethod()
+    cells_selection = config.createSelection()
+    thread = _BatchThread(config.name())
+    result = StreamingResult(data, list_img, filename, method.parameters(), cells_selection.parameters())
+    try:
+        if incremental:
+            growth_cache.computeGrowth(method, list_img, data, cells_selection, thread, filename, result)
+        else:
+            method.thread = thread
+            method(list_img, data, cells_selection, result)
+        nb_images = len(result)
+        result.save()
+    except:
+        result.discard()
+        raise
+    return nb_images
+
+
+_worker = {}
+"""
+Data set, images and options used by the current worker process
+"""
+
+
+def _initWorker(sections, list_img, incremental):
+    _worker["data"] = tracking_binary.fromSections(sections)
+    _worker["list_img"] = list_img
+    _worker["incremental"] = incremental
+
+
+def _computeConfiguration(args):
+    config, filename = args
+    return computeConfiguration(_worker["data"], _worker["list_img"], config, filename, _worker["incremental"])
+
+
+def resultFile(data_file, config, output_dir=None):
+    """
+    :returns: the name of the result file of the configuration `config` for the data file `data_file`
+    :returntype: `path`
+    """
+    data_file = path(data_file)
+    if output_dir is None:
+        output_dir = data_file.dirname()
+    return path(output_dir) / "%s-growth-%s.csv" % (data_file.namebase, config.name())
+
+
+def batchGrowth(data_file, configs, list_img=None, output_dir=None, processes=None, incremental=False):
+    """
+    Compute the growth of a data file for each configuration.
+
+    :Parameters:
+        data_file : str
+            Tracking data file, read once for all the configurations
+        configs : list of `Configuration`
+            Configurations to compute
+        list_img : list of str
+            Images to compute the growth on. If None, all the images of the data are used.
+        output_dir : str
+            Directory of the result files. If None, they are written next to the data file.
+        processes : int
+            Number of processes. If None or 0, there is one process per processor. If 1, the configurations are
+            computed in this process.
+        incremental : bool
+            If True, each configuration reuses the cache of its previous result
+
+    :returns: the name of each result file and its number of images
+    :returntype: list of (`path`, int)
+    """
+    data_file = path(data_file)
+    data = TrackingData(data_file.dirname().dirname())
+    data.load(data_file)
+    if list_img is None:
+        list_img = list(data.images_name)
+    else:
+        unknown = [img for img in list_img if img not in data.images_name]
+        if unknown:
+            raise TrackingDataException("Images not in '%s': %s" % (data_file, ", ".join(unknown)))
+    if len(list_img) < 2:
+        raise TrackingDataException("At least two images are needed to compute the growth.")
+    filenames = [resultFile(data_file, config, output_dir) for config in configs]
+    if not processes:
+        processes = defaultProcesses()
+    processes = min(processes, len(configs))
+    log_debug("Computing %d configurations on '%s' with %d processes", len(configs), data_file, processes)
+    if processes <= 1:
+        nb_images = [computeConfiguration(data, list_img, config, filename, incremental)
+                     for config, filename in zip(configs, filenames)]
+    else:
+        pool = processPool(processes, _initWorker, (tracking_binary.sections(data), list_img, incremental))
+        completed = False
+        try:
+            nb_images = pool.map(_computeConfiguration, list(zip(configs, filenames)), chunksize=1)
+            completed = True
+        finally:
+            if completed:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+    return list(zip(filenames, nb_images))
+
+
+def main(argv=None):
+    """
+    Entry point of the command line tool.
+
+    A data file that fails is reported and skipped, the other files are still computed.
+
+    :returns: 0 if all the data files were computed, 1 otherwise
+    :returntype: int
+    """
+    parser = argparse.ArgumentParser(description="Compute the growth of tracking data files for a sweep of "
+                                     "configurations.")
+    parser.add_argument("files", nargs="+", help="tracking data files")
+    parser.add_argument("-m", "--method", action="append", dest="methods", metavar="METHOD[:N,...]",
+                        help="growth method (forward, backward or start), with the numbers of points to resample "
+                        "the cells with; can be repeated (default: forward)")
+    parser.add_argument("-s", "--selection", action="append", dest="selections", metavar="SELECTION[:P]",
+                        help="cells selection (all, full or add), with the maximum variation of the area in "
+                        "percent; can be repeated (default: all)")
+    parser.add_argument("--no-daughters", action="store_true", help="don't use the daughter cells")
+    parser.add_argument("-i", "--images", nargs="+", help="images to compute the growth on (default: all)")
+    parser.add_argument("-o", "--output-dir", help="directory of the results (default: next to each data file)")
+    parser.add_argument("-j", "--processes", type=int, default=0,
+                        help="number of processes (default: one per processor)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only recompute the cells that changed since the previous results")
+    parser.add_argument("-v", "--verbose", action="store_true", help="report the progress")
+    args = parser.parse_args(argv)
+    debug.init_console(logging.DEBUG if args.verbose else logging.WARNING)
+    try:
+        methods = [parseMethod(spec) for spec in (args.methods or ["forward"])]
+        selections = [parseSelection(spec) for spec in (args.selections or ["all"])]
+    except ValueError as ex:
+        parser.error(str(ex))
+    if args.output_dir is not None and not path(args.output_dir).isdir():
+        parser.error("the output directory '%s' doesn't exist" % args.output_dir)
+    configs = configurations(methods, selections, not args.no_daughters)
+    nb_errors = 0
+    for data_file in args.files:
+        try:
+            results = batchGrowth(data_file, configs, args.images, args.output_dir, args.processes,
+                                  args.incremental)
+        except (TrackingDataException, GrowthResultException, IOError, OSError) as ex:
+            print("Error with '%s': %s" % (data_file, ex), file=sys.stderr)
+            nb_errors += 1
+            continue
+        for filename, nb_images in results:
+            print("Wrote '%s': %d images" % (filename, nb_images))
+    if nb_errors:
+        print("%d of %d data files failed" % (nb_errors, len(args.files)), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
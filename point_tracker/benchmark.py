@@ -0,0 +1,262 @@
+from __future__ import print_function, division, absolute_import
+"""
+Benchmark of the operations of `TrackingData` on synthetic tissues.
+
+For each size, a tissue is generated with `synthetic_tissue.generateTissue`, and the time and peak memory of the
+main operations on the data are measured. The results are written as JSON. No display is needed.
+
+Usage::
+
+    python -m point_tracker.benchmark --sizes 1000 10000 100000 -o results.json
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+import argparse
+import json
+import logging
+import platform
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+import numpy
+from .path import path
+from . import debug
+from .debug import log_debug
+from .tracking_data import TrackingData, EndOfTime
+from .synthetic_tissue import generateTissue
+
+
+def _resetPeakMemory():
+    """
+    Reset the peak resident memory of the process, if the system allows it.
+
+    :returns: True if the peak was reset
+    :returntype: bool
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peakMemory():
+    """
+    :returns: the peak resident memory of the process in bytes, or None if it cannot be measured
+    :returntype: int
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])*1024
+    except (IOError, OSError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak*1024
+
+
+class Benchmark(object):
+    """
+    Benchmark on one synthetic tissue.
+
+    :IVariables:
+        results : dict of str*dict
+            for each operation measured, its total time in seconds, the number of calls, the mean time per call and
+            the peak resident memory in bytes
+        peak_reset : bool
+            if False, the peak memory of an operation is the peak of the process up to that operation
+    """
+    def __init__(self, nb_cells, nb_frames=5, samples=1000, divisions=10, seed=0):
+        self.nb_cells = nb_cells
+        self.nb_frames = nb_frames
+        self.samples = samples
+        self.divisions = divisions
+        self.rng = numpy.random.RandomState(seed)
+        self.seed = seed
+        self.results = {}
+        self.peak_reset = True
+
+    def measure(self, name, fct, *args):
+        """
+        Time a function and record its peak memory.
+
+        `fct` is called with `args` and must return the number of elementary calls it made.
+        """
+        self.peak_reset = _resetPeakMemory() and self.peak_reset
+        start = default_timer()
+        calls = fct(*args)
+        duration = default_timer() - start
+        self.results[name] = {"time": duration,
+                              "calls": calls,
+                              "time_per_call": duration/calls if calls else None,
+                              "peak_rss": peakMemory()}
+        log_debug("%d cells, %s: %g s for %d calls" % (self.nb_cells, name, duration, calls))
+        return self.results[name]
+
+    def sample(self, population, size=None):
+        """
+        :returns: a random sample of the population, in random order
+        :returntype: list
+        """
+        population = list(population)
+        if size is None:
+            size = self.samples
+        size = min(size, len(population))
+        return [population[i] for i in self.rng.permutation(len(population))[:size]]
+
+    def run(self):
+        """
+        Run all the measures.
+
+        :returns: the description of the data set and the results of the measures
+        :returntype: dict
+        """
+        holder = {}
+
+        def generate():
+            holder["data"] = generateTissue(self.nb_cells, self.nb_frames, seed=self.seed)
+            return 1
+        self.measure("generate", generate)
+        data = holder.pop("data")
+        tmpdir = path(tempfile.mkdtemp(prefix="point_tracker_benchmark"))
+        try:
+            self.measureFiles(data, tmpdir)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.measureQueries(data)
+        self.measureEdition(data)
+        points = set()
+        for d in data.data.values():
+            points.update(d)
+        return {"nb_cells": self.nb_cells,
+                "nb_frames": self.nb_frames,
+                "total_cells": len(data.cells),
+                "total_points": len(points),
+                "walls": sum(data.walls.nbWalls(t) for t in range(self.nb_frames)),
+                "peak_reset": self.peak_reset,
+                "operations": self.results}
+
+    def measureFiles(self, data, tmpdir):
+        """
+        Save and load the data in the text and the binary formats
+        """
+        for fmt, ext in (("text", ".csv"), ("binary", ".npz")):
+            filename = tmpdir / ("tissue" + ext)
+
+            def save():
+                data.save(filename)
+                return 1
+
+            def load():
+                TrackingData().load(filename)
+                return 1
+            self.measure("save_" + fmt, save)
+            self.results["save_" + fmt]["file_size"] = filename.getsize()
+            self.measure("load_" + fmt, load)
+
+    def measureQueries(self, data):
+        """
+        Measure the operations not modifying the data
+        """
+        last = data.images_name[-1]
+        t_last = len(data.images_name) - 1
+        cells = self.sample(cid for cid, ls in data.cells_lifespan.items() if ls.start <= t_last)
+
+        def cellAtTime():
+            for cid in cells:
+                data.cellAtTime(cid, last)
+            return len(cells)
+        self.measure("cellAtTime", cellAtTime)
+        points = set()
+        for d in data.data.values():
+            points.update(d)
+        points = self.sample(points)
+
+        def imagesWithPoint():
+            for pt_id in points:
+                data.imagesWithPoint(pt_id)
+            return len(points)
+        self.measure("imagesWithPoint", imagesWithPoint)
+
+        def iterateFrames():
+            nb = 0
+            for img in data.images_name:
+                img_data = data[img]
+                for cid, pts in img_data.cells.items():
+                    nb += 1
+                    [img_data[pid] for pid in pts if pid in img_data]
+            return nb
+        self.measure("iterate_frames", iterateFrames)
+
+    def measureEdition(self, data):
+        """
+        Measure the operations modifying the data. The cells modified by `setCells` are reversed, so `cleanCells` has
+        to reorient them.
+        """
+        last = data.images_name[-1]
+        t_last = len(data.images_name) - 1
+        alive = [cid for cid, ls in data.cells_lifespan.items() if ls.start <= t_last and ls.end == EndOfTime()]
+        cells = self.sample(alive)
+        shapes = [tuple(data.cells[cid])[::-1] for cid in cells]
+
+        def setCells():
+            data.setCells(cells, shapes)
+            return len(cells)
+        self.measure("setCells", setCells)
+
+        def cleanCells():
+            data.cleanCells()
+            return 1
+        self.measure("cleanCells", cleanCells)
+        dividing = self.sample(alive, self.divisions)
+        timed_cells = data[last].cells
+
+        def divide():
+            for cid in dividing:
+                pts = data.cells[cid]
+                timed_cells.divide(cid, data.createNewCell(), data.createNewCell(), pts[0], pts[len(pts)//2])
+            return len(dividing)
+        self.measure("divide", divide)
+
+
+def main(argv=None):
+    """
+    Entry point of the command line tool.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the tracking data on synthetic tissues.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="number of cells on the first image of each tissue")
+    parser.add_argument("--frames", type=int, default=5, help="number of images of each tissue")
+    parser.add_argument("--samples", type=int, default=1000, help="number of calls for the queries and setCells")
+    parser.add_argument("--divisions", type=int, default=10, help="number of cells divided")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random number generator")
+    parser.add_argument("-o", "--output", help="file to write the results in, instead of the standard output")
+    parser.add_argument("-v", "--verbose", action="store_true", help="report the progress")
+    args = parser.parse_args(argv)
+    debug.init_console(logging.DEBUG if args.verbose else logging.WARNING)
+    results = {"python": platform.python_version(),
+               "platform": platform.platform(),
+               "numpy": numpy.__version__,
+               "tissues": []}
+    for nb_cells in args.sizes:
+        bench = Benchmark(nb_cells, args.frames, args.samples, args.divisions, args.seed)
+        results["tissues"].append(bench.run())
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,11 +2,15 @@ from __future__ import print_function, division, absolute_import
 __author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
 __docformat__ = "restructuredtext"
 import traceback
+import os
 import sys
 import logging
+import random
+import threading
+from timeit import default_timer
 from PyQt4 import QtGui
 from .path import path
-from functools import partial
+from functools import partial, wraps
 
 log = None
 
@@ -33,6 +37,15 @@ def init():
         logging.shutdown()
 
 
+def init_console(level=logging.WARNING):
+    """
+    Send the log to the standard error, for the command line tools.
+    """
+    global log
+    logging.basicConfig(level=level, stream=sys.stderr, format="%(levelname)s: %(message)s")
+    log = logging.getLogger("point-tracker")
+
+
 def calling_class():
     """
     Return the class of the caller.
@@ -78,19 +91,38 @@ def caller():
     return stack[-3][:]
 
 
-def print_simple(msg, level):
+def _enabled(level):
+    return log is not None and log.isEnabledFor(level)
+
+
+def _format(msg, args):
+    if args:
+        return msg % args
+    return msg
+
+
+def print_simple(level, msg, *args):
     """
     Simply print the message in the log file.
+
+    The message is formatted with `args` only if the level is enabled.
     """
-    log.log(level, msg)
+    if not _enabled(level):
+        return
+    log.log(level, _format(msg, args))
     # print(msg) #, file=log)
 
 
-def print_calling_class(msg, level):
+def print_calling_class(level, msg, *args):
     """
     Print the message in the log file, preceded by the module and name of the caller class.
+
+    The message is formatted with `args`, and the caller is looked for, only if the level is enabled.
     """
+    if not _enabled(level):
+        return
     cls = calling_class()
+    msg = _format(msg, args)
     if cls:
         msg = "[%s.%s] %s" % (cls.__module__, cls.__name__, msg)
     else:
@@ -99,11 +131,33 @@ def print_calling_class(msg, level):
     # print(msg)
     # log.flush()
 
-log_debug = partial(print_calling_class, level=logging.DEBUG)
-log_info = partial(print_calling_class, level=logging.INFO)
-log_warning = partial(print_calling_class, level=logging.WARNING)
-log_error = partial(print_calling_class, level=logging.ERROR)
-log_critical = partial(print_calling_class, level=logging.CRITICAL)
+
+class lazy(object):
+    """
+    Argument of a log call computed only if the message is formatted.
+
+    Example::
+
+        >>> log_debug("Removing cells: %s", lazy(", ".join, ("%d" % c for c in cell_ids)))
+    """
+    __slots__ = ('fct', 'args', 'kwords')
+
+    def __init__(self, fct, *args, **kwords):
+        self.fct = fct
+        self.args = args
+        self.kwords = kwords
+
+    def __str__(self):
+        return str(self.fct(*self.args, **self.kwords))
+
+    def __repr__(self):
+        return repr(self.fct(*self.args, **self.kwords))
+
+log_debug = partial(print_calling_class, logging.DEBUG)
+log_info = partial(print_calling_class, logging.INFO)
+log_warning = partial(print_calling_class, logging.WARNING)
+log_error = partial(print_calling_class, logging.ERROR)
+log_critical = partial(print_calling_class, logging.CRITICAL)
 
 
 class debug_type(type):
@@ -157,3 +211,256 @@ class debug_object(object):
     Base class for an object having debug_type as metaclass.
     """
     __metaclass__ = debug_type
+
+
+class Instrument(object):
+    """
+    Aggregated measures of a timer or a counter.
+
+    :IVariables:
+        name : str
+            name of the instrument
+        count : int
+            number of events
+        total : float
+            total duration of the timed events, in seconds
+        nbytes : int
+            total number of bytes processed
+        samples : list of float
+            durations of a random sample of the timed events
+    """
+    MAX_SAMPLES = 1000
+    """
+    Maximum number of durations kept to estimate the percentiles
+
+    :type: int
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.
+        self.nbytes = 0
+        self.samples = []
+        self._timed = 0
+
+    def add(self, duration=None, nbytes=0, count=1):
+        """
+        Record events, timed if `duration` is not None.
+        """
+        self.count += count
+        self.nbytes += nbytes
+        if duration is not None:
+            self.total += duration
+            self._timed += 1
+            samples = self.samples
+            if len(samples) < self.MAX_SAMPLES:
+                samples.append(duration)
+            else:
+                # Reservoir sampling: all the events have the same probability to be kept
+                i = random.randrange(self._timed)
+                if i < self.MAX_SAMPLES:
+                    samples[i] = duration
+
+    def percentile(self, p):
+        """
+        :returns: the estimated p-th percentile of the durations, or None if no event was timed
+        :returntype: float
+        """
+        samples = sorted(self.samples)
+        if not samples:
+            return None
+        pos = (len(samples)-1)*p/100
+        i = int(pos)
+        if i+1 >= len(samples):
+            return samples[-1]
+        return samples[i] + (pos-i)*(samples[i+1]-samples[i])
+
+    def summary(self):
+        """
+        :returntype: dict
+        """
+        timed = self._timed
+        return {"name": self.name,
+                "count": self.count,
+                "total": self.total,
+                "mean": self.total/timed if timed else None,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "max": max(self.samples) if self.samples else None,
+                "nbytes": self.nbytes}
+
+
+class _Timer(object):
+    """
+    Context manager timing a block of code. The number of bytes processed can be set in the block.
+    """
+    __slots__ = ('registry', 'name', 'nbytes', 'start')
+
+    def __init__(self, registry, name, nbytes=0):
+        self.registry = registry
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.registry.record(self.name, default_timer() - self.start, self.nbytes)
+        return False
+
+
+class InstrumentRegistry(object):
+    """
+    Registry of the timers and counters of the application.
+
+    The registry can be used from any thread.
+
+    :IVariables:
+        enabled : bool
+            if False, nothing is recorded
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._instruments = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration=None, nbytes=0, count=1):
+        """
+        Record events on the instrument `name`, timed if `duration` is not None.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            instrument = self._instruments.get(name)
+            if instrument is None:
+                instrument = self._instruments[name] = Instrument(name)
+            instrument.add(duration, nbytes, count)
+
+    def count(self, name, count=1, nbytes=0):
+        """
+        Count events, without timing them.
+        """
+        self.record(name, None, nbytes, count)
+
+    def timer(self, name, nbytes=0):
+        """
+        :returns: a context manager timing the code it contains
+        """
+        return _Timer(self, name, nbytes)
+
+    def timed(self, name=None):
+        """
+        Decorator timing each call of a function. If no name is given, the qualified name of the function is used.
+
+        It can be used as ``@timed`` or ``@timed("name")``. If the registry is not enabled when the function is
+        decorated, the function is returned unchanged, so it costs nothing to call.
+        """
+        if callable(name):
+            return self.timed()(name)
+
+        def decorator(fct):
+            if not self.enabled:
+                return fct
+            timer_name = name
+            if timer_name is None:
+                timer_name = "%s.%s" % (fct.__module__.split(".")[-1], getattr(fct, "__qualname__", fct.__name__))
+
+            @wraps(fct)
+            def timed_fct(*args, **kwords):
+                if not self.enabled:
+                    return fct(*args, **kwords)
+                start = default_timer()
+                try:
+                    return fct(*args, **kwords)
+                finally:
+                    self.record(timer_name, default_timer() - start)
+            return timed_fct
+        return decorator
+
+    def reset(self):
+        """
+        Forget all the measures
+        """
+        with self._lock:
+            self._instruments = {}
+
+    def summary(self):
+        """
+        :returns: the aggregated measures of each instrument, sorted by decreasing total time
+        :returntype: list of dict
+        """
+        with self._lock:
+            summaries = [instrument.summary() for instrument in self._instruments.values()]
+        summaries.sort(key=lambda s: (-s["total"], s["name"]))
+        return summaries
+
+    def report(self):
+        """
+        :returns: a text table of the measures
+        :returntype: str
+        """
+        def ms(value):
+            return "%10.3f" % (value*1000) if value is not None else " "*10
+        lines = ["%-40s %8s %10s %10s %10s %10s %10s %12s" % ("Name", "Count", "Total(ms)", "Mean(ms)", "p50(ms)",
+                                                              "p90(ms)", "p99(ms)", "Bytes")]
+        for s in self.summary():
+            lines.append("%-40s %8d %s %s %s %s %s %12d" % (s["name"], s["count"], ms(s["total"]), ms(s["mean"]),
+                                                            ms(s["p50"]), ms(s["p90"]), ms(s["p99"]), s["nbytes"]))
+        return "\n".join(lines)
+
+INSTRUMENTS_VARIABLE = "POINT_TRACKER_INSTRUMENTS"
+"""
+Environment variable enabling the instruments, if set to a non-empty value when the application starts
+"""
+
+instruments = InstrumentRegistry(bool(os.environ.get(INSTRUMENTS_VARIABLE)))
+"""
+Registry of the instruments of the application
+"""
+
+timer = instruments.timer
+timed = instruments.timed
+count = instruments.count
+
+
+def dump_instruments(level=logging.INFO):
+    """
+    Write the measures of the instruments in the log.
+    """
+    print_simple(level, "Instruments:\n%s", lazy(instruments.report))
+
+
+def show_instruments(parent=None):
+    """
+    Show the measures of the instruments in a dialog, from which they can also be written in the log or reset.
+    """
+    dlg = QtGui.QDialog(parent)
+    dlg.setWindowTitle("Timings")
+    layout = QtGui.QVBoxLayout(dlg)
+    text = QtGui.QPlainTextEdit(dlg)
+    text.setReadOnly(True)
+    text.setLineWrapMode(QtGui.QPlainTextEdit.NoWrap)
+    font = QtGui.QFont("Courier")
+    font.setStyleHint(QtGui.QFont.TypeWriter)
+    text.setFont(font)
+    if instruments.enabled:
+        text.setPlainText(instruments.report())
+    else:
+        text.setPlainText("The instruments are disabled: set the environment variable %s to enable them."
+                          % INSTRUMENTS_VARIABLE)
+    layout.addWidget(text)
+    buttons = QtGui.QDialogButtonBox(QtGui.QDialogButtonBox.Close | QtGui.QDialogButtonBox.Reset, parent=dlg)
+    log_button = buttons.addButton("Write to log", QtGui.QDialogButtonBox.ActionRole)
+    layout.addWidget(buttons)
+
+    def reset():
+        instruments.reset()
+        text.setPlainText(instruments.report())
+    buttons.rejected.connect(dlg.reject)
+    buttons.button(QtGui.QDialogButtonBox.Reset).clicked.connect(reset)
+    log_button.clicked.connect(partial(dump_instruments, logging.INFO))
+    dlg.resize(900, 400)
+    dlg.exec_()
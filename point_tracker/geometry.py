@@ -3,7 +3,8 @@ __author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
 __docformat__ = "restructuredtext"
 from PyQt4.QtCore import QPointF, QRectF
 from math import atan2, sqrt
-from numpy import inf
+from numpy import (inf, array, arange, asarray, add, empty, concatenate, errstate, linspace, zeros, cumsum, hypot,
+                   searchsorted, maximum, minimum)
 
 
 def angle(ref, pt):
@@ -135,3 +136,239 @@ def distToPolyLine(pt,  line):
         if d1 < d:
             d = d1
     return d
+
+
+def affineMatrix(transform):
+    """
+    Convert a `QTransform` into a 2x3 affine matrix M = [A|b], such that a point p is mapped onto A.p + b.
+
+    Only the affine part of the transform is kept.
+
+    :returntype: ndarray(2,3)
+    """
+    return array([[transform.m11(), transform.m21(), transform.dx()],
+                  [transform.m12(), transform.m22(), transform.dy()]], dtype=float)
+
+
+def transformCoordinates(mat, coords):
+    """
+    Apply the 2x3 affine matrix `mat` on an array of coordinates, one point per line.
+
+    :returntype: ndarray(N,2)
+    """
+    return coords.dot(mat[:, :2].T) + mat[:, 2]
+
+
+def polylineArcLength(coords):
+    """
+    Compute the curvilinear abscissa of the vertices of a polyline.
+
+    :Parameters:
+        coords : ndarray(N,2)
+            Vertices of the polyline
+
+    :returns: the length of the polyline from its first vertex to each vertex
+    :returntype: ndarray(N) of float
+    """
+    coords = asarray(coords, dtype=float).reshape(-1, 2)
+    arc = zeros((coords.shape[0],), dtype=float)
+    if coords.shape[0] > 1:
+        vects = coords[1:] - coords[:-1]
+        cumsum(hypot(vects[:, 0], vects[:, 1]), out=arc[1:])
+    return arc
+
+
+def polylineLength(coords):
+    """
+    :returns: the length of the polyline whose vertices are `coords`
+    :returntype: float
+    """
+    coords = asarray(coords, dtype=float).reshape(-1, 2)
+    vects = coords[1:] - coords[:-1]
+    return hypot(vects[:, 0], vects[:, 1]).sum()
+
+
+def polylinesLength(coords, starts, ends):
+    """
+    Compute the length of a set of polylines sharing the same array of vertices.
+
+    :Parameters:
+        coords : ndarray(N,2)
+            Vertices of all the polylines
+        starts : ndarray(M) of int
+            Index in `coords` of the first vertex of each polyline
+        ends : ndarray(M) of int
+            Index in `coords` of the last vertex of each polyline. Each polyline must have at least two vertices.
+
+    :returns: the length of each polyline
+    :returntype: ndarray(M) of float
+    """
+    coords = asarray(coords, dtype=float).reshape(-1, 2)
+    starts = asarray(starts, dtype=int)
+    if not len(starts):
+        return empty((0,), dtype=float)
+    vects = coords[1:] - coords[:-1]
+    # The last segment is followed by a null one, so each polyline ends before the end of the array
+    segments = concatenate((hypot(vects[:, 0], vects[:, 1]), [0.]))
+    bounds = empty((2*len(starts),), dtype=int)
+    bounds[0::2] = starts
+    bounds[1::2] = ends
+    return add.reduceat(segments, bounds)[0::2]
+
+
+def polylinePoints(coords, arc, positions):
+    """
+    Find the points of a polyline at given curvilinear abscissa.
+
+    :Parameters:
+        coords : ndarray(N,2)
+            Vertices of the polyline, with N > 1
+        arc : ndarray(N)
+            Curvilinear abscissa of the vertices, as returned by `polylineArcLength`
+        positions : ndarray(M)
+            Curvilinear abscissa of the points to find. Positions outside the polyline are extrapolated from the
+            first or last segment.
+
+    :returntype: ndarray(M,2)
+    """
+    positions = asarray(positions, dtype=float)
+    # Segment starting before each position, skipping the segments of null length
+    idx = maximum(minimum(searchsorted(arc, positions, side='right') - 1, len(arc) - 2), 0)
+    length = arc[idx + 1] - arc[idx]
+    length[length == 0] = 1
+    ratio = (positions - arc[idx]) / length
+    return coords[idx] + (coords[idx + 1] - coords[idx]) * ratio[:, None]
+
+
+def resamplePolyline(coords, n, arc=None):
+    """
+    Place points regularly along a polyline.
+
+    The points are spaced by a n-th of the length of the polyline, starting from its first vertex. The last vertex
+    is not included.
+
+    :Parameters:
+        coords : ndarray(N,2)
+            Vertices of the polyline, with N > 1
+        n : int
+            Number of points
+        arc : ndarray(N)
+            Curvilinear abscissa of the vertices, computed if None
+
+    :returntype: ndarray(n,2)
+    """
+    coords = asarray(coords, dtype=float).reshape(-1, 2)
+    if arc is None:
+        arc = polylineArcLength(coords)
+    return polylinePoints(coords, arc, arange(n) * (arc[-1] / n))
+
+
+def _following(nb_pts, starts):
+    """
+    :returns: the index of the vertex following each vertex in its polygon
+    :returntype: ndarray of int
+    """
+    following = arange(1, nb_pts+1)
+    following[concatenate((starts[1:], [nb_pts]))-1] = starts
+    return following
+
+
+def _polygonsSignedArea(args):
+    coords, starts = args
+    nb_pts = len(coords)
+    if not len(starts):
+        return empty((0,), dtype=float)
+    following = _following(nb_pts, starts)
+    x = coords[:, 0]
+    y = coords[:, 1]
+    return add.reduceat(x*y[following] - x[following]*y, starts)/2
+
+
+def polygonsSignedArea(coords, starts, processes=None):
+    """
+    Compute the signed area of a set of polygons, using the shoelace formula.
+
+    :Parameters:
+        coords : ndarray(N,2)
+            Vertices of all the polygons, stored one polygon after the other
+        starts : ndarray(M) of int
+            Index in `coords` of the first vertex of each polygon. Each polygon must have at least one vertex.
+        processes : int
+            If larger than 1, the polygons are split into this number of groups, processed by a pool of processes.
+
+    :returns: the area of each polygon, positive if the polygon is oriented counter-clockwise in a direct frame
+    :returntype: ndarray(M) of float
+    """
+    coords = asarray(coords, dtype=float).reshape(-1, 2)
+    starts = asarray(starts, dtype=int)
+    if not processes or processes < 2 or len(starts) < 2*processes:
+        return _polygonsSignedArea((coords, starts))
+    from .utils import processPool
+    bounds = linspace(0, len(starts), processes+1).astype(int)
+    limits = concatenate((starts, [len(coords)]))
+    chunks = [(coords[limits[b1]:limits[b2]], starts[b1:b2]-limits[b1]) for b1, b2 in zip(bounds[:-1], bounds[1:])]
+    pool = processPool(processes)
+    try:
+        return concatenate(pool.map(_polygonsSignedArea, chunks))
+    finally:
+        pool.close()
+
+
+def polygonsCentroid(coords, starts):
+    """
+    Compute the centroid of a set of polygons.
+
+    :Parameters:
+        coords : ndarray(N,2)
+            Vertices of all the polygons, stored one polygon after the other
+        starts : ndarray(M) of int
+            Index in `coords` of the first vertex of each polygon. Each polygon must have at least one vertex.
+
+    :returns: the centroid of each polygon, NaN for polygons with a null area
+    :returntype: ndarray(M,2) of float
+    """
+    coords = asarray(coords, dtype=float).reshape(-1, 2)
+    starts = asarray(starts, dtype=int)
+    if not len(starts):
+        return empty((0, 2), dtype=float)
+    following = _following(len(coords), starts)
+    x = coords[:, 0]
+    y = coords[:, 1]
+    xf = x[following]
+    yf = y[following]
+    cr = x*yf - xf*y
+    area3 = add.reduceat(cr, starts)*3
+    result = empty((len(starts), 2), dtype=float)
+    with errstate(divide="ignore", invalid="ignore"):
+        result[:, 0] = add.reduceat((x + xf)*cr, starts)/area3
+        result[:, 1] = add.reduceat((y + yf)*cr, starts)/area3
+    return result
+
+
+def pointsInPolygon(points, polygon):
+    """
+    Test which points are inside a polygon, using the even-odd rule.
+
+    :Parameters:
+        points : ndarray(N,2)
+            Coordinates of the points to test
+        polygon : ndarray(M,2)
+            Vertices of the polygon
+
+    :returntype: ndarray(N) of bool
+    """
+    points = asarray(points, dtype=float).reshape(-1, 2)
+    polygon = asarray(polygon, dtype=float).reshape(-1, 2)
+    inside = zeros((points.shape[0],), dtype=bool)
+    if polygon.shape[0] < 3:
+        return inside
+    x = points[:, 0]
+    y = points[:, 1]
+    x1, y1 = polygon[-1]
+    for x2, y2 in polygon.tolist():
+        crossing = (y1 > y) != (y2 > y)
+        if crossing.any():
+            xc = x1 + (y[crossing] - y1)*(x2 - x1)/(y2 - y1)
+            inside[crossing] ^= x[crossing] < xc
+        x1, y1 = x2, y2
+    return inside
@@ -3,8 +3,11 @@ __author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
 __docformat__ = "restructuredtext"
 
 from numpy import array, eye, argsort, cross, dot, asarray, asmatrix, diag, matrix, exp, log, cos, sin, pi, arctan2
+from numpy import (arange, empty, einsum, errstate, full, hypot, isfinite, isnan, maximum, nan, newaxis, where,
+                   zeros)
 from numpy.linalg import norm, eig, cond, svd, det, eigh
 from math import atan2
+from .debug import timed
 
 def linear2exponential_growth(value, dt):
     """
@@ -191,6 +194,7 @@ def growthTensor(p, q, dt, at_start=True, exp_correction=True, want_transform=Fa
         return T, t
     return T
 
+@timed("growth.growthParams")
 def growthParams(p, q, dt, exp_correction=True, at_start=True):
     """
     Return the growth parameters corresponding to the transformation of points
@@ -229,6 +233,174 @@ def growthParams(p, q, dt, exp_correction=True, at_start=True):
     else:
         raise ValueError("Cannot handle growth in more than 3D.")
 
+def packPoints(point_lists):
+    """
+    Stack lists of points of different lengths into one padded array.
+
+    :Parameters:
+        point_lists : list of ndarray(N_i,2)
+            Points of each cell
+
+    :returns: the points, padded with zeros, and the number of points of each cell
+    :returntype: (ndarray(C,N,2), ndarray(C) of int)
+    """
+    counts = array([len(pts) for pts in point_lists], dtype=int)
+    nb_pts = counts.max() if len(counts) else 0
+    packed = zeros((len(point_lists), nb_pts, 2), dtype=float)
+    for i, pts in enumerate(point_lists):
+        if len(pts):
+            packed[i, :len(pts)] = pts
+    return packed, counts
+
+@timed("growth.growthParamsBatch")
+def growthParamsBatch(p, q, dt, counts=None, exp_correction=True, at_start=True):
+    """
+    Compute the growth parameters of many 2D cells at once.
+
+    This gives the same results as calling `growthParams` on each cell. The 2x2 fits, inverses and polar
+    decompositions use closed forms, and the symmetric eigen-decompositions are done on all the cells at once by NumPy.
+    The few cells whose fit is nearly singular, or whose polar decomposition is not unique, are computed by
+    `growthParams`.
+
+    :Parameters:
+        p : ndarray(C,N,2) | list of ndarray(N_i,2)
+            Points of each cell at time t. If the cells don't all have the same number of points, either give the list
+            of points of each cell, or pad the array and give `counts`.
+        q : ndarray(C,N,2) | list of ndarray(N_i,2)
+            Points of each cell at time t+dt
+        dt : float | ndarray(C)
+            Time between points p and q
+        counts : ndarray(C) of int
+            Number of points of each cell, if the arrays are padded
+        exp_correction : bool
+            If True, the result is corrected for exponential growth instead of linear
+        at_start : bool
+            If True, the scaling is performed before the rotation
+
+    :returns: the growth parameters (kmaj, kmin, theta, psi) of each cell, with NaN for the cells for which
+        `growthParams` returns None
+    :returntype: ndarray(C,4)
+    """
+    if isinstance(p, (list, tuple)):
+        p, counts = packPoints(p)
+        q, _ = packPoints(q)
+    p = asarray(p, dtype=float)
+    q = asarray(q, dtype=float)
+    nb_cells, nb_pts = p.shape[:2]
+    if counts is None:
+        counts = full(nb_cells, nb_pts, dtype=int)
+    counts = asarray(counts, dtype=int)
+    dt = asarray(dt, dtype=float) * (zeros(nb_cells) + 1)
+    result = full((nb_cells, 4), nan)
+    if nb_cells == 0:
+        return result
+    # Least-square fit of the transformation, as in fitmat
+    mask = (arange(nb_pts)[newaxis, :] < counts[:, newaxis])[..., newaxis]
+    n = maximum(counts, 1)[:, newaxis]
+    pp = where(mask, p - (where(mask, p, 0).sum(1) / n)[:, newaxis], 0)
+    qq = where(mask, q - (where(mask, q, 0).sum(1) / n)[:, newaxis], 0)
+    A = einsum('cni,cnj->cij', pp, pp)
+    V = einsum('cni,cnj->cij', pp, qq)
+    a, b, d = A[:, 0, 0], A[:, 0, 1], A[:, 1, 1]
+    # A is symmetric: its singular values are the absolute values of its eigenvalues
+    half_trace = (a + d) / 2
+    disc = hypot((a - d) / 2, b)
+    with errstate(divide='ignore', invalid='ignore'):
+        cond_A = abs(half_trace + disc) / abs(half_trace - disc)
+    doubtful = ~(cond_A < 1e12)
+    for i in doubtful.nonzero()[0]:
+        cond_A[i] = cond(A[i]) if counts[i] > 0 else nan
+    valid = isfinite(cond_A) & (cond_A <= 1e15)
+    det_A = a * d - b * b
+    det_A[~valid] = 1
+    inv_A = empty(A.shape)
+    inv_A[:, 0, 0] = d / det_A
+    inv_A[:, 0, 1] = -b / det_A
+    inv_A[:, 1, 0] = -b / det_A
+    inv_A[:, 1, 1] = a / det_A
+    t = einsum('cij,cjk->cki', inv_A, V)
+    # Polar decomposition: the rotation R is the one making R^T t (or t R^T) symmetric with a positive trace
+    sx = t[:, 0, 0] + t[:, 1, 1]
+    sy = t[:, 1, 0] - t[:, 0, 1]
+    scale = abs(t).reshape(nb_cells, 4).sum(1)
+    fallback = valid & ~(hypot(sx, sy) > 1e-8 * scale)
+    valid &= ~fallback
+    alpha = arctan2(sy, sx)
+    ca = cos(alpha)
+    sa = sin(alpha)
+    R = empty(t.shape)
+    R[:, 0, 0] = ca
+    R[:, 0, 1] = -sa
+    R[:, 1, 0] = sa
+    R[:, 1, 1] = ca
+    if at_start:
+        P = einsum('cji,cjk->cik', R, t)
+    else:
+        P = einsum('cij,ckj->cik', t, R)
+    P = (P + P.transpose(0, 2, 1)) / 2
+    with errstate(invalid='ignore', divide='ignore'):
+        tr = (P - eye(2)) / dt[:, newaxis, newaxis]
+        tr[~valid] = 0
+        if exp_correction:
+            w, v = eigh(tr)
+            w = log(w * dt[:, newaxis] + 1) / dt[:, newaxis]
+            tr = einsum('cij,cj,ckj->cik', v, w, v)
+            tr[~valid] = 0
+        values, vectors = eigh(tr)
+    swap = abs(values[:, 0]) > abs(values[:, 1])
+    maj = where(swap, 0, 1)
+    cells = arange(nb_cells)
+    kmaj = values[cells, maj]
+    kmin = values[cells, 1 - maj]
+    theta = arctan2(vectors[cells, 1, maj], vectors[cells, 0, maj])
+    theta = where(theta < pi / 2, theta + pi, where(theta > pi / 2, theta - pi, theta))
+    with errstate(invalid='ignore', divide='ignore'):
+        psi = -alpha / dt
+    psi[~isfinite(tr).all(2).all(1)] = nan
+    result[valid] = array([kmaj, kmin, theta, psi]).T[valid]
+    for i in fallback.nonzero()[0]:
+        gp = growthParams(p[i, :counts[i]], q[i, :counts[i]], dt[i], exp_correction, at_start)
+        if gp is not None:
+            result[i] = gp
+    return result
+
+def checkGrowthParamsBatch(p, q, dt, exp_correction=True, at_start=True, tolerance=1e-8):
+    """
+    Compare `growthParamsBatch` with `growthParams` called on each cell.
+
+    The arguments are those of `growthParamsBatch`, with the points of each cell given as a list.
+
+    The vorticities are compared modulo 2 pi / dt: a half-turn can be measured as pi or -pi depending on the
+    rounding of the rotation. The orientations are not compared for isotropic growth, where they are undefined.
+
+    :returns: the indices of the cells whose parameters differ by more than `tolerance`, relative to the largest
+        growth or vorticity rate of the cell
+    :returntype: list of int
+    """
+    batch = growthParamsBatch(p, q, dt, None, exp_correction, at_start)
+    dts = asarray(dt, dtype=float) * (zeros(len(p)) + 1)
+    wrong = []
+    for i, (ps, qs) in enumerate(zip(p, q)):
+        with errstate(divide='ignore', invalid='ignore'):
+            gp = growthParams(asarray(ps, dtype=float), asarray(qs, dtype=float), dts[i], exp_correction, at_start)
+        if gp is None:
+            if not isnan(batch[i]).all():
+                wrong.append(i)
+            continue
+        gp = array(gp, dtype=float)
+        scale = max(abs(gp[0]), abs(gp[1]), abs(gp[3]), 1e-300)
+        if isnan(gp).any() or isnan(batch[i]).any():
+            if (isnan(gp) != isnan(batch[i])).any():
+                wrong.append(i)
+            continue
+        diff = abs(batch[i] - gp)
+        period = 2 * pi / dts[i]
+        diff[3] = abs((batch[i, 3] - gp[3] + period / 2) % period - period / 2)
+        if (max(diff[0], diff[1], diff[3]) > tolerance * scale or
+                (diff[2] > tolerance and abs(gp[0] - gp[1]) > tolerance * scale)):
+            wrong.append(i)
+    return wrong
+
 def tensor2Params(tensor):
     """
     :returns: The growth parameters as (kmaj, kmin, theta, phi) if 2D and
@@ -0,0 +1,329 @@
+from __future__ import print_function, division, absolute_import
+"""
+Incremental computation of the growth.
+
+The growth is computed by units: one cell for one image used by the method. The fingerprint of a unit covers
+everything its growth depends on: the parameters of the method and of the cells selection, the images and their
+times, the points selected for the cell, the life spans and points of the cell and its daughters, the positions of
+these points and the shapes of the walls between them on both images.
+
+The outputs of each unit are kept in a cache file next to the result. When the growth is computed again, only the
+units whose fingerprint changed are computed, the other ones are taken from the cache.
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+import hashlib
+import json
+import numpy
+from .path import path
+from .growth_computation_methods import Result, wall
+from .debug import log_debug
+
+CACHE_SUFFIX = "-growth-cache.npz"
+"""
+Suffix replacing the extension of the result file to name its cache
+
+:type: str
+"""
+
+CACHE_VERSION = 1
+"""
+Version of the cache files written
+
+:type: int
+"""
+
+
+def cacheFile(filename):
+    """
+    :returns: the name of the cache file of the result file `filename`
+    :returntype: `path`
+    """
+    filename = path(filename)
+    return path(filename.stripext() + CACHE_SUFFIX)
+
+
+class _Unit(object):
+    """
+    Outputs of the growth computation for one cell and one image.
+
+    :IVariables:
+        growth : tuple of float
+            growth parameters of the cell, or None if the cell has none
+        area : float
+            growth of the area of the cell
+        shape : (ndarray(N,2), ndarray(N,2))
+            points used to compute the growth, on both images
+        walls : dict of (int,int)*float
+            growth of the walls of the cell
+    """
+    __slots__ = ("fingerprint", "growth", "area", "shape", "walls")
+
+    def __init__(self, fingerprint, growth=None, area=None, shape=None, walls=None):
+        self.fingerprint = fingerprint
+        self.growth = growth
+        self.area = area
+        self.shape = shape
+        self.walls = walls if walls is not None else {}
+
+
+class GrowthCache(object):
+    """
+    Outputs of the units computed, by image and cell.
+
+    :IVariables:
+        units : dict of (str,int)*`_Unit`
+            outputs of each unit, by image name and cell id
+    """
+    def __init__(self):
+        self.units = {}
+
+    def get(self, img_name, cid, fingerprint):
+        """
+        :returns: the unit of the cell `cid` for the image `img_name`, if its fingerprint is `fingerprint`
+        :returntype: `_Unit`
+        """
+        unit = self.units.get((img_name, cid))
+        if unit is not None and unit.fingerprint == fingerprint:
+            return unit
+        return None
+
+    def load(self, filename):
+        """
+        Read the cache file. If it doesn't exist or cannot be read, the cache is empty.
+
+        :returns: True if the file was read
+        :returntype: bool
+        """
+        self.units = {}
+        filename = path(filename)
+        if not filename.isfile():
+            return False
+        try:
+            archive = numpy.load(filename, allow_pickle=False)
+        except (IOError, OSError, ValueError) as ex:
+            log_debug("Cannot read growth cache '%s': %s", filename, ex)
+            return False
+        try:
+            header = json.loads(str(archive["header"]))
+            if header.get("version") != CACHE_VERSION:
+                return False
+            images = header["images"]
+            unit_image = archive["unit_image"].tolist()
+            unit_cell = archive["unit_cell"].tolist()
+            fingerprints = [f.decode("ascii") for f in archive["unit_fingerprint"].tolist()]
+            has_growth = archive["unit_has_growth"].tolist()
+            growth = archive["unit_growth"].tolist()
+            area = archive["unit_area"].tolist()
+            shape_indptr = archive["shape_indptr"].tolist()
+            shape_begin = archive["shape_begin"]
+            shape_end = archive["shape_end"]
+            wall_indptr = archive["wall_indptr"].tolist()
+            wall_keys = archive["wall_keys"].tolist()
+            wall_values = archive["wall_values"].tolist()
+        except KeyError as ex:
+            log_debug("Invalid growth cache '%s': missing %s", filename, ex)
+            return False
+        finally:
+            archive.close()
+        units = self.units
+        for n, (img, cid, fingerprint) in enumerate(zip(unit_image, unit_cell, fingerprints)):
+            unit = _Unit(fingerprint)
+            if has_growth[n]:
+                unit.growth = tuple(growth[n])
+                unit.area = area[n]
+                start, end = shape_indptr[n], shape_indptr[n+1]
+                unit.shape = (shape_begin[start:end], shape_end[start:end])
+            unit.walls = dict((tuple(wall_keys[k]), wall_values[k]) for k in range(wall_indptr[n], wall_indptr[n+1]))
+            units[images[img], cid] = unit
+        return True
+
+    def save(self, filename):
+        """
+        Write the cache file.
+        """
+        keys = sorted(self.units)
+        images = sorted(set(img for img, _ in keys))
+        img_index = dict((img, n) for n, img in enumerate(images))
+        units = [self.units[key] for key in keys]
+        empty_coords = numpy.empty((0, 2), dtype=float)
+        shapes = [unit.shape if unit.growth is not None else (empty_coords, empty_coords) for unit in units]
+        walls = [sorted(unit.walls.items()) for unit in units]
+        sections = {"header": numpy.array(json.dumps({"version": CACHE_VERSION, "images": images})),
+                    "unit_image": numpy.array([img_index[img] for img, _ in keys], dtype=int),
+                    "unit_cell": numpy.array([cid for _, cid in keys], dtype=int),
+                    "unit_fingerprint": numpy.array([unit.fingerprint.encode("ascii") for unit in units],
+                                                    dtype="S40"),
+                    "unit_has_growth": numpy.array([unit.growth is not None for unit in units], dtype=bool),
+                    "unit_growth": numpy.array([unit.growth if unit.growth is not None else (numpy.nan,)*4
+                                                for unit in units], dtype=float).reshape(-1, 4),
+                    "unit_area": numpy.array([unit.area if unit.growth is not None else numpy.nan
+                                              for unit in units], dtype=float),
+                    "shape_indptr": numpy.concatenate(([0], numpy.cumsum([len(sh[0]) for sh in shapes],
+                                                                         dtype=int))),
+                    "shape_begin": numpy.concatenate([numpy.asarray(sh[0], dtype=float).reshape(-1, 2)
+                                                      for sh in shapes] + [empty_coords]),
+                    "shape_end": numpy.concatenate([numpy.asarray(sh[1], dtype=float).reshape(-1, 2)
+                                                    for sh in shapes] + [empty_coords]),
+                    "wall_indptr": numpy.concatenate(([0], numpy.cumsum([len(ws) for ws in walls], dtype=int))),
+                    "wall_keys": numpy.array([key for ws in walls for key, _ in ws], dtype=int).reshape(-1, 2),
+                    "wall_values": numpy.array([k for ws in walls for _, k in ws], dtype=float)}
+        with open(filename, "wb") as f:
+            numpy.savez(f, **sections)
+
+
+class _SelectedCells(object):
+    """
+    Cells selection returning cells already selected.
+    """
+    def __init__(self, cells_selection, cells_pts):
+        self.cells_selection = cells_selection
+        self.cells_pts = cells_pts
+
+    def parameters(self):
+        return self.cells_selection.parameters()
+
+    def __call__(self, list_img, data):
+        return self.cells_pts
+
+
+def _cellLoops(c, pts, data, images_data):
+    """
+    :returns: the lists of points describing the cell `c` selected with points `pts`: the selection, and the shape
+        of the cell and of its daughters on the images
+    :returntype: list of list of int
+    """
+    loops = [list(pts)]
+    for img_data in images_data:
+        try:
+            loops.append(data.cellAtTime(c, img_data.index))
+        except ValueError:
+            loops.append([])
+    cells = data.cells
+    loops.extend(list(cells[d]) for d in data.daughterCells(c))
+    return loops
+
+
+def _fingerprint(prefix, c, loops, data, images_data):
+    """
+    :returns: the fingerprint of the unit of the cell `c`, whose geometry is described by `loops`
+    :returntype: str
+    """
+    h = prefix.copy()
+    cells_lifespan = data.cells_lifespan
+    lifespans = []
+    for cid in [c] + data.daughterCells(c):
+        ls = cells_lifespan[cid]
+        lifespans.append((cid, ls[0], ls[1], ls[2], ls.daughters, ls.division))
+    h.update(repr((c, lifespans, loops)).encode("ascii"))
+    for img_data in images_data:
+        walls = img_data.walls
+        for loop in loops:
+            present = [pid for pid in loop if pid in img_data]
+            coords = [(img_data[pid].x(), img_data[pid].y()) for pid in present]
+            h.update(numpy.array(coords, dtype=float).tobytes())
+            prev = present[-1] if present else None
+            for pid in present:
+                h.update(walls.coordinates(prev, pid).tobytes())
+                prev = pid
+    return h.hexdigest()
+
+
+def _loopWalls(loops, img_data, next_img_data):
+    """
+    :returns: the walls between consecutive points of the loops, on any of the two images
+    :returntype: set of (int,int)
+    """
+    walls = set()
+    for loop in loops:
+        for present in ([pid for pid in loop if pid in img_data and pid in next_img_data],
+                        [pid for pid in loop if pid in img_data],
+                        [pid for pid in loop if pid in next_img_data]):
+            prev = present[-1] if present else None
+            for pid in present:
+                if pid != prev:
+                    walls.add(wall(prev, pid))
+                prev = pid
+    return walls
+
+
+def computeGrowth(method, list_img, data, cells_selection, thread, filename, result=None):
+    """
+    Compute the growth with `method`, reusing the units computed for the previous result saved in `filename`.
+
+    The thread is used as by the method itself. Once the computation is complete, the cache of `filename` is
+    replaced by the units of this computation. The images are added to `result` if given, otherwise to a new
+    result.
+
+    :returns: the result, or None if the computation was stopped
+    :returntype: `Result`
+    """
+    cache_filename = cacheFile(filename)
+    cache = GrowthCache()
+    cache.load(cache_filename)
+    new_cache = GrowthCache()
+    prefix = hashlib.sha1(repr((method.parameters(), cells_selection.parameters())).encode("utf-8"))
+    if result is None:
+        result = Result(data, list_img)
+    method.thread = thread
+    used_images = method.usedImages(list_img)
+    nb_computed = 0
+    for i in range(len(used_images)):
+        img_name = used_images[i]
+        used_imgs = method.computeFromImages(list_img, i)
+        result.useImages(used_imgs)
+        cells_pts = cells_selection(used_imgs, data)
+        if cells_pts:
+            images_data = [data[img] for img in used_imgs]
+            img_data, next_img_data = images_data
+            img_prefix = prefix.copy()
+            img_prefix.update(repr((img_name, list(used_imgs), img_data.time, next_img_data.time)).encode("utf-8"))
+            units = {}
+            loops = {}
+            dirty = {}
+            for c, pts in cells_pts.items():
+                loops[c] = _cellLoops(c, pts, data, images_data)
+                fingerprint = _fingerprint(img_prefix, c, loops[c], data, images_data)
+                unit = cache.get(img_name, c, fingerprint)
+                if unit is None:
+                    dirty[c] = pts
+                    unit = _Unit(fingerprint)
+                units[c] = unit
+            if dirty:
+                nb_computed += len(dirty)
+                partial = Result(data, list_img)
+                partial.geometry = result.geometryCache(data)
+                method.computeImage(list_img, data, _SelectedCells(cells_selection, dirty), i, partial)
+                if partial.images:
+                    cells = partial.cells[0]
+                    cells_area = partial.cells_area[0]
+                    cells_shapes = partial.cells_shapes[0]
+                    walls = partial.walls[0]
+                    for c in dirty:
+                        unit = units[c]
+                        if c in cells:
+                            unit.growth = tuple(cells[c])
+                            unit.area = cells_area[c]
+                            unit.shape = cells_shapes[c]
+                        unit.walls = dict((w, walls[w]) for w in _loopWalls(loops[c], img_data, next_img_data)
+                                          if w in walls)
+            n = result.addImage(img_name)
+            cells = result.cells[n]
+            cells_area = result.cells_area[n]
+            cells_shapes = result.cells_shapes[n]
+            walls = result.walls[n]
+            for c in sorted(units):
+                unit = units[c]
+                new_cache.units[img_name, c] = unit
+                if unit.growth is not None:
+                    cells[c] = unit.growth
+                    cells_area[c] = unit.area
+                    cells_shapes[c] = unit.shape
+                for w, k in unit.walls.items():
+                    walls.setdefault(w, k)
+        if thread.stopped():
+            return
+        thread.nextImage()
+    log_debug("Incremental growth: %d units computed out of %d", nb_computed, len(new_cache.units))
+    new_cache.save(cache_filename)
+    return result
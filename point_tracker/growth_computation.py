@@ -13,9 +13,12 @@ from .timemodel import TimedImageModel
 from . import image_cache
 from .path import path
 from . import growth_computation_methods
+from . import growth_parallel
+from . import growth_cache
 from .sys_utils import retryException, showException
 from .tracking_data import TrackingDataException, RetryTrackingDataException
 from .sys_utils import cleanQObject
+from .debug import timer
 
 class GrowthComputationDlg(QDialog):
     def __init__(self, data, parent=None):
@@ -61,6 +64,9 @@ class GrowthComputationDlg(QDialog):
         self.ui.method.setCurrentIndex(0)
         self.resample = 100
         self.ui.resample.setChecked(True)
+        from .parameters import instance
+        self.ui.processes.setValue(instance.growth_processes)
+        self.ui.incremental.setChecked(instance.growth_incremental)
 
     def __del__(self):
         cleanQObject(self)
@@ -300,8 +306,12 @@ class GrowthComputationDlg(QDialog):
             cells_selection = growth_computation_methods.FullCellsOnlySelection(use_daughters)
         else:
             raise "Cells selection method '%s' is not implemented" % self.cells_selection
+        from .parameters import instance
+        instance.growth_processes = self.ui.processes.value()
+        instance.growth_incremental = self.ui.incremental.isChecked()
+        instance.save()
         thread = GrowthComputationThread(self)
-        thread.data = self.data
+        thread.data = self.data.snapshot()
         thread.list_img = model.names
         thread.method = method
         thread.cells_selection = cells_selection
@@ -402,10 +412,26 @@ class GrowthComputationThread(QThread):
         if not self.valid():
             self.abort()
             return
-        method = self.method
-        method.thread = self
-        result = method(self.list_img, self.data, self.cells_selection)
+        from .parameters import instance
+        # The images are written as soon as they are computed
+        streaming = growth_computation_methods.StreamingResult(self.data, self.list_img, self.filename,
+                                                               self.method.parameters(),
+                                                               self.cells_selection.parameters())
+        try:
+            with timer("growth.run"):
+                # The incremental computation runs in this process: the number of processes is not used
+                if instance.growth_incremental:
+                    result = growth_cache.computeGrowth(self.method, self.list_img, self.data, self.cells_selection,
+                                                        self, self.filename, streaming)
+                else:
+                    result = growth_parallel.computeGrowth(self.method, self.list_img, self.data,
+                                                           self.cells_selection, self, instance.growth_processes,
+                                                           streaming)
+        except:
+            streaming.discard()
+            raise
         if result is None:
+            streaming.discard()
             self.abort()
             return
         self.save(result)
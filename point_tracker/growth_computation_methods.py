@@ -6,22 +6,26 @@ This module defines the computation and selection methods for the growth computa
 __author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
 __docformat__ = "restructuredtext"
 
-from .growth_algo import growthParams
-from .geometry import polygonArea, dist
+from .growth_algo import growthParams, growthParamsBatch
+from .geometry import (polygonsSignedArea, polylineArcLength, polylineLength, polylinePoints)
 from math import log, ceil, pi
 import csv
-from .tracking_data import TrackingData, RetryTrackingDataException
+import locale
+from itertools import islice
+import shutil
+import tempfile
+from .tracking_data import TrackingData, TrackingDataException, RetryTrackingDataException
+from . import tracking_binary
 import re
 from .path import path
 import sys
-if sys.version_info.major < 3:
-    from cStringIO import StringIO
-else:
-    from io import StringIO
-from numpy import isnan, isinf, sqrt, array
-from .debug import log_debug
+import weakref
+from numpy import (isfinite, isnan, isinf, array, arange, bincount, concatenate, cumsum, errstate, maximum, minimum,
+                   repeat, searchsorted, unique)
+from numpy import log as log_array
+from .debug import log_debug, lazy, timed
+from .growth_geometry import PackedData, GeometryCache, PackedWalls, uniqueWalls
 from .project import Project
-from PyQt4.QtCore import QPointF
 
 
 class GrowthResultException(Exception):
@@ -53,6 +57,10 @@ class Result(object):
             of points identifiers with the first number lower than the second.
         data : `TrackingData`
             Data used to calculate growth
+        geometry : `growth_geometry.GeometryCache`
+            Geometry of the data, shared by the computation of the result and its writer
+        data_file : `path`
+            Binary file of the data named in the header of the loaded file, or None if the data are in the file
     """
     def __init__(self, data, images_used=[]):
         self.clear()
@@ -69,10 +77,22 @@ class Result(object):
         self.method_params = []
         self.cells_selection_params = []
         self.data = None
+        self.data_file = None
+        self.geometry = None
 
-    CURRENT_VERSION = "0.5"
+    CURRENT_VERSION = "0.6"
     """
     Current version number for the results.
+
+    Since version 0.6, the data are saved in a separate binary file and the X and Y columns hold the centroid of the
+    cells. Before, they held three times the centroid. The area growth of the dense methods is also measured on the
+    contour of the cell: before, parts of the walls were counted twice when the cell had points missing on the
+    reference image.
+    """
+
+    data_file_versions = ("0.6",)
+    """
+    Versions saving the data in a separate binary file, named in the header, instead of at the end of the file
     """
 
     def addImage(self, image_name):
@@ -83,9 +103,35 @@ class Result(object):
         self.cells_shapes.append({})
         return len(self.images) - 1
 
+    def extend(self, other):
+        """
+        Append the images of another result, computed with the same method on the same data.
+        """
+        self.images.extend(other.images)
+        self.cells.extend(other.cells)
+        self.walls.extend(other.walls)
+        self.cells_area.extend(other.cells_area)
+        self.cells_shapes.extend(other.cells_shapes)
+
     def __len__(self):
         return len(self.images)
 
+    def geometryCache(self, data):
+        """
+        :returns: the geometry of `data`, created the first time it is needed
+        :returntype: `growth_geometry.GeometryCache`
+        """
+        if self.geometry is None or self.geometry.data is not data:
+            self.geometry = GeometryCache(data)
+        return self.geometry
+
+    def useImages(self, images):
+        """
+        Called before computing the growth of an image from `images`. The result keeps the geometry of all the
+        images, as they are written when it is saved.
+        """
+        pass
+
     def set_data(self, row):
         if hasattr(self, "current_filename"):
             filename = path(self.current_filename).abspath()
@@ -95,6 +141,7 @@ class Result(object):
             p = filename
         else:
             p = filename.dirname()
+        result_dir = p
         # Now, find the first directory that's a valid project
         proj = Project(p)
         while not proj.valid:
@@ -102,14 +149,22 @@ class Result(object):
                 raise GrowthResultException("Cannot find a valid project directory.")
             p = p.parent
             proj = Project(p)
-        data = TrackingData(p)
-        if len(row) > 1:
-            data.data_file = p
-            try:
-                data.load()
-            except Exception as ex:
-                raise GrowthResultException("Error while loading data file: %s" % str(ex), previous=ex)
-        self.data = data
+        self.data = TrackingData(p)
+        if len(row) > 1 and row[1]:
+            self.data_file = result_dir / row[1]
+        else:
+            self.data_file = None
+
+    def loadDataFile(self, **opts):
+        """
+        Load the data from the binary file named in the header.
+        """
+        if self.data_file is None:
+            raise GrowthResultException("Invalid file format: the header doesn't name the data file")
+        try:
+            self.data.load(self.data_file, **opts)
+        except Exception as ex:
+            raise GrowthResultException("Error while loading data file: %s" % str(ex), previous=ex)
 
     def get_data(self):
         return []  # Put the data at the end of the file
@@ -167,73 +222,17 @@ class Result(object):
                   "theta": 2,
                   "phi"  : 3}
 
+    @timed("Result.save")
     def save(self, filename):
-        growth_num = Result.growth_num
-        fdata = StringIO()
-        invert_pts, invert_cells = self.data.save(f=fdata)
-        f = open(filename, 'w')
-        w = csv.writer(f, delimiter=',')
-        w.writerow(["TRKR_VERSION", Result.CURRENT_VERSION])
-        w.writerow(["Growth computation parameters"])
-        hf = self.header_fields
-        for h in self.header_order:
-            w.writerow([h] + hf[h][0](self))
-        w.writerow([])
-        w.writerow(["Growth per image"])
-        w.writerow(Result.fields)
-        wall_shift = self.fields_num["wall"]-1
-        for img_id in range(len(self.images)):
-            img = self.images[img_id]
-            w.writerow([img])
-            cells = self.cells[img_id]
-            cells_area = self.cells_area[img_id]
-            walls = self.walls[img_id]
-            data = self.data[img]
-            cells_shape = data.cells
-            rows = []
-            for c in sorted(cells.keys()):
-                # Get the center of mass of the cell
-                cell = [data[p] for p in cells_shape[c] if p in data]
-                center = QPointF(0, 0)
-                area = 0.0
-                u1 = cell[-1]
-                for i in range(len(cell)):
-                    u2 = cell[i]
-                    loc_area = u1.x() * u2.y() - u1.y() * u2.x()
-                    center += (u1 + u2)*loc_area
-                    area += loc_area
-                    u1 = u2
-                center /= area
-                row = ["", "Cell %d" % invert_cells[c], cells_area[c], cells[c][growth_num["kmax"]],
-                       cells[c][growth_num["kmin"]], cells[c][growth_num["theta"]] * 180 / pi,
-                       cells[c][growth_num["phi"]], center.x(), center.y()]
-                rows.append(row)
-            lr = len(rows)
-            for i, ws in enumerate(sorted(walls.keys())):
-                wll = ["", "Wall %d-%d" % (invert_pts[ws[0]], invert_pts[ws[1]]), walls[ws]]
-                if i >= lr:
-                    rows.append([""] * wall_shift)
-                rows[i] += wll
-            w.writerows(rows)
-        w.writerow(["Actual cell shapes"])
-        w.writerow(["Image", "Cell", "Begin/End", "Shape [x y]"])
-        for img_id in range(len(self.images)):
-            img = self.images[img_id]
-            w.writerow([img])
-            cells_shapes = self.cells_shapes[img_id]
-            rows = []
-            for c in sorted(cells_shapes.keys()):
-                sh = cells_shapes[c]
-                row1 = ["", "Cell %d" % invert_cells[c], "Begin"] + list(sh[0].flatten())
-                row2 = ["", "Cell %d" % invert_cells[c], "End"] + list(sh[1].flatten())
-                rows.append(row1)
-                rows.append(row2)
-            w.writerows(rows)
-        w.writerow([])
-        w.writerow(["Data"])
-        f.write(fdata.getvalue())
-        f.close()
-        fdata.close()
+        writer = ResultWriter(filename, self)
+        try:
+            for img_id in range(len(self.images)):
+                writer.writeImage(self.images[img_id], self.cells[img_id], self.cells_area[img_id],
+                                  self.walls[img_id], self.cells_shapes[img_id])
+        except:
+            writer.discard()
+            raise
+        writer.close()
 
     def load_version01(self, filename, **opts):
         fields_num = Result.fields_num
@@ -270,7 +269,7 @@ class Result(object):
                     p1, p2 = (int(i) for i in split_wall_re.split(l[fields_num["wall"]])[1:3])
                     k = float(l[fields_num["kwall"]])
                     walls[p1, p2] = k
-        l = next(r)
+        l = next(r, [])
         if len(l) == 1 and l[0] == "Data":
             self.data.load(f=f, **opts)
 
@@ -328,12 +327,12 @@ class Result(object):
                     p1, p2 = (int(i) for i in split_wall_re.split(l[fields_num["wall"]])[1:3])
                     k = float(l[fields_num["kwall"]])
                     walls[p1, p2] = k
-        l = next(r)
+        l = next(r, [])
         if len(l) == 1 and l[0] == "Data":
             if "no_data" not in opts or not opts["no_data"]:
                 self.data.load(f=f, **opts)
 
-    def load_version_(self, filename, expected_version, nb_growth_fields, **opts):
+    def load_version_(self, filename, expected_version, nb_growth_fields, embedded_data=True, **opts):
         fields_num = Result.fields_num
         f = open(filename, "r")
         l1 = f.readline()
@@ -359,7 +358,6 @@ class Result(object):
                 header_fields[l[0]][1](self, l)
         next(r)  # "Growth per image"
         next(r)  # header ...
-        split_wall_re = re.compile('[ -]')
         found_cell_shapes = False
         for l in r:
             if len(l) == 0:
@@ -373,62 +371,93 @@ class Result(object):
                 cells_area = self.cells_area[img]
                 walls = self.walls[img]
             else:
-                if l[1]:  # There is a cell
-                    cid = int(l[fields_num["cell"]].split(' ')[1])
-                    cells_area[cid] = float(l[fields_num["karea"]])
-                    cells[cid] = (float(l[fields_num["kmaj"]]), float(l[fields_num["kmin"]]),
-                                  float(l[fields_num["theta"]]) * pi / 180, float(l[fields_num["phi"]]))
-                if len(l) > nb_growth_fields:  # The is a wall
-                    p1, p2 = (int(i) for i in split_wall_re.split(l[fields_num["wall"]])[1:3])
-                    k = float(l[fields_num["kwall"]])
-                    walls[p1, p2] = k
+                self.readGrowthRow(l, nb_growth_fields, cells, cells_area, walls)
         if found_cell_shapes:
             next(r)  # Skip header description
+            images = dict((img, i) for i, img in enumerate(self.images))
             for l in r:
                 if len(l) == 0:
                     break
                 elif len(l) == 1:
-                    img = self.addImage(l[fields_num["image"]])
+                    img_name = l[fields_num["image"]]
+                    if img_name in images:
+                        img = images[img_name]
+                    else:
+                        img = self.addImage(img_name)
                     cells_shapes = self.cells_shapes[img]
                 else:
-                    if l[1][:5] == "Cell ":
-                        cell_id = int(l[1][5:])
-                        begin = l[2] == "Begin"
-                        shape = array([float(fl) for fl in l[3:]])
-                        assert shape.shape[0] % 2 == 0, "A cell shape needs an even number of values (x,y)"
-                        shape.shape = (shape.shape[0] / 2, 2)
-                        if cell_id in cells_shapes:
-                            if begin:
-                                cells_shapes[cell_id] = (shape, cells_shapes[cell_id][1])
-                            else:
-                                cells_shapes[cell_id] = (cells_shapes[cell_id][0], shape)
-                        else:
-                            if begin:
-                                cells_shapes[cell_id] = (shape, [])
-                            else:
-                                cells_shapes[cell_id] = ([], shape)
-        l = next(r)
+                    self.readShapeRow(l, cells_shapes)
+        if not embedded_data:
+            if "no_data" not in opts or not opts["no_data"]:
+                self.loadDataFile(**opts)
+            return
+        l = next(r, [])
         if len(l) == 1 and l[0] == "Data":
             if "no_data" not in opts or not opts["no_data"]:
                 self.data.load(f=f, **opts)
 
+    _split_wall_re = re.compile('[ -]')
+
+    @staticmethod
+    def readGrowthRow(l, nb_growth_fields, cells, cells_area, walls):
+        """
+        Read a row of the growth of an image, with the cell and wall it describes.
+        """
+        fields_num = Result.fields_num
+        if l[1]:  # There is a cell
+            cid = int(l[fields_num["cell"]].split(' ')[1])
+            cells_area[cid] = float(l[fields_num["karea"]])
+            cells[cid] = (float(l[fields_num["kmaj"]]), float(l[fields_num["kmin"]]),
+                          float(l[fields_num["theta"]]) * pi / 180, float(l[fields_num["phi"]]))
+        if len(l) > nb_growth_fields:  # The is a wall
+            p1, p2 = (int(i) for i in Result._split_wall_re.split(l[fields_num["wall"]])[1:3])
+            k = float(l[fields_num["kwall"]])
+            walls[p1, p2] = k
+
+    @staticmethod
+    def readShapeRow(l, cells_shapes):
+        """
+        Read a row of the cell shapes of an image.
+        """
+        if l[1][:5] == "Cell ":
+            cell_id = int(l[1][5:])
+            begin = l[2] == "Begin"
+            shape = array([float(fl) for fl in l[3:]])
+            assert shape.shape[0] % 2 == 0, "A cell shape needs an even number of values (x,y)"
+            shape.shape = (shape.shape[0] // 2, 2)
+            if cell_id in cells_shapes:
+                if begin:
+                    cells_shapes[cell_id] = (shape, cells_shapes[cell_id][1])
+                else:
+                    cells_shapes[cell_id] = (cells_shapes[cell_id][0], shape)
+            else:
+                if begin:
+                    cells_shapes[cell_id] = (shape, [])
+                else:
+                    cells_shapes[cell_id] = ([], shape)
+
     def load_version04(self, filename, **opts):
         return self.load_version_(filename, "0.4", 7, **opts)
 
     def load_version05(self, filename, **opts):
         return self.load_version_(filename, "0.5", 9, **opts)
 
+    def load_version06(self, filename, **opts):
+        return self.load_version_(filename, "0.6", 9, embedded_data=False, **opts)
+
     versions_loader = {
         "0.1": load_version01,
         "0.2": load_version02,
         "0.3": load_version03,
         "0.4": load_version04,
-        "0.5": load_version05
+        "0.5": load_version05,
+        "0.6": load_version06
     }
     """
     Which function load which version of the result
     """
 
+    @timed("Result.load")
     def load(self, filename, **opts):
         self.current_filename = filename
         version = None
@@ -452,12 +481,498 @@ class Result(object):
         Result.versions_loader[version](self, filename, **opts)
 
 
+
+def resultDataFile(filename):
+    """
+    :returns: the name of the binary file holding the data of the result file `filename`
+    :returntype: `path`
+    """
+    filename = path(filename)
+    return filename.stripext() + "-data" + tracking_binary.EXTENSION
+
+
+class ResultWriter(object):
+    """
+    Write a result file image by image.
+
+    The growth of each image is written as soon as it is given, while the shapes of its cells are spooled in a
+    temporary file, as they come after the growth of all the images. The data are not copied in the result file but
+    saved in the binary format, in the file given by `resultDataFile`, which the header references. The file is
+    written under a temporary name, and only replaces `filename` when it is closed.
+
+    :IVariables:
+        filename : `path`
+            Name of the result file
+        data_file : `path`
+            Name of the binary file of the data
+        data : `TrackingData`
+            Data used to calculate growth
+        invert_pts : dict of int*int
+            Ids of the points in the file
+        invert_cells : dict of int*int
+            Ids of the cells in the file
+    """
+    def __init__(self, filename, result):
+        """
+        Write the header of the file for `result`.
+        """
+        self.filename = path(filename)
+        self.data = result.data
+        self.geometry = result.geometryCache(self.data)
+        self.data_file = resultDataFile(self.filename)
+        self.invert_pts, self.invert_cells = self.data.fileIds(binary=True)
+        self._part = path(self.filename + ".part")
+        self._f = open(self._part, 'w')
+        if sys.version_info.major < 3:
+            self._shapes = tempfile.TemporaryFile(mode="w+b")
+        else:
+            self._shapes = tempfile.TemporaryFile(mode="w+", newline="")
+        self._w = csv.writer(self._f, delimiter=',')
+        self._ws = csv.writer(self._shapes, delimiter=',')
+        w = self._w
+        w.writerow(["TRKR_VERSION", Result.CURRENT_VERSION])
+        w.writerow(["Growth computation parameters"])
+        hf = Result.header_fields
+        for h in Result.header_order:
+            if h == "Data file":
+                w.writerow([h, self.data_file.basename()])
+            else:
+                w.writerow([h] + hf[h][0](result))
+        w.writerow([])
+        w.writerow(["Growth per image"])
+        w.writerow(Result.fields)
+
+    @timed("ResultWriter.writeImage")
+    def writeImage(self, img, cells, cells_area, walls, cells_shapes):
+        """
+        Write the growth of the image `img`, and spool the shapes of its cells.
+        """
+        growth_num = Result.growth_num
+        invert_pts = self.invert_pts
+        invert_cells = self.invert_cells
+        wall_shift = Result.fields_num["wall"]-1
+        w = self._w
+        w.writerow([img])
+        cids = sorted(cells.keys())
+        centers = self.geometry.centroids(cids, self.data[img].index)
+        rows = []
+        for c, (x, y) in zip(cids, centers):
+            row = ["", "Cell %d" % invert_cells[c], cells_area[c], cells[c][growth_num["kmax"]],
+                   cells[c][growth_num["kmin"]], cells[c][growth_num["theta"]] * 180 / pi,
+                   cells[c][growth_num["phi"]], x, y]
+            rows.append(row)
+        lr = len(rows)
+        for i, ws in enumerate(sorted(walls.keys())):
+            wll = ["", "Wall %d-%d" % (invert_pts[ws[0]], invert_pts[ws[1]]), walls[ws]]
+            if i >= lr:
+                rows.append([""] * wall_shift)
+            rows[i] += wll
+        w.writerows(rows)
+        rows = [[img]]
+        for c in sorted(cells_shapes.keys()):
+            sh = cells_shapes[c]
+            rows.append(["", "Cell %d" % invert_cells[c], "Begin"] + list(sh[0].flatten()))
+            rows.append(["", "Cell %d" % invert_cells[c], "End"] + list(sh[1].flatten()))
+        self._ws.writerows(rows)
+
+    @timed("ResultWriter.close")
+    def close(self):
+        """
+        Write the shapes of the cells and the data, and replace the result file.
+        """
+        f = self._f
+        w = self._w
+        w.writerow(["Actual cell shapes"])
+        w.writerow(["Image", "Cell", "Begin/End", "Shape [x y]"])
+        self._shapes.seek(0)
+        shutil.copyfileobj(self._shapes, f)
+        self._shapes.close()
+        w.writerow([])
+        f.close()
+        tracking_binary.save(self.data, self.data_file)
+        if self.filename.exists():
+            self.filename.remove()
+        self._part.rename(self.filename)
+
+    def discard(self):
+        """
+        Close the file without replacing the result file.
+        """
+        self._shapes.close()
+        self._f.close()
+        self._part.remove()
+
+
+class StreamingResult(Result):
+    """
+    Result written to a file while it is computed.
+
+    When an image is added, the images added before are complete: they are written and released, so only the
+    images being computed are kept in memory. The lists of the result only contain these images. The geometry is
+    then only kept for the images given to `useImages`, as the next image is computed from them.
+
+    :IVariables:
+        writer : `ResultWriter`
+            Writer of the result file
+        images_written : list of str
+            name of the images already written
+    """
+    def __init__(self, data, images_used, filename, method_params, cells_selection_params):
+        Result.__init__(self, data, images_used)
+        self.method_params = method_params
+        self.cells_selection_params = cells_selection_params
+        self.images_written = []
+        self.writer = ResultWriter(filename, self)
+        self._frames = ()
+
+    def flush(self):
+        """
+        Write and release the images held.
+        """
+        writer = self.writer
+        for img_id in range(len(self.images)):
+            writer.writeImage(self.images[img_id], self.cells[img_id], self.cells_area[img_id],
+                              self.walls[img_id], self.cells_shapes[img_id])
+        self.images_written.extend(self.images)
+        del self.images[:]
+        del self.cells[:]
+        del self.walls[:]
+        del self.cells_area[:]
+        del self.cells_shapes[:]
+        if self.geometry is not None:
+            self.geometry.keepFrames(self._frames)
+
+    def useImages(self, images):
+        self._frames = [self.data[img].index for img in images]
+
+    def addImage(self, image_name):
+        self.flush()
+        return Result.addImage(self, image_name)
+
+    def extend(self, other):
+        self.flush()
+        Result.extend(self, other)
+
+    def __len__(self):
+        return len(self.images_written) + len(self.images)
+
+    def save(self, filename=None):
+        """
+        Write the images held and close the file. The result is always saved in the file given at construction.
+        """
+        try:
+            self.flush()
+        except:
+            self.writer.discard()
+            raise
+        self.writer.close()
+
+    def discard(self):
+        """
+        Abandon the result: the result file is left untouched.
+        """
+        self.writer.discard()
+
+
+
+class ResultIndex(object):
+    """
+    Position of the sections of a result file, found without parsing their rows.
+
+    Each section is given as the offset of its first row in the file and its number of rows.
+
+    :IVariables:
+        filename : `path`
+            Name of the result file
+        version : str
+            Version of the file
+        delimiter : str
+            Delimiter of the fields
+        header : (int,int)
+            Rows of the growth computation parameters
+        images : list of str
+            Name of the images in the file
+        growth : list of (int,int)
+            Rows of the growth of each image
+        has_cells : list of bool
+            For each image, True if the growth of some cells is given
+        has_walls : list of bool
+            For each image, True if the growth of some walls is given
+        shapes : dict of str*(int,int)
+            Rows of the cell shapes of each image
+        data : int
+            Offset of the data, or None if the file doesn't contain the data
+    """
+    def __init__(self, filename):
+        self.filename = path(filename)
+        self.images = []
+        self.growth = []
+        self.has_cells = []
+        self.has_walls = []
+        self.shapes = {}
+        self.data = None
+        with open(self.filename, "rb") as f:
+            first_line = f.readline()
+            if b'\t' in first_line:
+                delim = '\t'
+            elif b',' in first_line:
+                delim = ','
+            else:
+                raise GrowthResultException("Invalid file format, delimiter needs to be '\\t' or ','")
+            fields = first_line.strip().split(delim.encode("ascii"))
+            if fields[0] != b"TRKR_VERSION" or len(fields) < 2:
+                raise GrowthResultException("Invalid file format")
+            self.version = self._decode(fields[1].strip())
+            self.delimiter = delim
+            pos = len(first_line)
+            line = f.readline()  # "Growth computation parameters"
+            pos += len(line)
+            header = [pos, 0]
+            for line in iter(f.readline, b""):
+                pos += len(line)
+                if not line.strip():
+                    break
+                header[1] += 1
+            self.header = tuple(header)
+            for _ in range(2):  # "Growth per image" and the header of the fields
+                pos += len(f.readline())
+            self._scan(f, pos)
+
+    def _decode(self, field):
+        if sys.version_info.major < 3:
+            return field
+        return field.decode(locale.getpreferredencoding(False))
+
+    def _scan(self, f, pos):
+        d = self.delimiter.encode("ascii")
+        images = self.images
+        growth = self.growth
+        has_cells = self.has_cells
+        has_walls = self.has_walls
+        shapes = self.shapes
+        rows = None
+        in_shapes = False
+        skip = False
+        for line in f:
+            pos += len(line)
+            if line[:1] == d:
+                rows[1] += 1
+                if not in_shapes:
+                    if not has_cells[-1] and line[1:5] == b"Cell":
+                        has_cells[-1] = True
+                    if not has_walls[-1] and b"Wall " in line:
+                        has_walls[-1] = True
+                continue
+            if skip:  # Header of the cell shapes
+                skip = False
+                continue
+            line = line.rstrip(b"\r\n")
+            if not line:
+                break
+            name = next(csv.reader([self._decode(line)], delimiter=self.delimiter))[0]
+            if not in_shapes and name == "Actual cell shapes":
+                in_shapes = True
+                skip = True
+                continue
+            rows = [pos, 0]
+            if in_shapes:
+                shapes[name] = rows
+            else:
+                images.append(name)
+                growth.append(rows)
+                has_cells.append(False)
+                has_walls.append(False)
+        for line in f:
+            pos += len(line)
+            if line.strip() == b"Data":
+                self.data = pos
+                break
+
+    def __len__(self):
+        return len(self.images)
+
+
+class _LazyImages(object):
+    """
+    Sequence of the values of one field of a `LazyResult`, for each image.
+    """
+    def __init__(self, result, field):
+        self.result = result
+        self.field = field
+
+    def __len__(self):
+        return len(self.result.images)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return getattr(self.result.image(i), self.field)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class _ResultImage(object):
+    """
+    Growth of the cells and walls of one image of a result.
+    """
+    __slots__ = ("cells", "cells_area", "walls", "cells_shapes")
+
+    def __init__(self):
+        self.cells = {}
+        self.cells_area = {}
+        self.walls = {}
+        self.cells_shapes = {}
+
+
+class LazyResult(Result):
+    """
+    Result reading the images of its file only when they are accessed.
+
+    Opening the file only reads the growth computation parameters and the data, using a `ResultIndex` to skip the
+    rows of the images. The ``cells``, ``cells_area``, ``walls`` and ``cells_shapes`` lists are replaced by
+    sequences reading the image requested and keeping it in memory. Files in a version that cannot be indexed are
+    loaded fully.
+
+    :IVariables:
+        index : `ResultIndex`
+            Index of the file, or None if it was fully loaded
+    """
+    lazy_versions = {"0.4": 7, "0.5": 9, "0.6": 9}
+    """
+    Versions read lazily, with their number of fields describing the growth of a cell
+    """
+
+    def clear(self):
+        Result.clear(self)
+        self.index = None
+        self._images = {}
+
+    @timed("LazyResult.load")
+    def load(self, filename, **opts):
+        index = ResultIndex(filename)
+        if index.version not in self.lazy_versions:
+            return Result.load(self, filename, **opts)
+        self.clear()
+        self.current_filename = filename
+        self.index = index
+        with open(filename, "r") as f:
+            f.seek(index.header[0])
+            header_fields = self.header_fields
+            for l in csv.reader(islice(f, index.header[1]), delimiter=index.delimiter):
+                if l and l[0] in header_fields:
+                    header_fields[l[0]][1](self, l)
+            self.images = list(index.images)
+            self.cells = _LazyImages(self, "cells")
+            self.cells_area = _LazyImages(self, "cells_area")
+            self.walls = _LazyImages(self, "walls")
+            self.cells_shapes = _LazyImages(self, "cells_shapes")
+            if not opts.get("no_data"):
+                if index.version in self.data_file_versions:
+                    self.loadDataFile(**opts)
+                elif index.data is not None:
+                    f.seek(index.data)
+                    self.data.load(f=f, **opts)
+
+    @timed("LazyResult.image")
+    def image(self, i):
+        """
+        :returns: the growth of the i-th image, reading it from the file the first time
+        :returntype: `_ResultImage`
+        """
+        img = self._images.get(i)
+        if img is None:
+            img = self._images[i] = self._readImage(i)
+        return img
+
+    def _readImage(self, i):
+        index = self.index
+        img = _ResultImage()
+        nb_growth_fields = self.lazy_versions[index.version]
+        with open(index.filename, "r") as f:
+            start, nb_rows = index.growth[i]
+            f.seek(start)
+            for l in csv.reader(islice(f, nb_rows), delimiter=index.delimiter):
+                self.readGrowthRow(l, nb_growth_fields, img.cells, img.cells_area, img.walls)
+            shapes = index.shapes.get(index.images[i])
+            if shapes is not None:
+                f.seek(shapes[0])
+                for l in csv.reader(islice(f, shapes[1]), delimiter=index.delimiter):
+                    self.readShapeRow(l, img.cells_shapes)
+        return img
+
+    def hasCells(self, i):
+        """
+        :returns: True if the growth of some cells is given for the i-th image
+        :returntype: bool
+        """
+        if self.index is None:
+            return bool(self.cells[i])
+        return self.index.has_cells[i]
+
+    def hasWalls(self, i):
+        """
+        :returns: True if the growth of some walls is given for the i-th image
+        :returntype: bool
+        """
+        if self.index is None:
+            return bool(self.walls[i])
+        return self.index.has_walls[i]
+
+
 def wall(p1, p2):
     if p1 < p2:
         return (p1, p2)
     return (p2, p1)
 
 
+def wallsGrowth(l1, l2, dt, logarithmic=False):
+    """
+    Growth rate of walls whose length goes from `l1` to `l2` in `dt`.
+
+    :Parameters:
+        logarithmic : bool
+            If True, the rate is ``log(l2/l1)/dt``, otherwise it is ``(l2-l1)/(l1*dt)``
+
+    :returns: the growth rate of each wall, NaN or infinite if it cannot be computed
+    :returntype: ndarray of float
+    """
+    with errstate(divide="ignore", invalid="ignore"):
+        if logarithmic:
+            return log_array(l2 / l1) / dt
+        return (l2 - l1) / (l1 * dt)
+
+
+def timeInterval(img_data, next_img_data):
+    """
+    :returns: the time between two images
+    :returntype: float
+    :raise TrackingDataException: if the images have the same time, as no growth rate can be computed between them
+    """
+    dt = next_img_data.time - img_data.time
+    if dt == 0:
+        raise TrackingDataException("The images '%s' and '%s' have the same time, the growth between them cannot "
+                                    "be computed." % (img_data.image_name, next_img_data.image_name))
+    return dt
+
+
+def setWallsGrowth(wall_result, walls, rates):
+    """
+    Store the growth rates of the walls in `wall_result`, skipping the invalid ones.
+
+    :Parameters:
+        walls : ndarray(N,2) of int
+            Ids of the two points of each wall, the smallest first
+        rates : ndarray(N) of float
+            Growth rate of each wall
+    """
+    valid = isfinite(rates)
+    wall_result.update(zip([tuple(w) for w in walls[valid].tolist()], rates[valid].tolist()))
+
+
 def polygonToCoordinates(poly, img_data):
     return array([[img_data[p].x(), img_data[p].y()] for p in poly if p in img_data])
 
@@ -491,6 +1006,43 @@ class GrowthMethod(object):
             raise ValueError("The thread must have a stop property")
         self._thread = thread
 
+    def __getstate__(self):
+        # The thread and the geometry of the last run stay in the process running the method
+        state = dict(self.__dict__)
+        state['_thread'] = None
+        state.pop('geometry', None)
+        return state
+
+    def computeImage(self, list_img, data, cells_selection, i, result):
+        """
+        Compute the growth for the i-th image used, and add it to `result`.
+
+        Only the images returned by `computeFromImages` for `i` are read, so the images can be processed
+        independently.
+        """
+        raise NotImplementedError()
+
+    def __call__(self, list_img, data, cells_selection, result=None):
+        """
+        Compute the growth on all the images used.
+
+        If `result` is given, the images are added to it, otherwise a new `Result` is created.
+
+        :returns: the result, or None if the computation was stopped
+        :returntype: `Result`
+        """
+        if result is None:
+            result = Result(data, list_img)
+        thread = self.thread
+        used_images = self.usedImages(list_img)
+        for i in range(len(used_images)):
+            result.useImages(self.computeFromImages(list_img, i))
+            self.computeImage(list_img, data, cells_selection, i, result)
+            if thread.stopped():
+                return
+            thread.nextImage()
+        return result
+
 
 class ForwardMethod(GrowthMethod):
     def __init__(self):
@@ -511,73 +1063,73 @@ class ForwardMethod(GrowthMethod):
     def growthParams(self, ps, qs, dt):
         return growthParams(ps, qs, dt, at_start=True)
 
-    def __call__(self, list_img, data, cells_selection):
-        result = Result(data, list_img)
-        thread = self.thread
-        used_images = self.usedImages(list_img)
-        for i in range(len(used_images)):
-            img_name = used_images[i]
-            used_imgs = self.computeFromImages(list_img, i)
-            cells_pts = cells_selection(used_imgs, data)
-            # print "%d cells for images %s" % (len(cells_pts), used_imgs)
-            if cells_pts:
-                img_data = data[used_imgs[0]]
-                next_img_data = data[used_imgs[1]]
-                n = result.addImage(img_name)
-                cell_result = result.cells[n]
-                wall_result = result.walls[n]
-                cell_shapes = result.cells_shapes[n]
-                cell_area_result = result.cells_area[n]
-                walls = set()
-                for c in sorted(cells_pts.keys()):
-                    # print "Processing cell %d" % c
-                    pts = [pid for pid in cells_pts[c] if pid in img_data and pid in next_img_data]
-                    if not pts:
-                        continue
-                    lp = len(pts)
-                    if lp < 3:  # Cannot have growth of less than three points
-                        continue
-                    for i in range(lp):
-                        walls.add(wall(pts[i], pts[(i + 1) % lp]))
-                    ps = polygonToCoordinates(pts, img_data)
-                    qs = polygonToCoordinates(pts, next_img_data)
-                    dt = next_img_data.time - img_data.time
-                    gp = self.growthParams(ps, qs, dt)
-                    if gp is not None:
-                        a1 = polygonArea(cellToPointList(c, img_data))
-                        if c in next_img_data.cells:
-                            a2 = polygonArea(cellToPointList(c, next_img_data))
-                        else:
-                            ds = [c2 for c2 in data.daughterCells(c) if c2 in next_img_data.cells]
-                            a2 = 0
-                            for c2 in ds:
-                                a2 += polygonArea(cellToPointList(c2, next_img_data))
-                        if a2 / (a2 + a1) < 1e-15:
-                            continue
-                        r = log(a2 / a1) / dt
-                        if isnan(r) or isinf(r) or isnan(gp).any():
-                            # print "  Invalid growth:\n %s" % (gp,)
-                            continue
-                        cell_area_result[c] = r
-                        cell_result[c] = gp
-                        cell_shapes[c] = (ps, qs)
-                        # print "  Growth area: %g" % r
-                    # else:
-                        # print "  No growth parameter"
-                for p1, p2 in walls:
-                    if p1 in next_img_data and p2 in next_img_data:
-                        pos11 = img_data[p1]
-                        pos12 = img_data[p2]
-                        pos21 = next_img_data[p1]
-                        pos22 = next_img_data[p2]
-                        d1 = dist(pos11, pos12)
-                        d2 = dist(pos21, pos22)
-                        k = (d2 - d1) / (d1 * dt)
-                        wall_result[p1, p2] = k
-            if thread.stopped():
-                return
-            thread.nextImage()
-        return result
+    def growthParamsBatch(self, ps, qs, dt):
+        """
+        Growth parameters of all the cells of a pair of images, with NaN for the cells without parameters.
+        """
+        return growthParamsBatch(ps, qs, dt, at_start=True)
+
+    def computeImage(self, list_img, data, cells_selection, i, result):
+        img_name = self.usedImages(list_img)[i]
+        used_imgs = self.computeFromImages(list_img, i)
+        cells_pts = cells_selection(used_imgs, data)
+        # print "%d cells for images %s" % (len(cells_pts), used_imgs)
+        if cells_pts:
+            img_data = data[used_imgs[0]]
+            next_img_data = data[used_imgs[1]]
+            n = result.addImage(img_name)
+            cell_result = result.cells[n]
+            wall_result = result.walls[n]
+            cell_shapes = result.cells_shapes[n]
+            cell_area_result = result.cells_area[n]
+            geometry = result.geometryCache(data)
+            i1 = img_data.index
+            i2 = next_img_data.index
+            wall_starts = []
+            wall_ends = []
+            dt = timeInterval(img_data, next_img_data)
+            cells = []
+            all_ps = []
+            all_qs = []
+            for c in sorted(cells_pts.keys()):
+                pts = [pid for pid in cells_pts[c] if pid in img_data and pid in next_img_data]
+                if not pts:
+                    continue
+                lp = len(pts)
+                if lp < 3:  # Cannot have growth of less than three points
+                    continue
+                wall_starts.extend(pts)
+                wall_ends.extend(pts[1:] + pts[:1])
+                cells.append(c)
+                all_ps.append(geometry.points(pts, i1))
+                all_qs.append(geometry.points(pts, i2))
+            all_gp = self.growthParamsBatch(all_ps, all_qs, dt) if cells else []
+            next_cells = next_img_data.cells
+            # Cells, or their daughters, whose area is compared
+            grown = dict((c, [c] if c in next_cells else [c2 for c2 in data.daughterCells(c) if c2 in next_cells])
+                         for c in cells)
+            areas1 = dict(zip(cells, geometry.areas(cells, i1)))
+            next_cids = [c2 for c in cells for c2 in grown[c]]
+            areas2 = dict(zip(next_cids, geometry.areas(next_cids, i2)))
+            for c, ps, qs, gp in zip(cells, all_ps, all_qs, all_gp):
+                if isnan(gp).all():  # No growth parameter
+                    continue
+                a1 = areas1[c]
+                a2 = sum(areas2[c2] for c2 in grown[c])
+                if a2 / (a2 + a1) < 1e-15:
+                    continue
+                r = log(a2 / a1) / dt
+                if isnan(r) or isinf(r) or isnan(gp).any():
+                    continue
+                cell_area_result[c] = r
+                cell_result[c] = tuple(gp.tolist())
+                cell_shapes[c] = (ps, qs)
+            # The points of the walls are on both images
+            walls = array([wall_starts, wall_ends], dtype=int).T.reshape(-1, 2)
+            walls.sort(axis=1)
+            walls = walls[uniqueWalls(walls)]
+            setWallsGrowth(wall_result, walls,
+                           wallsGrowth(geometry.wallLengths(walls, i1), geometry.wallLengths(walls, i2), dt))
 
 
 class BackwardMethod(ForwardMethod):
@@ -590,6 +1142,9 @@ class BackwardMethod(ForwardMethod):
     def growthParams(self, ps, qs, dt):
         return growthParams(ps, qs, dt, at_start=False)
 
+    def growthParamsBatch(self, ps, qs, dt):
+        return growthParamsBatch(ps, qs, dt, at_start=False)
+
     def parameters(self):
         return ["Backward"]
 
@@ -599,11 +1154,14 @@ class StartMethod(ForwardMethod):
         return list_img[1:]
 
     def computeFromImages(self, list_img, i):
-        return (list_img[0], list_img[i])
+        return (list_img[0], list_img[i+1])
 
     def growthParams(self, ps, qs, dt):
         return growthParams(ps, qs, dt, at_start=False)
 
+    def growthParamsBatch(self, ps, qs, dt):
+        return growthParamsBatch(ps, qs, dt, at_start=False)
+
     def parameters(self):
         return ["Start"]
 
@@ -611,21 +1169,44 @@ class StartMethod(ForwardMethod):
 
 
 def length_polyline(w):
-    vects = [w[i + 1] - w[i] for i in range(len(w) - 1)]
-    return sum(sqrt(pos.x() * pos.x() + pos.y() * pos.y()) for pos in vects)
+    """
+    :returns: the length of the polyline `w`
+    :returntype: float
+    """
+    return polylineLength(w)
 
 
-def length_segment(s, data):
-    total_length = 0
-    lengths = [0]
+def wall_polyline(s, data):
+    """
+    Build the polyline going through the points `s`, following the shapes of the walls between them.
+
+    :returns: the coordinates of the polyline, and the index in the coordinates of each point of `s`
+    :returntype: (ndarray(N,2), ndarray(len(s)) of int)
+    """
+    walls = data.walls
+    parts = []
+    vertices = []
+    nb_coords = 0
     for p1, p2 in zip(s[:-1], s[1:]):
-        w = data.walls[p1, p2]
-        w.insert(0, data[p1])
-        w.append(data[p2])
-        l = length_polyline(w)
-        total_length += l
-        lengths.append(total_length)
-    return lengths
+        pos = data[p1]
+        w = walls.coordinates(p1, p2)
+        parts.append([[pos.x(), pos.y()]])
+        parts.append(w)
+        vertices.append(nb_coords)
+        nb_coords += 1 + len(w)
+    pos = data[s[-1]]
+    parts.append([[pos.x(), pos.y()]])
+    vertices.append(nb_coords)
+    return concatenate(parts), array(vertices, dtype=int)
+
+
+def length_segment(s, data):
+    """
+    :returns: the length of the polyline going through the points `s`, from the first point to each point
+    :returntype: ndarray of float
+    """
+    coords, vertices = wall_polyline(s, data)
+    return polylineArcLength(coords)[vertices]
 
 
 def align_segments(s1, s2, data1, data2):
@@ -633,91 +1214,53 @@ def align_segments(s1, s2, data1, data2):
     Compute the alignment of segments s1 and s2,
     such that the first and last elements of s1 and s2 are the same, but nothing else.
 
-    :return_type: list of (list of QPointF, int)
+    The segments are cut at the points of both segments, placed on the other segment by the ratio of the length to
+    the first point over the total length.
+
+    :return_type: list of (ndarray(N,2), int)
     :returns: List of wall parts such that the first point is the vertex.
               The integer is the id of the point (if it corresponds to one).
     """
-    # First, compute ratios
-    lengths_s1 = length_segment(s1, data1)
-    lengths_s2 = length_segment(s2, data2)
-    ratios_s1 = [l/lengths_s1[-1] for l in lengths_s1]
-    ratios_s2 = [l/lengths_s2[-1] for l in lengths_s2]
-    len_s1 = lengths_s1[-1]
-    len_s2 = lengths_s2[-1]
-    all_pos = list(set(ratios_s1+ratios_s2))
-    all_pos.sort()
-
-    def _align(length, s, ratios, data):
-        align = [None]*(len(all_pos)-1)
-        ratios = set(ratios)
-        p1, p2 = 0, 1  # Position in s1
-        pos = data[s[p1]]
-        cur = s[p1]
-        next = None
-        w = data.walls[s[p1], s[p2]]
-        for j, (r1, r2) in enumerate(zip(all_pos[:-1], all_pos[1:])):
-            w1 = [pos]
-            if r2 in ratios:  # If the next point is in the current wall
-                w1.extend(w)
-                pos = data[s[p2]]
-                p1, p2 = p1+1, p2+1
-                if p2 < len(s):
-                    w = data.walls[s[p1], s[p2]]
-                    next = s[p1]
-            else:  # Otherwise, find where it stops
-                l = (r2-r1)*length
-                acc = 0
-                while w:
-                    p = w[0]
-                    vec = p - w1[-1]
-                    dl = sqrt(vec.x()*vec.x() + vec.y()*vec.y())
-                    if acc+dl > l:  # If we go past the next stop
-                        pos = w1[-1] + vec*((l-acc)/dl)
-                        break
-                    acc += dl
-                    w1.append(p)
-                    w.pop(0)
-                else:  # If the end of the wall has been reached
-                    p = data[s[p2]]
-                    vec = p - w1[-1]
-                    dl = sqrt(vec.x()*vec.x() + vec.y()*vec.y())
-                    pos = w1[-1] + vec*((l-acc)/dl)
-            align[j] = (w1, cur)
-            l = (r2-r1)*len_s2
-            cur, next = next, None
+    coords1, vertices1 = wall_polyline(s1, data1)
+    coords2, vertices2 = wall_polyline(s2, data2)
+    if len(s1) == 2 and len(s2) == 2:  # Both segments are a single wall, there is nothing to cut
+        return [(coords1[:-1], s1[0])], [(coords2[:-1], s2[0])]
+    arc1 = polylineArcLength(coords1)
+    arc2 = polylineArcLength(coords2)
+    ratios_s1 = arc1[vertices1] / arc1[-1]
+    ratios_s2 = arc2[vertices2] / arc2[-1]
+    all_pos = unique(concatenate((ratios_s1, ratios_s2)))
+
+    def _align(coords, arc, vertices, ratios, s):
+        positions = all_pos * arc[-1]
+        # Cuts on the points of the segment are placed exactly on them
+        vertex = minimum(searchsorted(ratios, all_pos), len(ratios) - 1)
+        is_vertex = ratios[vertex] == all_pos
+        positions[is_vertex] = arc[vertices[vertex[is_vertex]]]
+        starts = polylinePoints(coords, arc, positions[:-1])
+        starts[is_vertex[:-1]] = coords[vertices[vertex[:-1][is_vertex[:-1]]]]
+        firsts = searchsorted(arc, positions[:-1], side='right')
+        lasts = searchsorted(arc, positions[1:], side='left')
+        align = []
+        for j in range(len(all_pos) - 1):
+            part = concatenate((starts[j:j+1], coords[firsts[j]:max(firsts[j], lasts[j])]))
+            align.append((part, s[vertex[j]] if is_vertex[j] else None))
         return align
-    align_s1 = _align(len_s1, s1, ratios_s1, data1)
-    align_s2 = _align(len_s2, s2, ratios_s2, data2)
+    align_s1 = _align(coords1, arc1, vertices1, ratios_s1, s1)
+    align_s2 = _align(coords2, arc2, vertices2, ratios_s2, s2)
     return align_s1, align_s2
 
 
 def discretize_segment(seg, n, l):
-    dl = l/n
-    result = []
-    idx = 0
-    pos = seg[idx]
-    vec = seg[idx+1]-pos
-    vec_size = sqrt(vec.x()*vec.x() + vec.y()*vec.y())
-    vec /= vec_size
-    shift = 0
-    for j in range(n):
-        result.append(pos)
-        if j == n-1:
-            break
-        needed_dl = dl
-        while shift+needed_dl > vec_size:
-            idx += 1
-            needed_dl -= vec_size - shift
-            pos = seg[idx]
-            vec = seg[idx+1]-seg[idx]
-            vec_size = sqrt(vec.x()*vec.x() + vec.y()*vec.y())
-            vec /= vec_size
-            shift = 0
-        pos = pos + vec*needed_dl
-        shift += needed_dl
-    return result
+    """
+    :returns: n points regularly spaced along the polyline `seg` of length `l`, starting with its first point
+    :returntype: ndarray(n,2)
+    """
+    arc = polylineArcLength(seg)
+    return polylinePoints(seg, arc, arange(n) * (l / n))
 
 
+@timed("growth.alignCells")
 def alignCells(c, pts, new_pts, img_data, next_img_data, nb_points):
     # First, find a common vertex between the cells
     for common in pts:
@@ -728,8 +1271,8 @@ def alignCells(c, pts, new_pts, img_data, next_img_data, nb_points):
             new_pts = new_pts[idx1:] + new_pts[:idx1]
             break
     else:
-        log_debug("Error, cell %d have no common points between times %s and %s" % (c, img_data.image_name,
-                                                                                    next_img_data.image_name))
+        log_debug("Error, cell %d have no common points between times %s and %s", c, img_data.image_name,
+                  next_img_data.image_name)
         return
     # Then, align the cells. i.e. add missing points
     aligned_pts = []
@@ -740,8 +1283,8 @@ def alignCells(c, pts, new_pts, img_data, next_img_data, nb_points):
         if pid in new_pts:
             j2 = new_pts.index(pid)
             if j2 < j1:
-                log_debug("Error, cell %d is inconsistent between times %s and %s" % (c, img_data.image_name,
-                                                                                      next_img_data.image_name))
+                log_debug("Error, cell %d is inconsistent between times %s and %s", c, img_data.image_name,
+                          next_img_data.image_name)
                 aligned_pts = []
                 aligned_new_pts = []
                 i1 = 0
@@ -759,27 +1302,43 @@ def alignCells(c, pts, new_pts, img_data, next_img_data, nb_points):
         aligned_new_pts += new_seg
     if not aligned_pts:
         return
-    # Next, for the cell, start by resampling them
-    # Compute total perimeter of first cell
-    l1 = sum((seg for (seg, _) in aligned_pts), [])
-    l1.append(l1[0])
-    len_c1 = length_polyline(l1)
-    # Approximate the dl
-    dl = len_c1 / nb_points
-    ps = []  # Resampled first cell
-    qs = []  # Resampled second cell
-    nb_seg = len(aligned_pts)
-    for i, ((seg1, _), (seg2, _)) in enumerate(zip(aligned_pts, aligned_new_pts)):
-        seg1 = seg1 + aligned_pts[(i+1) % nb_seg][0][0:1]
-        seg2 = seg2 + aligned_new_pts[(i+1) % nb_seg][0][0:1]
-        l1 = length_polyline(seg1)
-        l2 = length_polyline(seg2)
-        # Number of point on the current segment
-        n = int(ceil(l1/dl))
-        # Real dl for first and second cells
-        ps += discretize_segment(seg1, n, l1)
-        qs += discretize_segment(seg2, n, l2)
-    return aligned_pts, aligned_new_pts, ps, qs
+    # Next, resample the cells with the same number of points on each part, spaced regularly on the first cell
+    ps = _resample_parts([seg for seg, _ in aligned_pts], nb_points)
+    qs = _resample_parts([seg for seg, _ in aligned_new_pts], nb_points, ps[1])
+    return aligned_pts, aligned_new_pts, ps[0], qs[0]
+
+
+def _resample_parts(parts, nb_points, counts=None):
+    """
+    Resample a closed polyline made of successive parts.
+
+    :Parameters:
+        parts : list of ndarray(N,2)
+            Parts of the polyline. Each part ends on the first point of the next one.
+        nb_points : int
+            Approximate number of points on the polyline, used if `counts` is None
+        counts : ndarray of int
+            Number of points on each part. If None, the points are spaced by about a `nb_points`-th of the length of
+            the polyline.
+
+    :returns: the points, and the number of points on each part
+    :returntype: (ndarray(M,2), ndarray of int)
+    """
+    sizes = array([len(part) for part in parts], dtype=int)
+    coords = concatenate(parts + [parts[0][:1]])
+    arc = polylineArcLength(coords)
+    bounds = concatenate(([0], cumsum(sizes)))
+    starts = arc[bounds[:-1]]
+    lengths = arc[bounds[1:]] - starts
+    if counts is None:
+        dl = arc[-1] / nb_points
+        counts = array([int(ceil(l / dl)) for l in lengths.tolist()], dtype=int)
+    # Position of each point in its part
+    part = repeat(arange(len(parts)), counts)
+    first = concatenate(([0], cumsum(counts)[:-1]))
+    index = arange(counts.sum()) - first[part]
+    positions = starts[part] + index * (lengths / maximum(counts, 1))[part]
+    return polylinePoints(coords, arc, positions), counts
 
 
 class ForwardDenseMethod(GrowthMethod):
@@ -817,95 +1376,88 @@ class ForwardDenseMethod(GrowthMethod):
     def growthParams(self, ps, qs, dt):
         return growthParams(ps, qs, dt, at_start=True)
 
+    @timed("growth.processCell")
     def processCell(self, c, img_data, next_img_data, ref_is_img):
-        log_debug("Processing cell %d" % c)
+        log_debug("Processing cell %d", c)
         cell_shapes = self.cell_shapes
         cell_result = self.cell_result
-        wall_result = self.wall_result
         cell_area_result = self.cell_area_result
-        walls = self.walls
         data = img_data.parent
+        geometry = self.geometry
         try:
-            pts = data.cellAtTime(c, img_data.index)
-            new_pts = data.cellAtTime(c, next_img_data.index)
+            pts = geometry.cellAtTime(c, img_data.index)
+            new_pts = geometry.cellAtTime(c, next_img_data.index)
         except ValueError:
             return
         if ref_is_img:
             ref_pts = pts
         else:
             ref_pts = new_pts
-        dt = next_img_data.time - img_data.time
+        dt = timeInterval(img_data, next_img_data)
         result = alignCells(c, pts, new_pts, img_data, next_img_data, self.nb_points)
         if result is None:
             return
         aligned_pts, aligned_new_pts, ps, qs = result
-        # Now, we know enough to compute growth of walls
-        w1, prev = aligned_pts[0]
-        w2, _ = aligned_new_pts[0]
-        shifted1 = aligned_pts[1:] + aligned_pts[0:1]
-        shifted2 = aligned_new_pts[1:] + aligned_new_pts[0:1]
-        for (seg1, p1), (seg2, p2) in zip(shifted1, shifted2):
-            if p1 in ref_pts or p2 in ref_pts:
+        # Now, we know enough to find the walls: they go from a point of the reference cell to the next one, the
+        # first part starting on a point of both cells
+        ref_pts = set(ref_pts)
+        vertices = []
+        bounds = []
+        for j, ((_, p1), (_, p2)) in enumerate(zip(aligned_pts, aligned_new_pts)):
+            if j == 0 or p1 in ref_pts or p2 in ref_pts:
                 cur = p2 if p1 is None else p1
-                assert prev is not None and cur is not None
-                id = data.wallId(prev, cur)
-                if id not in walls:
-                    walls.add(id)
-                    w1.append(seg1[0])
-                    w2.append(seg2[0])
-                    l1 = length_polyline(w1)
-                    l2 = length_polyline(w2)
-                    k = log(l2/l1)/dt
-                    wall_result[id] = k
-                prev = cur
-                w1 = seg1
-                w2 = seg2
-            else:
-                w1 += seg1
-                w2 += seg2
-        ps = array([[p.x(), p.y()] for p in ps])
-        qs = array([[p.x(), p.y()] for p in qs])
+                assert cur is not None
+                vertices.append(cur)
+                bounds.append(j)
+        vertices.append(vertices[0])
+        bounds.append(len(aligned_pts))
+        walls = [data.wallId(prev, cur) for prev, cur in zip(vertices[:-1], vertices[1:])]
+        # The contours of the cell are closed on the first point, so the last wall ends on it
+        poly1 = concatenate([seg for seg, _ in aligned_pts])
+        poly2 = concatenate([seg for seg, _ in aligned_new_pts])
+        bounds1 = cumsum([0] + [len(seg) for seg, _ in aligned_pts])[bounds]
+        bounds2 = cumsum([0] + [len(seg) for seg, _ in aligned_new_pts])[bounds]
+        self.packed_walls.addPolyline(walls, concatenate((poly1, poly1[:1])), bounds1,
+                                      concatenate((poly2, poly2[:1])), bounds2)
         gp = self.growthParams(ps, qs, dt)
         if gp is not None:
-            poly1 = sum([s[0] for s in aligned_pts], [])
-            poly2 = sum([s[0] for s in aligned_new_pts], [])
-            a1 = polygonArea(poly1)
-            a2 = polygonArea(poly2)
+            a1, a2 = abs(polygonsSignedArea(concatenate((poly1, poly2)), [0, len(poly1)]))
             if a2/(a2+a1) < 1e-15:  # Too small, there is a pb
                 return
             r = log(a2/a1)/dt
             if isnan(r) or isinf(r) or isnan(gp).any():
-                log_debug("Invalid growth for cell %d on image %s:\n %s" % (c, img_data.image_name, gp,))
+                log_debug("Invalid growth for cell %d on image %s:\n %s", c, img_data.image_name, gp)
                 return
             cell_area_result[c] = r
             cell_result[c] = gp
             cell_shapes[c] = (ps, qs)
 
-    def __call__(self, list_img, data, cells_selection):
-        result = Result(data, list_img)
-        thread = self.thread
-        used_images = self.usedImages(list_img)
-        for i in range(len(used_images)):
-            img_name = used_images[i]
-            used_imgs = self.computeFromImages(list_img, i)
-            ref_img = self.baseImage(list_img, i)
-            cells_pts = cells_selection(used_imgs, data)
-            log_debug("%d cells for images %s" % (len(cells_pts), used_imgs))
-            if cells_pts:
-                img_data = data[used_imgs[0]]
-                next_img_data = data[used_imgs[1]]
-                n = result.addImage(img_name)
-                self.cell_shapes = result.cells_shapes[n]
-                self.cell_result = result.cells[n]
-                self.wall_result = result.walls[n]
-                self.cell_area_result = result.cells_area[n]
-                self.walls = set()
-                for c in sorted(cells_pts.keys()):
-                    self.processCell(c, img_data, next_img_data, ref_is_img=(ref_img == used_imgs[0]))
-            if thread.stopped():
-                return
-            thread.nextImage()
-        return result
+    def computeImage(self, list_img, data, cells_selection, i, result):
+        img_name = self.usedImages(list_img)[i]
+        used_imgs = self.computeFromImages(list_img, i)
+        ref_img = self.baseImage(list_img, i)
+        cells_pts = cells_selection(used_imgs, data)
+        log_debug("%d cells for images %s", len(cells_pts), used_imgs)
+        if cells_pts:
+            img_data = data[used_imgs[0]]
+            next_img_data = data[used_imgs[1]]
+            n = result.addImage(img_name)
+            self.cell_shapes = result.cells_shapes[n]
+            self.cell_result = result.cells[n]
+            self.wall_result = result.walls[n]
+            self.cell_area_result = result.cells_area[n]
+            self.packed_walls = PackedWalls()
+            self.geometry = result.geometryCache(data)
+            for c in sorted(cells_pts.keys()):
+                self.processCell(c, img_data, next_img_data, ref_is_img=(ref_img == used_imgs[0]))
+            # The walls shared by two cells get the growth computed with the first one
+            packed_walls = self.packed_walls
+            if packed_walls.walls:
+                walls = array(packed_walls.walls, dtype=int).reshape(-1, 2)
+                first = uniqueWalls(walls)
+                l1, l2 = packed_walls.lengths()
+                dt = timeInterval(img_data, next_img_data)
+                setWallsGrowth(self.wall_result, walls[first], wallsGrowth(l1[first], l2[first], dt, logarithmic=True))
 
 
 class BackwardDenseMethod(ForwardDenseMethod):
@@ -948,10 +1500,72 @@ class StartDenseMethod(ForwardDenseMethod):
         return ["StartDense", self._nb_points]
 
 
-class FullCellsOnlySelection(object):
+class CellsSelection(object):
+    """
+    Base class of the cells selections.
+
+    The selections work on the arrays of `growth_geometry.PackedData`. They are computed the first time the
+    selection is called with a data set, and reused while it is called with the same data set, which must not be
+    modified in between.
+    """
     def __init__(self, daughterCells):
         self.daughterCells = daughterCells
+        self._packed = None
+        self._packed_data = None
+
+    def __getstate__(self):
+        # The arrays are computed again for the data set of the process using the selection
+        state = dict(self.__dict__)
+        state['_packed'] = None
+        state['_packed_data'] = None
+        return state
 
+    def packedData(self, data):
+        """
+        :returns: the arrays of the data set `data`
+        :returntype: `growth_geometry.PackedData`
+        """
+        if self._packed_data is None or self._packed_data() is not data:
+            self._packed = PackedData(data)
+            self._packed_data = weakref.ref(data)
+        return self._packed
+
+    def setPackedData(self, data, packed):
+        """
+        Use `packed` as the arrays of the data set `data`. The caller keeps them up to date if `data` is modified.
+        """
+        self._packed = packed
+        self._packed_data = weakref.ref(data)
+
+    def initialCells(self, packed, i):
+        """
+        :returns: the rows of the cells selected in the i-th image, before filtering them
+        :returntype: ndarray of int
+        """
+        rows = packed.aliveCells(i)
+        if not self.daughterCells:
+            rows = unique(packed.cell_ancestor[rows])
+        return rows
+
+    @staticmethod
+    def selectedPoints(packed, rows, vertices, owner, selected, valid):
+        """
+        :returns: the points selected for each valid cell
+        :returntype: dict of int*list of int
+        """
+        mask = selected & valid[owner]
+        pts = packed.point_ids[vertices[mask]].tolist()
+        counts = bincount(owner[mask], minlength=len(rows)).tolist()
+        cells_pts = {}
+        pos = 0
+        for cid, nb, v in zip(packed.cell_ids[rows].tolist(), counts, valid.tolist()):
+            if v:
+                cells_pts[cid] = pts[pos:pos+nb]
+                pos += nb
+        return cells_pts
+
+
+class FullCellsOnlySelection(CellsSelection):
     def parameters(self):
         params = ["AddDivisionOnly"]
         if self.daughterCells:
@@ -960,37 +1574,30 @@ class FullCellsOnlySelection(object):
             params += ["without cell division"]
         return params
 
+    @timed("selection.FullCellsOnly")
     def __call__(self, list_img, data):
-        img_data = data[list_img[0]]
-        cells = list(img_data.cells)
-        division_points = data.divisionPoints()
-        if not self.daughterCells:
-            cells = list(set(data.oldestAncestor(c) for c in cells))
-        cells_pts = dict([(c, [p for p in data.cells[c] if p in img_data]) for c in cells])
-        for c in cells_pts.keys():
-            if len(cells_pts[c]) < 3:
-                del cells_pts[c]
-        log_debug("Initial list of cells: %s" % (sorted(cells_pts.keys()),))
+        packed = self.packedData(data)
+        first = packed.imageIndex(list_img[0])
+        rows = self.initialCells(packed, first)
+        nb_cells = len(rows)
+        vertices, owner = packed.cellsVertices(rows)
+        presence = packed.presence[vertices]
+        selected = presence[:, first].copy()
+        valid = bincount(owner[selected], minlength=nb_cells) >= 3
+        log_debug("Initial list of cells: %s", lazy(sorted, packed.cell_ids[rows[valid]].tolist()))
+        # Only the points involved in a division can be missing
+        can_miss = packed.division[vertices]
         for img in list_img:
-            new_img_data = data[img]
-            for c, _ in cells_pts.items():
-                missing_pts = set(p for p in data.cells[c] if p not in new_img_data)
-                for p in missing_pts:
-                    if p not in division_points:
-                        del cells_pts[c]
-                        break
-                else:
-                    new_cell = [p for p in cells_pts[c] if p in new_img_data]
-                    if len(new_cell) < 3:
-                        del cells_pts[c]
-                    else:
-                        cells_pts[c] = new_cell
-        return cells_pts
+            present = presence[:, packed.imageIndex(img)]
+            valid &= bincount(owner[~present & ~can_miss], minlength=nb_cells) == 0
+            selected &= present
+            valid &= bincount(owner[selected], minlength=nb_cells) >= 3
+        return self.selectedPoints(packed, rows, vertices, owner, selected, valid)
 
 
-class AddPointsSelection(object):
+class AddPointsSelection(CellsSelection):
     def __init__(self, daughterCells, max_variation):
-        self.daughterCells = daughterCells
+        CellsSelection.__init__(self, daughterCells)
         self.max_variation = max_variation
 
     def parameters(self):
@@ -1001,40 +1608,34 @@ class AddPointsSelection(object):
             params += ["without cell division"]
         return params
 
+    @timed("selection.AddPoints")
     def __call__(self, list_img, data):
-        log_debug("Starting AddPointsSelection")
-        img_data = data[list_img[0]]
-        cells = list(img_data.cells)
-        if not self.daughterCells:
-            cells = list(set(data.oldestAncestor(c) for c in cells))
-        cells_pts = dict([(c, [p for p in data.cells[c] if p in img_data]) for c in cells])
-        for c in cells_pts.keys():
-            if len(cells_pts[c]) < 3:
-                log_debug("Deleting cell %s because it has less than three vertices" % c)
-                del cells_pts[c]
-        print("Initial list of cells: %s" % (sorted(cells_pts.keys()),))
+        packed = self.packedData(data)
+        first = packed.imageIndex(list_img[0])
+        rows = self.initialCells(packed, first)
+        nb_cells = len(rows)
+        vertices, owner = packed.cellsVertices(rows)
+        presence = packed.presence[vertices]
+        selected = presence[:, first].copy()
+        valid = bincount(owner[selected], minlength=nb_cells) >= 3
+        log_debug("Initial list of cells: %s", lazy(sorted, packed.cell_ids[rows[valid]].tolist()))
         for img in list_img[1:]:
-            new_img_data = data[img]
-            for c, pts in cells_pts.items():
-                for p in pts:
-                    if p not in new_img_data:
-                        log_debug("Deleting cell %d because it is not in the other image" % c)
-                        del cells_pts[c]
-                        break
-                else:
-                    p1 = [new_img_data[p] for p in data.cells[c] if p in img_data]
-                    p2 = [new_img_data[p] for p in data.cells[c] if p in new_img_data]
-                    a1 = polygonArea(p1)
-                    a2 = polygonArea(p2)
-                    if abs((a2-a1)/a1) > self.max_variation:
-                        log_debug("Deleting cell %d because of big size variation" % c)
-                        del cells_pts[c]
-        return cells_pts
-
-
-class AllCellsSelection(object):
+            i = packed.imageIndex(img)
+            present = presence[:, i]
+            # The points selected must all be in the other image
+            valid &= bincount(owner[selected & ~present], minlength=nb_cells) == 0
+            # Then, compare the cell without and with the points added
+            checked = valid[owner]
+            a1 = packed.polygonsArea(vertices[selected & checked], owner[selected & checked], nb_cells, i)
+            a2 = packed.polygonsArea(vertices[present & checked], owner[present & checked], nb_cells, i)
+            with errstate(divide="ignore", invalid="ignore"):
+                valid &= ~(abs((a2-a1)/a1) > self.max_variation)
+        return self.selectedPoints(packed, rows, vertices, owner, selected, valid)
+
+
+class AllCellsSelection(CellsSelection):
     def __init__(self, daughterCells, max_variation):
-        self.daughterCells = daughterCells
+        CellsSelection.__init__(self, daughterCells)
         self.max_variation = max_variation
 
     def parameters(self):
@@ -1047,24 +1648,23 @@ class AllCellsSelection(object):
             params.append("without cell division")
         return params
 
+    @timed("selection.AllCells")
     def __call__(self, list_img, data):
-        img_data = data[list_img[0]]
-        cells = list(img_data.cells)
-        if not self.daughterCells:
-            cells = list(set(data.oldestAncestor(c) for c in cells))
-        cells_pts = dict([(c, [p for p in data.cells[c] if p in img_data]) for c in cells])
-        log_debug("Initial list of cells: %s" % (sorted(cells_pts.keys()),))
-        for c in cells_pts.keys():
-            if len(cells_pts[c]) < 3:
-                del cells_pts[c]
+        packed = self.packedData(data)
+        first = packed.imageIndex(list_img[0])
+        rows = self.initialCells(packed, first)
+        nb_cells = len(rows)
+        vertices, owner = packed.cellsVertices(rows)
+        presence = packed.presence[vertices]
+        selected = presence[:, first]
+        valid = bincount(owner[selected], minlength=nb_cells) >= 3
+        log_debug("Initial list of cells: %s", lazy(sorted, packed.cell_ids[rows[valid]].tolist()))
         if self.max_variation is not None:
+            a1 = packed.polygonsArea(vertices[selected], owner[selected], nb_cells, first)
             for img in list_img[1:]:
-                new_img_data = data[img]
-                for c, _ in cells_pts.items():
-                    p1 = [img_data[p] for p in data.cells[c] if p in img_data]
-                    p2 = [new_img_data[p] for p in data.cells[c] if p in new_img_data]
-                    a1 = polygonArea(p1)
-                    a2 = polygonArea(p2)
-                    if abs((a2-a1)/a1) > self.max_variation:
-                        del cells_pts[c]
-        return cells_pts
+                i = packed.imageIndex(img)
+                present = presence[:, i]
+                a2 = packed.polygonsArea(vertices[present], owner[present], nb_cells, i)
+                with errstate(divide="ignore", invalid="ignore"):
+                    valid &= ~(abs((a2-a1)/a1) > self.max_variation)
+        return self.selectedPoints(packed, rows, vertices, owner, selected, valid)
@@ -0,0 +1,396 @@
+from __future__ import print_function, division, absolute_import
+"""
+Packed geometry of a data set, shared by the computations of a growth run.
+
+The data must not be modified while the arrays are used.
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+from numpy import (arange, array, asarray, bincount, concatenate, cumsum, empty, fromiter, hypot, lexsort, nan, ones, repeat,
+                   searchsorted, sort, unique, zeros)
+from .geometry import polygonsSignedArea, polygonsCentroid, polylinesLength
+
+
+class PackedData(object):
+    """
+    Points and cells of a data set as arrays.
+
+    Points and cells are identified by their row in the arrays. The vertices of the cells are stored one cell after
+    the other, as rows of points.
+
+    :IVariables:
+        images : list of str
+            Name of the images, in order
+        point_ids : ndarray(P) of int
+            Ids of the points, sorted
+        presence : ndarray(P,F) of bool
+            For each point and image, True if the point is in the image
+        division : ndarray(P) of bool
+            True for the points involved in a cell division
+        cell_ids : ndarray(C) of int
+            Ids of the cells
+        cell_indptr : ndarray(C+1) of int
+            Position of the first vertex of each cell in `cell_points`
+        cell_points : ndarray of int
+            Rows of the vertices of the cells
+        cell_start : ndarray(C) of int
+            Index of the first image of each cell
+        cell_end : ndarray(C) of int
+            Index of the image following the last one of each cell
+        cell_ancestor : ndarray(C) of int
+            Row of the oldest ancestor of each cell, the cell itself if it has no parent
+    """
+    def __init__(self, data, point_ids=None):
+        """
+        :Parameters:
+            data : `TrackingData`
+                Data set to convert
+            point_ids : ndarray of int
+                Ids of points to include even if they are not in the data set yet, so their positions can be given
+                later with `setPositions`
+        """
+        self.images = list(data.images_name)
+        self._image_index = dict((img, i) for i, img in enumerate(self.images))
+        positions = [data.data[img] for img in self.images]
+        cids, lengths, cell_pts = data.cells.arrays()
+        image_pts = [fromiter(pos, dtype=int, count=len(pos)) for pos in positions]
+        extra_pts = [] if point_ids is None else [asarray(point_ids, dtype=int)]
+        self.point_ids = point_ids = unique(concatenate(image_pts + extra_pts + [cell_pts.astype(int)]))
+        self.presence = presence = zeros((len(point_ids), len(self.images)), dtype=bool)
+        for i, pts in enumerate(image_pts):
+            presence[searchsorted(point_ids, pts), i] = True
+        self.cell_ids = cids
+        self.cell_indptr = concatenate(([0], cumsum(lengths)))
+        self.cell_points = searchsorted(point_ids, cell_pts)
+        nb_images = len(self.images)
+        cell_rows = dict((cid, row) for row, cid in enumerate(cids.tolist()))
+        cells_lifespan = data.cells_lifespan
+        lifespans = [cells_lifespan[cid] for cid in cids.tolist()]
+        self.cell_start = array([ls.start for ls in lifespans], dtype=int).reshape(-1)
+        self.cell_end = array([ls[1] if ls[1] >= 0 else nb_images for ls in lifespans], dtype=int).reshape(-1)
+        parents = [cell_rows.get(ls.parent, row) if ls.parent is not None else row
+                   for row, ls in enumerate(lifespans)]
+        ancestor = array(parents, dtype=int).reshape(-1)
+        # Follow the parents until every cell points to a cell without parent
+        while True:
+            next_ancestor = ancestor[ancestor]
+            if (next_ancestor == ancestor).all():
+                break
+            ancestor = next_ancestor
+        self.cell_ancestor = ancestor
+        division = [pt for ls in lifespans if ls.division for pt in ls.division]
+        self.division = zeros(len(point_ids), dtype=bool)
+        self.division[searchsorted(point_ids, array(division, dtype=int))] = True
+        self._positions = positions
+        self._coordinates = {}
+
+    def imageIndex(self, img):
+        """
+        :returns: the index of the image named `img`
+        :returntype: int
+        """
+        return self._image_index[img]
+
+    def coordinates(self, i):
+        """
+        :returns: the positions of the points in the i-th image, NaN for the points absent of the image
+        :returntype: ndarray(P,2) of float
+        """
+        coords = self._coordinates.get(i)
+        if coords is None:
+            pos = self._positions[i]
+            coords = empty((len(self.point_ids), 2), dtype=float)
+            coords.fill(nan)
+            if pos:
+                rows = searchsorted(self.point_ids, fromiter(pos, dtype=int, count=len(pos)))
+                values = list(pos.values())
+                coords[rows, 0] = fromiter((p.x() for p in values), dtype=float, count=len(values))
+                coords[rows, 1] = fromiter((p.y() for p in values), dtype=float, count=len(values))
+            self._coordinates[i] = coords
+        return coords
+
+    def setPositions(self, img, positions):
+        """
+        Replace the positions of the points in the image `img`, after they were replaced in the data set. The points
+        must all be in `point_ids`.
+        """
+        i = self._image_index[img]
+        presence = self.presence
+        presence[:, i] = False
+        if positions:
+            presence[searchsorted(self.point_ids, fromiter(positions, dtype=int, count=len(positions))), i] = True
+        self._positions[i] = positions
+        self._coordinates.pop(i, None)
+
+    def releaseCoordinates(self, frames):
+        """
+        Forget the coordinates computed for the images whose index is not in `frames`.
+        """
+        coordinates = self._coordinates
+        for i in [i for i in coordinates if i not in frames]:
+            del coordinates[i]
+
+    def aliveCells(self, i):
+        """
+        :returns: the rows of the cells existing in the i-th image
+        :returntype: ndarray of int
+        """
+        return ((self.cell_start <= i) & (self.cell_end > i)).nonzero()[0]
+
+    def cellsVertices(self, rows):
+        """
+        :returns: the vertices of the cells `rows`, one cell after the other, and for each vertex the position of
+            its cell in `rows`
+        :returntype: (ndarray of int, ndarray of int)
+        """
+        starts = self.cell_indptr[rows]
+        lengths = self.cell_indptr[rows+1] - starts
+        total = lengths.sum()
+        owner = repeat(arange(len(rows)), lengths)
+        first = cumsum(lengths) - lengths
+        return self.cell_points[arange(total) + repeat(starts - first, lengths)], owner
+
+    def polygonsArea(self, vertices, owner, nb_cells, i):
+        """
+        Area of the polygons made of the vertices given, in the i-th image. Polygons with less than three vertices
+        have an area of 0.
+
+        :Parameters:
+            vertices : ndarray of int
+                Rows of the points of the polygons, one polygon after the other
+            owner : ndarray of int
+                Polygon of each vertex, in increasing order
+            nb_cells : int
+                Number of polygons
+
+        :returns: the absolute area of each polygon
+        :returntype: ndarray(nb_cells) of float
+        """
+        counts = bincount(owner, minlength=nb_cells)
+        areas = zeros(nb_cells, dtype=float)
+        valid = counts >= 3
+        if valid.any():
+            counts[~valid] = 0
+            starts = (cumsum(counts) - counts)[valid]
+            areas[valid] = abs(polygonsSignedArea(self.coordinates(i)[vertices[valid[owner]]], starts))
+        return areas
+
+
+class GeometryCache(object):
+    """
+    Geometry of the cells and walls of a data set, computed once per image during a growth run.
+
+    The polygon of a cell in an image is made of the vertices of the cell present in the image. Polygons, areas,
+    centroids, wall lengths and shapes of the cells over time are kept by cell or wall, and by index of the image.
+    Values missing from the cache are computed together, in one pass over the packed arrays. The walls are not
+    cached, their lengths are computed for all the walls of an image at once. The values of an image are kept until
+    they are released with `keepFrames`.
+
+    :IVariables:
+        data : `TrackingData`
+            Data set of the geometry
+        packed : `PackedData`
+            Arrays of the data set
+    """
+    def __init__(self, data, packed=None):
+        self.data = data
+        if packed is None:
+            packed = PackedData(data)
+        self.packed = packed
+        self._cell_rows = dict((cid, row) for row, cid in enumerate(packed.cell_ids.tolist()))
+        self._polygons = {}
+        self._areas = {}
+        self._centroids = {}
+        self._cells_at_time = {}
+
+    def _compute(self, cids, i):
+        """
+        Compute the polygons, areas and centroids of the cells `cids` in the i-th image, if not known yet.
+        """
+        polygons = self._polygons
+        cids = [cid for cid in cids if (cid, i) not in polygons]
+        if not cids:
+            return
+        cids = list(set(cids))
+        packed = self.packed
+        cell_rows = self._cell_rows
+        rows = array([cell_rows[cid] for cid in cids], dtype=int)
+        vertices, owner = packed.cellsVertices(rows)
+        present = packed.presence[vertices, i]
+        coords = packed.coordinates(i)[vertices[present]]
+        counts = bincount(owner[present], minlength=len(cids))
+        ends = cumsum(counts)
+        starts = ends - counts
+        nonempty = counts > 0
+        areas = zeros(len(cids), dtype=float)
+        centroids = empty((len(cids), 2), dtype=float)
+        centroids.fill(nan)
+        if nonempty.any():
+            signed = polygonsSignedArea(coords, starts[nonempty])
+            areas[nonempty] = abs(signed)
+            centroids[nonempty] = polygonsCentroid(coords, starts[nonempty])
+        # As polygonArea, polygons with less than three vertices have no area
+        areas[counts < 3] = 0
+        for cid, start, end, area, centroid in zip(cids, starts.tolist(), ends.tolist(), areas.tolist(),
+                                                   centroids.tolist()):
+            polygons[cid, i] = coords[start:end]
+            self._areas[cid, i] = area
+            self._centroids[cid, i] = tuple(centroid)
+
+    def keepFrames(self, frames):
+        """
+        Release the values of the images whose index is not in `frames`.
+        """
+        frames = set(frames)
+        for table in (self._polygons, self._areas, self._centroids, self._cells_at_time):
+            for key in [key for key in table if key[1] not in frames]:
+                del table[key]
+        self.packed.releaseCoordinates(frames)
+
+    def polygon(self, cid, i):
+        """
+        :returns: the polygon of the cell `cid` in the i-th image
+        :returntype: ndarray(N,2) of float
+        """
+        self._compute([cid], i)
+        return self._polygons[cid, i]
+
+    def areas(self, cids, i):
+        """
+        :returns: the absolute area of the cells `cids` in the i-th image
+        :returntype: list of float
+        """
+        self._compute(cids, i)
+        areas = self._areas
+        return [areas[cid, i] for cid in cids]
+
+    def area(self, cid, i):
+        """
+        :returns: the absolute area of the cell `cid` in the i-th image
+        :returntype: float
+        """
+        self._compute([cid], i)
+        return self._areas[cid, i]
+
+    def centroids(self, cids, i):
+        """
+        :returns: the centroid of the cells `cids` in the i-th image, NaN for the cells with a null area
+        :returntype: list of (float,float)
+        """
+        self._compute(cids, i)
+        centroids = self._centroids
+        return [centroids[cid, i] for cid in cids]
+
+    def points(self, pt_ids, i):
+        """
+        :returns: the positions of the points `pt_ids` in the i-th image
+        :returntype: ndarray(N,2) of float
+        """
+        packed = self.packed
+        return packed.coordinates(i)[searchsorted(packed.point_ids, array(pt_ids, dtype=int))]
+
+    def wallLengths(self, walls, i):
+        """
+        :Parameters:
+            walls : ndarray(N,2) of int
+                Ids of the two points of each wall
+
+        :returns: the distance between the two points of each wall in the i-th image
+        :returntype: ndarray(N) of float
+        """
+        ends = self.points(walls.reshape(-1), i).reshape(-1, 2, 2)
+        diff = ends[:, 1] - ends[:, 0]
+        return hypot(diff[:, 0], diff[:, 1])
+
+    def cellAtTime(self, cid, i):
+        """
+        :returns: the shape of the cell `cid` in the i-th image, as `TrackingData.cellAtTime`
+        :returntype: list of int
+
+        :raise ValueError: if the cell doesn't exist at this time
+        """
+        key = (cid, i)
+        cells_at_time = self._cells_at_time
+        if key not in cells_at_time:
+            try:
+                cells_at_time[key] = self.data.cellAtTime(cid, i)
+            except ValueError:
+                cells_at_time[key] = None
+                raise
+        pts = cells_at_time[key]
+        if pts is None:
+            raise ValueError("The cell %d doesn't exit at time %d" % (cid, i))
+        return pts
+
+
+def uniqueWalls(walls):
+    """
+    :Parameters:
+        walls : ndarray(N,2) of int
+            Ids of the two points of each wall, the smallest first
+
+    :returns: the index of the first occurrence of each wall, in increasing order
+    :returntype: ndarray of int
+    """
+    if not len(walls):
+        return arange(0)
+    # The sort is stable, so the first wall of each group is its first occurrence
+    order = lexsort((walls[:, 1], walls[:, 0]))
+    sorted_walls = walls[order]
+    first = ones(len(walls), dtype=bool)
+    first[1:] = (sorted_walls[1:] != sorted_walls[:-1]).any(axis=1)
+    return sort(order[first])
+
+
+class PackedWalls(object):
+    """
+    Polylines of walls on two images, packed to compute the length of all of them at once.
+
+    The walls are added along polylines, such as the contour of a cell, given on both images. A wall may be added
+    more than once.
+
+    :IVariables:
+        walls : list of (int,int)
+            Walls, in the order they were added
+    """
+    def __init__(self):
+        self.walls = []
+        self._coords = ([], [])
+        self._starts = ([], [])
+        self._ends = ([], [])
+        self._nb_coords = [0, 0]
+
+    def addPolyline(self, walls, coords1, bounds1, coords2, bounds2):
+        """
+        Add walls following each other along a polyline.
+
+        :Parameters:
+            walls : list of (int,int)
+                Walls along the polyline
+            coords1 : ndarray(N,2)
+                Vertices of the polyline on the first image
+            bounds1 : ndarray(len(walls)+1) of int
+                Index in `coords1` of the ends of the walls: the k-th wall goes from ``bounds1[k]`` to
+                ``bounds1[k+1]``
+            coords2 : ndarray(M,2)
+                Vertices of the polyline on the second image
+            bounds2 : ndarray(len(walls)+1) of int
+                Index in `coords2` of the ends of the walls
+        """
+        self.walls.extend(walls)
+        for n, coords, bounds in ((0, coords1, bounds1), (1, coords2, bounds2)):
+            offset = self._nb_coords[n]
+            self._coords[n].append(coords)
+            self._starts[n].append(bounds[:-1] + offset)
+            self._ends[n].append(bounds[1:] + offset)
+            self._nb_coords[n] += len(coords)
+
+    def lengths(self):
+        """
+        :returns: the length of the walls on each image, in the order they were added
+        :returntype: (ndarray of float, ndarray of float)
+        """
+        if not self.walls:
+            return empty((0,), dtype=float), empty((0,), dtype=float)
+        return tuple(polylinesLength(concatenate(self._coords[n]), concatenate(self._starts[n]),
+                                     concatenate(self._ends[n])) for n in (0, 1))
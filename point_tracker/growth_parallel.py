@@ -0,0 +1,142 @@
+from __future__ import print_function, division, absolute_import
+"""
+Computation of the growth with a pool of processes.
+
+The images used by a growth method are independent: the growth for the i-th image only reads the images returned by
+``computeFromImages(list_img, i)``. Each worker receives once the method, the cells selection and the topology of
+the data (cells and life spans), from which it builds its data set and the arrays of the cells selection. Then, for
+each image, it receives the positions and walls of the images needed, as NumPy arrays in the sections of the binary
+format, which replace those of the previous image. The results are merged in the order of the images.
+
+The workers are started from a new interpreter rather than forked, see `utils.processPool`.
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+import multiprocessing
+from collections import deque
+from . import tracking_binary
+from .growth_computation_methods import Result
+from .growth_geometry import PackedData
+from .utils import processPool
+from .debug import log_debug
+
+_worker = {}
+"""
+Method, cells selection, images, data set and arrays of the data used by the current worker process
+"""
+
+
+def _initWorker(method, cells_selection, list_img, topology):
+    data = tracking_binary.fromSections(topology)
+    packed = PackedData(data, topology["point_ids"])
+    cells_selection.setPackedData(data, packed)
+    _worker["method"] = method
+    _worker["cells_selection"] = cells_selection
+    _worker["list_img"] = list_img
+    _worker["data"] = data
+    _worker["packed"] = packed
+    _worker["header"] = {"header": topology["header"], "point_ids": topology["point_ids"]}
+    _worker["frames"] = []
+
+
+def _computeImage(i, frames):
+    """
+    Compute the growth for the i-th image used, from the sections of the images needed.
+
+    :returntype: `Result`
+    """
+    data = _worker["data"]
+    sections = dict(_worker["header"])
+    sections.update(frames)
+    images = tracking_binary.loadFrames(data, sections)
+    packed = _worker["packed"]
+    for img in set(images).union(_worker["frames"]):
+        packed.setPositions(img, data.data[img])
+    _worker["frames"] = images
+    list_img = _worker["list_img"]
+    result = Result(None, list_img)
+    _worker["method"].computeImage(list_img, data, _worker["cells_selection"], i, result)
+    result.data = None
+    result.geometry = None
+    return result
+
+
+def defaultProcesses():
+    """
+    :returns: the number of processes used by default, i.e. the number of processors
+    :returntype: int
+    """
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def computeGrowth(method, list_img, data, cells_selection, thread, processes=None, result=None):
+    """
+    Compute the growth with `method`, processing the images in parallel.
+
+    The thread is used as by the method itself: its ``stopped`` method is checked after each image, and its
+    ``nextImage`` method is called for each image, in order.
+
+    :Parameters:
+        method : `growth_computation_methods.GrowthMethod`
+            Method computing the growth
+        list_img : list of str
+            Images to compute the growth on
+        data : `TrackingData`
+            Data to compute the growth with. It must not be modified during the computation.
+        cells_selection : callable
+            Selection of the cells
+        thread
+            Object exposing ``stop``, ``stopped`` and ``nextImage``
+        processes : int
+            Number of processes. If None or 0, there is one process per processor. If 1, the method is called
+            directly in this process.
+        result : `Result`
+            Result the images are added to, in order. If None, a new result is created.
+
+    :returns: the result, or None if the computation was stopped
+    :returntype: `Result`
+    """
+    if not processes:
+        processes = defaultProcesses()
+    nb_images = len(method.usedImages(list_img))
+    processes = min(processes, nb_images)
+    if processes <= 1:
+        method.thread = thread
+        return method(list_img, data, cells_selection, result)
+    topology = tracking_binary.sections(data, images=[])
+    point_ids = topology["point_ids"]
+    log_debug("Computing growth on %d images with %d processes", nb_images, processes)
+    if result is None:
+        result = Result(data, list_img)
+    pool = processPool(processes, _initWorker, (method, cells_selection, list_img, topology))
+    completed = False
+    try:
+        pending = deque()
+        next_image = 0
+        for i in range(nb_images):
+            # Keep a few images ahead, so the memory doesn't depend on the number of images
+            while next_image < nb_images and len(pending) < 2*processes:
+                frames = tracking_binary.sections(data, method.computeFromImages(list_img, next_image), point_ids,
+                                                  topology=False)
+                pending.append(pool.apply_async(_computeImage, (next_image, frames)))
+                next_image += 1
+            task = pending.popleft()
+            while not task.ready():
+                if thread.stopped():
+                    return
+                task.wait(0.1)
+            result.extend(task.get())
+            if thread.stopped():
+                return
+            thread.nextImage()
+        completed = True
+    finally:
+        if completed:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+    return result
@@ -5,6 +5,7 @@ from PyQt4.QtGui import QImage
 import numpy
 from .algo import filterImage
 from .utils import bigendian
+from .debug import timer, count
 
 def nbytes(obj):
     """
@@ -101,23 +102,28 @@ class ImageCache(object):
         img = None
         numpy_img = None
         if image_name in self.images:
+            count("ImageCache.hit")
             self.order.remove(image_name)
             self.order.append(image_name)
             img, numpy_img, cached_size = self.images[image_name]
             if cached_size != filter_size:
                 prev_size = nbytes(numpy_img)
                 if want_numpy:
-                    numpy_img = load_image(img, filter_size)
+                    with timer("ImageCache.filter") as t:
+                        numpy_img = load_image(img, filter_size)
+                        t.nbytes = nbytes(numpy_img)
                 else:
                     numpy_img = None
                 self.images[image_name] = (img, numpy_img, filter_size)
                 self.current_size += nbytes(numpy_img) - prev_size
         else:
-            img = QImage(image_name)
-            if want_numpy:
-                numpy_img = load_image(img, filter_size)
-            else:
-                numpy_img = None
+            with timer("ImageCache.load") as t:
+                img = QImage(image_name)
+                if want_numpy:
+                    numpy_img = load_image(img, filter_size)
+                else:
+                    numpy_img = None
+                t.nbytes = nbytes(img) + nbytes(numpy_img)
             self.current_size += nbytes(img) + nbytes(numpy_img)
             self.images[image_name] = (img, numpy_img, filter_size)
             self.order.append(image_name)
@@ -155,7 +161,9 @@ class ImageCache(object):
         while self.current_size > self._real_max_size:
             to_del_img = self.order.pop(0)
             img_, npy_img, _ = self.images[to_del_img]
-            self.current_size -= nbytes(img_) + nbytes(npy_img)
+            size = nbytes(img_) + nbytes(npy_img)
+            count("ImageCache.evict", nbytes=size)
+            self.current_size -= size
             del self.images[to_del_img]
 
 
@@ -0,0 +1,185 @@
+from __future__ import print_function, division, absolute_import
+"""
+Merge tracking data files annotated separately on the same images.
+
+The files are read one after the other. The points and cells of each file are renumbered after the ones of the
+previous files, and its positions and walls are expressed in the alignment of the first file. Only the arrays of
+positions, cells, life spans and walls are kept between two files, and the merged data set is built once at the end.
+
+Usage::
+
+    python -m point_tracker.merge -o merged.csv part1.csv part2.csv ...
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+import argparse
+import logging
+import sys
+import numpy
+from PyQt4.QtCore import QPointF
+from .path import path
+from .tracking_data import TrackingData, TrackingDataException, LifeSpan, WallShapes
+from . import debug
+from .debug import log_debug, log_warning
+
+
+class _MergedData(object):
+    """
+    Arrays accumulated while reading the files to merge.
+    """
+    def __init__(self, reference, filename):
+        self.reference = reference
+        self.filename = filename
+        images = reference.images_name
+        self.positions = dict((img, ([], [])) for img in images)
+        self.cells = ([], [], [])
+        self.cells_lifespan = {}
+        self.walls = WallShapes()
+        for t in range(len(images)):
+            self.walls.add_time(t)
+        self.pt_offset = 0
+        self.cell_offset = 0
+
+    def check(self, data, filename):
+        """
+        Make sure the file describes the same images as the first one, and express it in the same alignment.
+        """
+        reference = self.reference
+        if list(data.images_name) != list(reference.images_name):
+            raise TrackingDataException("File '%s' doesn't use the same images as '%s'." %
+                                        (filename, self.filename))
+        if data.images_time != reference.images_time:
+            log_warning("Times of the images in '%s' differ from the first file, the first ones are used." % filename)
+        realign = any(data.images_shift[img][0] != reference.images_shift[img][0] or
+                      data.images_shift[img][1] != reference.images_shift[img][1] or
+                      tuple(data.images_scale[img]) != tuple(reference.images_scale[img])
+                      for img in data.images_name)
+        if realign:
+            log_debug("Realigning '%s' on the first file" % filename)
+            data.copyAlignementAndScale(reference)
+
+    def add(self, data):
+        """
+        Add the content of a data set, renumbering its points and cells.
+        """
+        pt_offset = self.pt_offset
+        cell_offset = self.cell_offset
+        last_pt = data._last_pt_id
+        for img in data.images_name:
+            pids, coords = data[img].coordinates()
+            pids = numpy.array(pids, dtype=int)
+            ids_list, coords_list = self.positions[img]
+            ids_list.append(pids + pt_offset)
+            coords_list.append(coords)
+            if len(pids):
+                last_pt = max(last_pt, int(pids.max()))
+        cids, lengths, points = data.cells.arrays()
+        all_cids, all_lengths, all_points = self.cells
+        all_cids.append(cids + cell_offset)
+        all_lengths.append(lengths)
+        all_points.append(points.astype(int) + pt_offset)
+        last_cell = data._last_cell_id
+        if len(cids):
+            last_cell = max(last_cell, int(cids.max()))
+        cells_lifespan = self.cells_lifespan
+        for cid, ls in data.cells_lifespan.items():
+            new_ls = LifeSpan(ls.start, ls.end, ls.parent + cell_offset if ls.parent is not None else None)
+            if ls.daughters is not None:
+                new_ls.daughters = (ls.daughters[0] + cell_offset, ls.daughters[1] + cell_offset)
+                new_ls.division = (ls.division[0] + pt_offset, ls.division[1] + pt_offset)
+            cells_lifespan[cid + cell_offset] = new_ls
+        walls = self.walls
+        for t, p1, p2 in data.walls:
+            walls.setWall(t, p1 + pt_offset, p2 + pt_offset, data.walls.coordinates(t, p1, p2))
+        self.pt_offset = pt_offset + last_pt + 1
+        self.cell_offset = cell_offset + last_cell + 1
+
+    def result(self):
+        """
+        :returns: the merged data set
+        :returntype: `TrackingData`
+        """
+        reference = self.reference
+        positions = {}
+        for img, (ids_list, coords_list) in self.positions.items():
+            ids = numpy.concatenate(ids_list).tolist()
+            coords = numpy.concatenate(coords_list)
+            positions[img] = dict(zip(ids, map(QPointF, coords[:, 0].tolist(), coords[:, 1].tolist())))
+        all_cids, all_lengths, all_points = self.cells
+        cids = numpy.concatenate(all_cids).tolist()
+        bounds = numpy.concatenate(([0], numpy.cumsum(numpy.concatenate(all_lengths)))).tolist()
+        points = numpy.concatenate(all_points).tolist()
+        cells = dict((cid, tuple(points[start:end])) for cid, start, end in zip(cids, bounds[:-1], bounds[1:]))
+        shifts = dict((img, [QPointF(pos), angle]) for img, (pos, angle) in reference.images_shift.items())
+        scales = dict(reference.images_scale)
+        merged = TrackingData(reference.project_dir)
+        merged.images_name = list(reference.images_name)
+        merged._set_data(positions, shifts, scales, cells, self.cells_lifespan, list(reference.images_time),
+                         self.walls)
+        merged._last_pt_id = self.pt_offset - 1
+        merged._last_cell_id = self.cell_offset - 1
+        return merged
+
+
+def mergeFiles(filenames, output=None):
+    """
+    Merge tracking data files.
+
+    The points and cells of the first file keep their ids, the ones of the following files are shifted after the
+    largest id used by the previous files.
+
+    :Parameters:
+        filenames : list of str
+            Files to merge. They must all describe the same list of images.
+        output : str
+            If not None, the merged data are saved in this file, in the binary format if it has the ``.npz``
+            extension.
+
+    :returns: the merged data set
+    :returntype: `TrackingData`
+    """
+    if not filenames:
+        raise TrackingDataException("No file to merge.")
+    merged = None
+    for filename in filenames:
+        filename = path(filename)
+        data = TrackingData(filename.dirname().dirname())
+        data.load(filename)
+        log_debug("Merging '%s': %d points and %d cells" % (filename, data._last_pt_id + 1, len(data.cells)))
+        if merged is None:
+            merged = _MergedData(data, filename)
+        else:
+            merged.check(data, filename)
+        merged.add(data)
+        del data
+    result = merged.result()
+    if output is not None:
+        result.save(output)
+    return result
+
+
+def main(argv=None):
+    """
+    Entry point of the command line tool.
+    """
+    parser = argparse.ArgumentParser(description="Merge tracking data files annotated on the same images.")
+    parser.add_argument("files", nargs="+", help="files to merge, the first one gives the alignment of the images")
+    parser.add_argument("-o", "--output", required=True,
+                        help="file to write, in the binary format if its extension is .npz")
+    parser.add_argument("-v", "--verbose", action="store_true", help="report the progress")
+    args = parser.parse_args(argv)
+    debug.init_console(logging.DEBUG if args.verbose else logging.WARNING)
+    if len(args.files) < 2:
+        parser.error("at least two files are needed")
+    try:
+        merged = mergeFiles(args.files, args.output)
+    except TrackingDataException as ex:
+        print("Error: %s" % ex, file=sys.stderr)
+        return 1
+    nb_points = len(set().union(*(d.keys() for d in merged.data.values())))
+    print("Merged %d files into '%s': %d points and %d cells" % (len(args.files), args.output, nb_points,
+                                                                 len(merged.cells)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
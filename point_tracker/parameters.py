@@ -223,6 +223,15 @@ class Parameters(QObject):
         self._ellipsis_scale_axis = toBool(settings.value("ScaleAxis", 'false'))
         settings.endGroup()
         settings.endGroup()
+
+# The growth computation parameters
+        settings.beginGroup("GrowthParameters")
+        try:
+            self._growth_processes = max(0, int(settings.value("Processes", 1)))
+        except (ValueError, TypeError):
+            self._growth_processes = 1
+        self._growth_incremental = toBool(settings.value("Incremental", 'false'))
+        settings.endGroup()
         self._point_editable = True
         self._point_selectable = True
         self._cell_editable = False
@@ -288,6 +297,11 @@ class Parameters(QObject):
         settings.setValue("ScaleAxis", self._ellipsis_scale_axis)
         settings.endGroup()
         settings.endGroup()
+# The growth computation parameters
+        settings.beginGroup("GrowthParameters")
+        settings.setValue("Processes", self._growth_processes)
+        settings.setValue("Incremental", self._growth_incremental)
+        settings.endGroup()
 
 #{ On Screen Drawing
 
@@ -799,6 +813,28 @@ class Parameters(QObject):
             recent_projects.pop()
         self.recentProjectsChange.emit()
 
+    @property
+    def growth_processes(self):
+        """Number of processes computing the growth and finding the cells to clean, 0 for one per processor"""
+        return self._growth_processes
+
+    @growth_processes.setter
+    def growth_processes(self, value):
+        self._growth_processes = max(0, int(value))
+
+    @property
+    def growth_incremental(self):
+        """
+        If True, the growth of the cells unchanged since the last computation saved in the same file is reused.
+
+        The incremental computation runs in a single process, so `growth_processes` is then ignored.
+        """
+        return self._growth_incremental
+
+    @growth_incremental.setter
+    def growth_incremental(self, value):
+        self._growth_incremental = bool(value)
+
 #}
 #{ User interaction parameters
 
@@ -13,7 +13,7 @@ from PyQt4.QtCore import (pyqtSignature, QObject, QThread, QEvent, QMutex, QCore
         QPoint, Qt, QRect, QSettings)
 from .ui_plottingdlg import Ui_PlottingDlg
 from .path import path
-from .growth_computation_methods import Result
+from .growth_computation_methods import LazyResult
 from . import parameters
 from . import image_cache
 from .plotting_methods import (createWallColoring, createCellColoring, createPointColoring,
@@ -22,7 +22,7 @@ from .plotting_methods import (createWallColoring, createCellColoring, createPoi
 from . import plotting_methods
 from .sys_utils import setColor, getColor, changeColor, cleanQObject
 from .plot_preview import PlotPreview
-from .debug import log_debug
+from .debug import log_debug, timed
 from .tracking_data import TrackingData, RetryTrackingDataException
 from .plottingoptionsdlg import PlottingOptionsDlg
 
@@ -955,6 +955,7 @@ class PlottingThread(QThread):
             return False
         return self.render_valid()
 
+    @timed("plotting.drawImage")
     def drawImage(self, imageid):
         cache = image_cache.cache
         cellColoring = self.cellColoring
@@ -1125,7 +1126,7 @@ class PlottingThread(QThread):
         self.cellColoring.init()
         self.wallColoring.init()
         self.pointColoring.init()
-        log_debug("Rendering image %d" % img)
+        log_debug("Rendering image %d", img)
         self.pix, self.pic_w, self.pic_c = self.drawImage(img)
         if self.pic_w is not None:
             log_debug("Has wall image")
@@ -1133,7 +1134,7 @@ class PlottingThread(QThread):
             log_debug("Has cell image")
         if self.pix is not None:
             log_debug("Pix correctly rendered")
-        log_debug("Rendered image %d  = %s" % (img, self.pix))
+        log_debug("Rendered image %d  = %s", img, self.pix)
         self.image_ready()
 
     def reload(self):
@@ -1142,6 +1143,7 @@ class PlottingThread(QThread):
         self._loading_arguments.update(self.retryObject.method_args)
         self.load(self.retryObject.filename)
 
+    @timed("plotting.load")
     def run_loader(self):
         filename = self.result
         try:
@@ -1152,7 +1154,7 @@ class PlottingThread(QThread):
             first_line = f.readline()
             f.close()
             if first_line.startswith("TRKR_VERSION"):
-                result = Result(None)
+                result = LazyResult(None)
                 result.load(self.result, **self._loading_arguments)
                 result_type = "Growth"
             else:
@@ -1194,15 +1196,15 @@ class PlottingThread(QThread):
                 r = QRectF(img.rect())
                 rbox = matrix.map(QPolygonF(r)).boundingRect()
                 bbox |= rbox
-                log_debug("Image '%s':\n\tSize = %gx%g\n\tTransformed = %gx%g %+g %+g\n\tGlobal bbox = %gx%g %+g %+g\n" %
-                             (img_name, r.width(), r.height(), rbox.width(), rbox.height(), rbox.left(), rbox.top(),
-                              bbox.width(), bbox.height(), bbox.left(), bbox.top()))
-                log_debug("Matrix:\n%g\t%g\t%g\n%g\t%g\t%g\n" %
-                            (matrix.m11(), matrix.m12(), matrix.dx(), matrix.m21(), matrix.m22(), matrix.dy()))
+                log_debug("Image '%s':\n\tSize = %gx%g\n\tTransformed = %gx%g %+g %+g\n\tGlobal bbox = %gx%g %+g %+g\n",
+                          img_name, r.width(), r.height(), rbox.width(), rbox.height(), rbox.left(), rbox.top(),
+                          bbox.width(), bbox.height(), bbox.left(), bbox.top())
+                log_debug("Matrix:\n%g\t%g\t%g\n%g\t%g\t%g\n",
+                          matrix.m11(), matrix.m12(), matrix.dx(), matrix.m21(), matrix.m22(), matrix.dy())
                 if result_type == "Growth":
-                    if result.cells[i]:
+                    if result.hasCells(i):
                         self.has_cells = True
-                    if result.walls[i]:
+                    if result.hasWalls(i):
                         self.has_walls = True
                     self.has_points = bool(result.data.cell_points)
                 self.nextImage()
@@ -3,13 +3,67 @@ __author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
 __docformat__ = "restructuredtext"
 from .path import path
 from .tracking_data import TrackingData, TrackingDataException
-from PyQt4.QtCore import QObject, QCoreApplication, Signal
+from .tracking_journal import EditJournal, replay, journalFile, isValid, saveData, setAside
+from PyQt4.QtCore import QObject, QCoreApplication, Signal, QEvent, QThread
 from PyQt4.QtGui import QImageReader
 from . import parameters
-from .debug import log_debug
+from .debug import log_debug, log_warning
 import re
 from .sys_utils import cleanQObject
 
+class DataSaved(QEvent):
+    """
+    Event notifying the GUI a background save is finished.
+
+    :IVariables:
+        project : `Project`
+            project whose data were saved
+        data_file : `path`
+            file written
+        journal : `tracking_journal.EditJournal`
+            journal recording the modifications made since the snapshot was taken
+        file_ids : (dict of int*int, dict of int*int) | None
+            ids of the points and cells in the file written, None if it couldn't be written
+        error : `TrackingDataException` | None
+            error raised while saving, if any
+    """
+    def __init__(self, project, data_file, journal, file_ids, error):
+        QEvent.__init__(self, QEvent.User)
+        self.project = project
+        self.data_file = data_file
+        self.journal = journal
+        self.file_ids = file_ids
+        self.error = error
+
+
+class SaveData(QThread):
+    """
+    Thread saving a snapshot of the data.
+
+    Once done, the thread send the event DataSaved to its parent.
+    """
+    def __init__(self, project, data_file, parent):
+        QThread.__init__(self, parent)
+        self.project = project
+        self.data_file = data_file
+        self.snapshot = project.data.snapshot()
+        self.journal = EditJournal(project.data, data_file)
+
+    def __del__(self):
+        cleanQObject(self)
+
+    def run(self):
+        error = None
+        file_ids = None
+        try:
+            file_ids = saveData(self.snapshot, self.data_file)
+        except (TrackingDataException, IOError, OSError) as ex:
+            error = ex if isinstance(ex, TrackingDataException) else TrackingDataException(str(ex))
+        self.snapshot = None
+        event = DataSaved(self.project, self.data_file, self.journal, file_ids, error)
+        QCoreApplication.instance().postEvent(self.parent(), event)
+
+
 class Project(QObject):
     changedDataFile = Signal(path)
 
@@ -17,6 +71,16 @@ class Project(QObject):
     Class maintaining a project and its directory structure
 
     :signal: ``changedDataFile --> data_file``
+
+    :IVariables:
+        journal : `tracking_journal.EditJournal`
+            journal of the modifications of the data, if the data file exists
+        recovered : bool
+            True if modifications not saved by the user were recovered from the journal when the data were loaded,
+            and were neither saved nor discarded since
+        discarded_journal : `path` | None
+            where the journal of the data file was moved when the data were loaded, if it didn't match the content
+            of the data file
     """
     def __init__(self, dir_):
         QObject.__init__(self)
@@ -30,6 +94,9 @@ class Project(QObject):
         self.images_dir = dir_/'Processed'
         self._valid_project = None
         self.data = None
+        self.journal = None
+        self.recovered = False
+        self.discarded_journal = None
 
     def __del__(self):
         cleanQObject(self)
@@ -93,6 +160,7 @@ class Project(QObject):
         file_ = path(file_)
         log_debug("Setting data file to %s" % (file_,))
         if file_ != self._data_file:
+            self.closeJournal()
             self._data_file = path(file_)
             self.changedDataFile.emit(self._data_file)
 
@@ -186,13 +254,114 @@ class Project(QObject):
             f.write("filter_size_ratio=%s\n" % params.filter_size_ratio)
             f.close()
 
+    def isJournaled(self, data_file=None):
+        """
+        :returns: True if saving in `data_file` only requires a checkpoint in the journal
+        :returntype: bool
+        """
+        if data_file is None:
+            data_file = self.data_file
+        data_file = path(data_file)
+        return self.journal is not None and data_file == self.data_file and data_file.exists()
+
     def save(self, data_file = None):
+        """
+        Save the data. If the data file is journaled, the modifications are only marked as saved in the journal: use
+        `saveInBackground` to write them in the data file.
+        """
         if data_file is None:
             data_file = self.data_file
-        self.data.save(data_file)
-        self.data_file = data_file
+        data_file = path(data_file)
+        if self.isJournaled(data_file):
+            self.journal.checkpoint()
+            self.data.saved.emit()
+        else:
+            if self.journal is not None:
+                self.journal.rollback()
+            file_ids = saveData(self.data, data_file)
+            self.data_file = data_file
+            self.openJournal(file_ids)
+        self.recovered = False
         self.write_config()
 
+    def saveInBackground(self, parent, data_file=None):
+        """
+        Start saving a snapshot of the data in a thread. The event `DataSaved` is sent to `parent` once the file is
+        written, and must be given to `finishSave`. Saving in the journaled data file compacts its journal.
+
+        :returntype: `SaveData`
+        """
+        if data_file is None:
+            data_file = self.data_file
+        thread = SaveData(self, path(data_file), parent)
+        thread.start()
+        return thread
+
+    def finishSave(self, event):
+        """
+        Use the file written by a background save as data file.
+
+        The modifications made during the save are journaled for the new file.
+
+        :returns: True if the file was written
+        :returntype: bool
+        """
+        journal = event.journal
+        if event.error is not None:
+            journal.close()
+            return False
+        if self.journal is not None:
+            self.journal.rollback()
+            self.closeJournal()
+        self.data_file = event.data_file
+        if journal.filename.exists():
+            journal.filename.remove()
+        journal.file_ids = event.file_ids
+        self.journal = journal
+        journal.commit()
+        self.recovered = False
+        self.write_config()
+        return True
+
+    def openJournal(self, file_ids=None):
+        """
+        Start journaling the modifications of the data, discarding any previous journal of the data file.
+
+        :Parameters:
+            file_ids : (dict of int*int, dict of int*int) | None
+                ids of the points and cells in the data file, if they are not those in memory
+        """
+        self.closeJournal()
+        journal = EditJournal(self.data, self.data_file, file_ids)
+        if journal.filename.exists():
+            journal.filename.remove()
+        self.journal = journal
+
+    def closeJournal(self):
+        """
+        Stop journaling the modifications.
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def discardJournal(self):
+        """
+        Drop the modifications not saved from the journal and stop journaling, as the data in memory are abandoned.
+        """
+        if self.journal is not None:
+            self.journal.rollback()
+            self.closeJournal()
+        self.recovered = False
+
+    def compactJournal(self):
+        """
+        Write the journaled modifications in the data file and remove the journal.
+        """
+        if self.journal is not None:
+            self.journal.compact()
+            self.closeJournal()
+
     def load(self, **opts):
         if self.data_file is None:
             raise TrackingDataException("No data file to be loaded.")
@@ -200,8 +369,22 @@ class Project(QObject):
         data = self.data
         if data is None or data.project_dir != self.main_dir:
             data = TrackingData(self.main_dir)
+        self.closeJournal()
+        self.recovered = False
+        self.discarded_journal = None
         if self.data_file.exists():
-            data.load(self.data_file, **opts)
+            jfile = journalFile(self.data_file)
+            if jfile.exists() and not isValid(self.data_file):
+                # The data file changed since the journal was written: its records don't apply anymore, but they are
+                # kept for the user
+                self.discarded_journal = setAside(self.data_file)
+                log_warning("The journal of %s doesn't match its content, it was moved to %s",
+                            self.data_file, self.discarded_journal)
+            data.load(self.data_file, journal=False, **opts)
+            if replay(data, self.data_file):
+                log_debug("Recovered unsaved modifications from the journal of %s" % self.data_file)
+                self.recovered = True
+            self.journal = EditJournal(data, self.data_file)
         else:
             data.images_name = self.images_name
             data.images_dir = self.images_dir
@@ -0,0 +1,229 @@
+from __future__ import print_function, division, absolute_import
+"""
+Spatial index on the positions of the points of an image.
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+import heapq
+from math import floor, sqrt
+import numpy
+from .geometry import pointsInPolygon
+
+
+class PointIndex(object):
+    """
+    Uniform grid over the positions of the points of one image.
+
+    The size of the grid cells is chosen when the index is built, to have a few points per cell on average. Modified
+    points are only marked by `invalidate`, and moved to their new cell by the next `update`. The index is rebuilt when
+    most of the points are modified.
+
+    All the positions are in the coordinates of the data, i.e. before the image is shifted or rotated.
+    """
+    POINTS_PER_CELL = 4
+    """
+    Average number of points in the non-empty cells of the grid
+
+    :type: int
+    """
+
+    def __init__(self):
+        self._rebuild = True
+        self._dirty = set()
+        self._cell_size = 1.
+        self._grid = {}
+        self._keys = {}
+        self._coords = {}
+        self._bounds = (0, 0, -1, -1)
+
+    def invalidate(self, pt_ids=None):
+        """
+        Mark points as modified. If `pt_ids` is None, all the points are invalid.
+        """
+        if pt_ids is None:
+            self._rebuild = True
+        elif not self._rebuild:
+            self._dirty.update(pt_ids)
+            if len(self._dirty) > len(self._keys) // 2:
+                self._rebuild = True
+
+    def update(self, positions):
+        """
+        Take the modifications into account.
+
+        :Parameters:
+            positions : dict of int*QPointF
+                Current positions of the points
+        """
+        if self._rebuild:
+            self._build(positions)
+            return
+        dirty = self._dirty
+        if not dirty:
+            return
+        grid = self._grid
+        keys = self._keys
+        coords = self._coords
+        cs = self._cell_size
+        for pt_id in dirty:
+            key = keys.pop(pt_id, None)
+            if key is not None:
+                cell = grid[key]
+                cell.discard(pt_id)
+                if not cell:
+                    del grid[key]
+                del coords[pt_id]
+            pos = positions.get(pt_id)
+            if pos is not None:
+                x, y = pos.x(), pos.y()
+                key = (int(floor(x/cs)), int(floor(y/cs)))
+                grid.setdefault(key, set()).add(pt_id)
+                keys[pt_id] = key
+                coords[pt_id] = (x, y)
+                self._extendBounds(key)
+        dirty.clear()
+
+    def _build(self, positions):
+        pt_ids = list(positions)
+        pts = numpy.array([(p.x(), p.y()) for p in positions.values()], dtype=float).reshape(-1, 2)
+        if len(pt_ids) > 1:
+            extent = pts.max(axis=0) - pts.min(axis=0)
+            area = extent[0]*extent[1]
+            if area <= 0:
+                area = max(extent.max(), 1.)**2
+            cell_size = sqrt(area*self.POINTS_PER_CELL/len(pt_ids))
+        else:
+            cell_size = 1.
+        self._cell_size = cell_size
+        cells = numpy.floor(pts/cell_size).astype(int)
+        grid = {}
+        keys = {}
+        for pt_id, key in zip(pt_ids, map(tuple, cells.tolist())):
+            grid.setdefault(key, set()).add(pt_id)
+            keys[pt_id] = key
+        self._grid = grid
+        self._keys = keys
+        self._coords = dict(zip(pt_ids, map(tuple, pts.tolist())))
+        if len(pt_ids):
+            low = cells.min(axis=0).tolist()
+            high = cells.max(axis=0).tolist()
+            self._bounds = (low[0], low[1], high[0], high[1])
+        else:
+            self._bounds = (0, 0, -1, -1)
+        self._rebuild = False
+        self._dirty.clear()
+
+    def _extendBounds(self, key):
+        x0, y0, x1, y1 = self._bounds
+        if x0 > x1:
+            self._bounds = key + key
+        else:
+            self._bounds = (min(x0, key[0]), min(y0, key[1]), max(x1, key[0]), max(y1, key[1]))
+
+    def _cellsIn(self, left, top, right, bottom):
+        """
+        Iterate over the points of the cells intersecting the rectangle
+        """
+        cs = self._cell_size
+        x0, y0, x1, y1 = self._bounds
+        grid = self._grid
+        for i in range(max(int(floor(left/cs)), x0), min(int(floor(right/cs)), x1)+1):
+            for j in range(max(int(floor(top/cs)), y0), min(int(floor(bottom/cs)), y1)+1):
+                cell = grid.get((i, j))
+                if cell:
+                    for pt_id in cell:
+                        yield pt_id
+
+    def nearest(self, pos, k=1, max_dist=None):
+        """
+        Find the points closest to a position.
+
+        :Parameters:
+            pos : QPointF
+                Position to look around
+            k : int
+                Maximum number of points returned
+            max_dist : float
+                If not None, points further than this are ignored
+
+        :returns: the ids of the points, sorted by increasing distance
+        :returntype: list of int
+        """
+        if not self._keys or k < 1:
+            return []
+        x, y = pos.x(), pos.y()
+        cs = self._cell_size
+        cx, cy = int(floor(x/cs)), int(floor(y/cs))
+        x0, y0, x1, y1 = self._bounds
+        max_ring = max(cx - x0, x1 - cx, cy - y0, y1 - cy)
+        grid = self._grid
+        coords = self._coords
+        best = []  # heap of (-dist², pt_id) for the k best points found
+        limit = max_dist*max_dist if max_dist is not None else None
+        ring = 0
+        while ring <= max_ring:
+            if ring == 0:
+                keys = [(cx, cy)]
+            else:
+                keys = [(cx+d, cy-ring) for d in range(-ring, ring+1)]
+                keys += [(cx+d, cy+ring) for d in range(-ring, ring+1)]
+                keys += [(cx-ring, cy+d) for d in range(-ring+1, ring)]
+                keys += [(cx+ring, cy+d) for d in range(-ring+1, ring)]
+            for key in keys:
+                cell = grid.get(key)
+                if not cell:
+                    continue
+                for pt_id in cell:
+                    px, py = coords[pt_id]
+                    d2 = (px-x)*(px-x) + (py-y)*(py-y)
+                    if limit is not None and d2 > limit:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, pt_id))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, pt_id))
+            # Points in the next rings are at least at this distance
+            reach = ring*cs
+            if limit is not None and reach*reach > limit:
+                break
+            if len(best) == k and -best[0][0] <= reach*reach:
+                break
+            ring += 1
+        return [pt_id for d2, pt_id in sorted(best, key=lambda b: (-b[0], b[1]))]
+
+    def within(self, rect):
+        """
+        :returns: the ids of the points inside the rectangle
+        :returntype: list of int
+        """
+        rect = rect.normalized()
+        left, top, right, bottom = rect.left(), rect.top(), rect.right(), rect.bottom()
+        coords = self._coords
+        result = []
+        for pt_id in self._cellsIn(left, top, right, bottom):
+            x, y = coords[pt_id]
+            if left <= x <= right and top <= y <= bottom:
+                result.append(pt_id)
+        return result
+
+    def withinPolygon(self, polygon):
+        """
+        :returns: the ids of the points inside the polygon
+        :returntype: list of int
+
+        :Parameters:
+            polygon : QPolygonF | list of QPointF
+                Polygon, whose inside is defined by the even-odd rule
+        """
+        vertices = numpy.array([(p.x(), p.y()) for p in polygon], dtype=float).reshape(-1, 2)
+        if vertices.shape[0] < 3:
+            return []
+        left, top = vertices.min(axis=0).tolist()
+        right, bottom = vertices.max(axis=0).tolist()
+        candidates = list(self._cellsIn(left, top, right, bottom))
+        if not candidates:
+            return []
+        coords = self._coords
+        pts = numpy.array([coords[pt_id] for pt_id in candidates], dtype=float)
+        inside = pointsInPolygon(pts, vertices)
+        return [pt_id for pt_id, ok in zip(candidates, inside.tolist()) if ok]
@@ -0,0 +1,297 @@
+from __future__ import print_function, division, absolute_import
+"""
+Generation of synthetic tracking data: a growing tissue whose cells divide over time.
+
+The tissue of the first image is the Voronoi diagram of seeds jittered around a square grid. At each following image,
+the tissue grows anisotropically, it is slightly deformed, and some of the cells divide along a line joining the
+middle part of two opposite walls. The new vertices are inserted in the neighbouring cells as well, so the cells stay
+a proper tiling of the tissue. Some of the walls are curved.
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+from math import sqrt
+import numpy
+from scipy.spatial import Voronoi
+from PyQt4.QtCore import QPointF
+from .tracking_data import TrackingData, LifeSpan, WallShapes
+from .geometry import polygonsSignedArea
+
+
+def _initialTissue(nb_cells, cell_size, rng):
+    """
+    :returns: the positions of the vertices and the polygons of the cells, oriented counter-clockwise
+    :returntype: (ndarray(N,2), list of list of int)
+    """
+    side = max(int(round(sqrt(nb_cells))), 1)
+    n = side + 2
+    gx, gy = numpy.meshgrid(numpy.arange(n), numpy.arange(n))
+    seeds = numpy.c_[gx.ravel(), gy.ravel()].astype(float)
+    seeds += rng.uniform(-0.35, 0.35, seeds.shape)
+    seeds *= cell_size
+    vor = Voronoi(seeds)
+    # The outer ring of seeds only bounds the regions kept
+    interior = ((gx > 0) & (gx < n-1) & (gy > 0) & (gy < n-1)).ravel()
+    regions = [vor.regions[vor.point_region[i]] for i in numpy.nonzero(interior)[0]]
+    regions = [r for r in regions if r and -1 not in r]
+    # Merge the ends of the very short walls, which would give degenerated cells
+    vertices = vor.vertices
+    merged = numpy.arange(len(vertices))
+
+    def find(p):
+        while merged[p] != p:
+            merged[p] = merged[merged[p]]
+            p = merged[p]
+        return p
+    min_length = 0.1*cell_size
+    for r in regions:
+        prev = r[-1]
+        for p in r:
+            if numpy.hypot(*(vertices[p] - vertices[prev])) < min_length:
+                merged[find(p)] = find(prev)
+            prev = p
+    roots = numpy.array([find(p) for p in range(len(vertices))])
+    polygons = []
+    for r in regions:
+        poly = [p for p, prev in zip(roots[r].tolist(), roots[r[-1:] + r[:-1]].tolist()) if p != prev]
+        if len(poly) > 2:
+            polygons.append(poly)
+    # Each merged vertex is at the center of the vertices it replaces
+    nb = len(vertices)
+    counts = numpy.bincount(roots, minlength=nb)
+    kept = numpy.unique(numpy.concatenate(polygons))
+    coords = numpy.c_[numpy.bincount(roots, vertices[:, 0], nb)[kept], numpy.bincount(roots, vertices[:, 1], nb)[kept]]
+    coords /= counts[kept][:, numpy.newaxis]
+    renumber = numpy.empty(nb, dtype=int)
+    renumber[kept] = numpy.arange(len(kept))
+    polygons = [renumber[poly].tolist() for poly in polygons]
+    starts = numpy.cumsum([0] + [len(p) for p in polygons[:-1]])
+    areas = polygonsSignedArea(coords[numpy.concatenate(polygons)], starts)
+    for poly, area in zip(polygons, areas):
+        if area < 0:
+            poly.reverse()
+    return coords, polygons
+
+
+class _Tissue(object):
+    """
+    Topology of the tissue while it is being generated.
+
+    :IVariables:
+        polygons : dict of int*list of int
+            points of each cell, including the cells already divided
+        edges : dict of (int,int)*int
+            cell on the left of each oriented wall, for the living cells
+        new_points : list of (int, int, float, int)
+            for each point added by a division: the two ends of the wall it splits, its relative position on the wall
+            and the image on which it appears
+        xs, ys : list of float
+            position of the points on the first image, used to choose the walls to split
+    """
+    def __init__(self, coords, polygons):
+        self.nb_points = len(coords)
+        self.xs = coords[:, 0].tolist()
+        self.ys = coords[:, 1].tolist()
+        self.polygons = dict(enumerate(polygons))
+        self.lifespans = dict((cid, LifeSpan(0)) for cid in self.polygons)
+        self.alive = list(self.polygons)
+        self.new_points = []
+        self.edges = {}
+        for cid, poly in self.polygons.items():
+            self._addEdges(cid, poly)
+
+    def _addEdges(self, cid, poly):
+        edges = self.edges
+        prev = poly[-1]
+        for pid in poly:
+            edges[prev, pid] = cid
+            prev = pid
+
+    def splitWall(self, cid, p1, p2, frac, time):
+        """
+        Insert a new point on the wall (p1,p2) of the cell cid, and in the cell on the other side of the wall.
+
+        :returns: the id of the new point
+        :returntype: int
+        """
+        new_pt = self.nb_points + len(self.new_points)
+        self.new_points.append((p1, p2, frac, time))
+        xs = self.xs
+        ys = self.ys
+        xs.append(xs[p1] + frac*(xs[p2] - xs[p1]))
+        ys.append(ys[p1] + frac*(ys[p2] - ys[p1]))
+        edges = self.edges
+        for c, a, b in ((cid, p1, p2), (edges.get((p2, p1)), p2, p1)):
+            if c is None:
+                continue
+            poly = self.polygons[c]
+            poly.insert(poly.index(b), new_pt)
+            del edges[a, b]
+            edges[a, new_pt] = c
+            edges[new_pt, b] = c
+        return new_pt
+
+    def divide(self, cid, time, rng):
+        """
+        Divide the cell between its longest wall and the wall the furthest from it
+        """
+        poly = self.polygons[cid]
+        n = len(poly)
+        xs = self.xs
+        ys = self.ys
+        walls = list(zip(poly, poly[1:] + poly[:1]))
+        lengths = [(xs[b]-xs[a])**2 + (ys[b]-ys[a])**2 for a, b in walls]
+        i = max(range(n), key=lengths.__getitem__)
+        a, b = walls[i]
+        mx, my = xs[a] + xs[b], ys[a] + ys[b]
+        others = [(i+k) % n for k in range(2, n-1)] or [(i+1) % n]
+        j = max(others, key=lambda k: (xs[walls[k][0]] + xs[walls[k][1]] - mx)**2 +
+                                      (ys[walls[k][0]] + ys[walls[k][1]] - my)**2)
+        w1 = walls[i]
+        w2 = walls[j]
+        m1 = self.splitWall(cid, w1[0], w1[1], rng.uniform(0.3, 0.7), time)
+        m2 = self.splitWall(cid, w2[0], w2[1], rng.uniform(0.3, 0.7), time)
+        i1 = poly.index(m1)
+        i2 = poly.index(m2)
+        if i1 < i2:
+            poly1 = poly[i1:i2+1]
+            poly2 = poly[i2:]+poly[:i1+1]
+        else:
+            poly1 = poly[i1:]+poly[:i2+1]
+            poly2 = poly[i2:i1+1]
+        cid1 = len(self.polygons)
+        cid2 = cid1 + 1
+        self.polygons[cid1] = poly1
+        self.polygons[cid2] = poly2
+        edges = self.edges
+        for a, b in zip(poly, poly[1:] + poly[:1]):
+            del edges[a, b]
+        self._addEdges(cid1, poly1)
+        self._addEdges(cid2, poly2)
+        ls = self.lifespans[cid]
+        ls.end = time
+        ls.daughters = (cid1, cid2)
+        ls.division = (m1, m2)
+        self.lifespans[cid1] = LifeSpan(time, parent=cid)
+        self.lifespans[cid2] = LifeSpan(time, parent=cid)
+        return cid1, cid2
+
+    def pointsTime(self):
+        """
+        :returns: the first image of each point
+        :returntype: list of int
+        """
+        return [0]*self.nb_points + [np[3] for np in self.new_points]
+
+
+def generateTissue(nb_cells, nb_frames=5, division_rate=0.1, growth=(1.08, 1.04), noise=0.2, curved_walls=0.3,
+                   cell_size=10., seed=None):
+    """
+    Generate a synthetic growing tissue.
+
+    :Parameters:
+        nb_cells : int
+            Approximate number of cells on the first image
+        nb_frames : int
+            Number of images
+        division_rate : float
+            Probability for a living cell to divide on each image after the first one
+        growth : (float, float)
+            Growth rate along the x and y axis, between two consecutive images
+        noise : float
+            Amplitude of the random displacement of the vertices between two images, relative to the size of the
+            cells
+        curved_walls : float
+            Proportion of the walls that are curved
+        cell_size : float
+            Average distance between the centers of two neighbouring cells on the first image
+        seed : int
+            Seed of the random number generator
+
+    :returns: the tracking data, with one image per time point named ``frame_000.png``, ``frame_001.png``, ...
+    :returntype: `TrackingData`
+    """
+    rng = numpy.random.RandomState(seed)
+    coords, polygons = _initialTissue(nb_cells, cell_size, rng)
+    tissue = _Tissue(coords, polygons)
+    for t in range(1, nb_frames):
+        alive = tissue.alive
+        dividing = set(c for c, d in zip(alive, rng.uniform(size=len(alive)) < division_rate) if d)
+        new_alive = []
+        for cid in alive:
+            if cid in dividing:
+                new_alive.extend(tissue.divide(cid, t, rng))
+            else:
+                new_alive.append(cid)
+        tissue.alive = new_alive
+    # Positions of the points on each image
+    center = coords.mean(axis=0)
+    offsets = numpy.zeros_like(coords)
+    wavelength = 8*cell_size
+    growth = numpy.asarray(growth, dtype=float)
+    points_time = tissue.pointsTime()
+    images = ["frame_%03d.png" % t for t in range(nb_frames)]
+    positions = {}
+    all_xs = []
+    all_ys = []
+    for t, img in enumerate(images):
+        if t > 0:
+            # Smooth displacement field, so neighbouring vertices move together and the cells don't fold
+            for k in range(4):
+                theta = rng.uniform(0, 2*numpy.pi)
+                direction = numpy.array([numpy.cos(theta), numpy.sin(theta)])*2*numpy.pi/wavelength
+                phase = coords.dot(direction) + rng.uniform(0, 2*numpy.pi)
+                offsets += numpy.sin(phase)[:, numpy.newaxis]*rng.normal(0, noise*cell_size/2, 2)
+        pos = center + (coords + offsets - center)*growth**t
+        xs = pos[:, 0].tolist()
+        ys = pos[:, 1].tolist()
+        for p1, p2, frac, start in tissue.new_points:
+            xs.append(xs[p1] + frac*(xs[p2] - xs[p1]))
+            ys.append(ys[p1] + frac*(ys[p2] - ys[p1]))
+        all_xs.append(xs)
+        all_ys.append(ys)
+        positions[img] = dict((pid, QPointF(xs[pid], ys[pid]))
+                              for pid, start in enumerate(points_time) if start <= t)
+    # Walls of the living cells, some of them curved
+    walls = WallShapes()
+    bulges = {}
+    lifespans = tissue.lifespans
+    profile = numpy.array([0.25, 0.5, 0.75])
+    profile_bulge = 4*profile*(1-profile)
+    for t in range(nb_frames):
+        walls.add_time(t)
+        xs = all_xs[t]
+        ys = all_ys[t]
+        done = set()
+        for cid, poly in tissue.polygons.items():
+            ls = lifespans[cid]
+            if ls.start > t or ls.end <= t:
+                continue
+            poly = [pid for pid in poly if points_time[pid] <= t]
+            for a, b in zip(poly, poly[1:] + poly[:1]):
+                key = (a, b) if a < b else (b, a)
+                if key in done:
+                    continue
+                done.add(key)
+                bulge = bulges.get(key)
+                if bulge is None:
+                    bulge = rng.uniform(-0.1, 0.1) if rng.uniform() < curved_walls else 0.
+                    bulges[key] = bulge
+                if bulge:
+                    p1, p2 = key
+                    dx = xs[p2] - xs[p1]
+                    dy = ys[p2] - ys[p1]
+                    # The deflection is limited, so thin cells are not folded by their walls
+                    length = sqrt(dx*dx + dy*dy)
+                    deflection = bulge*min(length, cell_size)/length*profile_bulge if length > 0 else 0*profile_bulge
+                    wall = numpy.c_[xs[p1] + profile*dx - deflection*dy,
+                                    ys[p1] + profile*dy + deflection*dx]
+                    walls.setWall(t, p1, p2, wall)
+    data = TrackingData()
+    data.images_name = images
+    cells = dict((cid, tuple(poly)) for cid, poly in tissue.polygons.items())
+    shifts = dict((img, [QPointF(0, 0), 0.]) for img in images)
+    scales = dict((img, (1., 1.)) for img in images)
+    data._set_data(positions, shifts, scales, cells, lifespans, [float(t) for t in range(nb_frames)], walls)
+    data._last_pt_id = len(points_time) - 1
+    data._last_cell_id = len(cells) - 1
+    return data
@@ -6,6 +6,7 @@ __author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
 from . import python2  # NOQA --> change python to match python3 better
 from PyQt4 import QtGui, QtCore
 import sys
+import logging
 from . import debug
 from .sys_utils import compileForm
 from .path import path
@@ -35,6 +36,7 @@ def createWindow():
     else:
         app = QtCore.QCoreApplication.instance()
     if "--nodebug" in sys.argv:
+        debug.log.setLevel(logging.INFO)
         debug.restore_io()
 # Loading the module after the QApplication is launched otherwise the list of
 # recognised images (determied when the module is loaded) is incomplete
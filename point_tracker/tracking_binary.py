@@ -0,0 +1,399 @@
+from __future__ import print_function, division, absolute_import
+"""
+Binary file format for the tracking data.
+
+The file is an uncompressed NumPy ``.npz`` archive. A small JSON header gives the version of the format, the images
+with their time, position and scaling, and the last ids used. The other sections are stored as separate arrays:
+
+``point_ids``
+    ids of all the points, sorted
+``presence_<n>``, ``positions_<n>``
+    for the n-th image, the mask of the points present and the (N,2) array of their positions
+``cell_ids``, ``cell_indptr``, ``cell_points``
+    cells in compressed sparse rows: the points of the i-th cell are ``cell_points[cell_indptr[i]:cell_indptr[i+1]]``
+``lifespans``
+    for each cell: start, end and parent, -1 meaning none
+``divisions``
+    for each divided cell: the cell, its two daughters and the two division points
+``wall_keys``, ``wall_indptr``, ``wall_coords``
+    for each wall shape: the time and the two points, and its intermediate points as a slice of ``wall_coords``
+
+Sections are only read when first used, so the list of images can be obtained without reading the points. When a
+file is loaded, the positions and the wall shapes are mapped in memory rather than read: the positions of an image are
+converted, and the walls of a time are read, the first time they are needed. As a mapped file cannot be removed on
+every system, `release` copies the mapped arrays in memory before a file is replaced.
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+import json
+import struct
+import threading
+import weakref
+import zipfile
+import numpy
+from PyQt4.QtCore import QPointF
+from .path import path
+from .tracking_data import (TrackingData, TrackingDataException, LifeSpan, EndOfTime, WallShapes, LazyPositions)
+
+FORMAT_NAME = "point_tracker-binary"
+"""
+Name identifying the format in the header
+
+:type: str
+"""
+
+FORMAT_VERSION = 1
+"""
+Current version of the binary format
+
+:type: int
+"""
+
+EXTENSION = ".npz"
+"""
+Extension of the files saved in the binary format
+
+:type: str
+"""
+
+
+_mapped = {}
+"""
+Storages of the data loaded from each file, which may still read arrays mapped from the file, by absolute name of the
+file
+
+:type: dict of `path`*(weakref.WeakValueDictionary of int*object), the storages being indexed by their id
+"""
+
+_mapped_lock = threading.Lock()
+
+
+def _addMapped(filename, storage):
+    """
+    Record that `storage` may read arrays mapped from `filename`, so they are copied in memory by `release`.
+    """
+    with _mapped_lock:
+        _mapped.setdefault(path(filename).abspath(), weakref.WeakValueDictionary())[id(storage)] = storage
+
+
+def release(filename):
+    """
+    Copy in memory the arrays mapped from `filename` by the data loaded from it, so the file can be removed or
+    replaced.
+    """
+    with _mapped_lock:
+        storages = _mapped.pop(path(filename).abspath(), None)
+    if storages is not None:
+        for storage in list(storages.values()):
+            storage.release()
+
+
+def isBinaryFile(filename):
+    """
+    :returns: True if the file is a binary tracking data file
+    :returntype: bool
+    """
+    filename = path(filename)
+    if not filename.isfile():
+        return False
+    with open(filename, "rb") as f:
+        return f.read(4) == b"PK\x03\x04"
+
+
+class BinaryTrackingFile(object):
+    """
+    Read access to a binary tracking data file, or to its sections already in memory.
+
+    Only the header is read when the file is opened. Each section is read the first time it is accessed.
+
+    :IVariables:
+        header : dict
+            content of the header of the file
+        images_name : list of str
+            name of the images, in order
+    """
+    def __init__(self, filename):
+        if isinstance(filename, dict):
+            self._archive = filename
+            self._filename = None
+        else:
+            self._archive = numpy.load(filename, allow_pickle=False)
+            self._filename = filename
+        self._sections = {}
+        try:
+            header = json.loads(str(self._archive["header"]))
+        except KeyError:
+            raise TrackingDataException("File '%s' is not a binary tracking data file." % filename)
+        if header.get("format") != FORMAT_NAME:
+            raise TrackingDataException("File '%s' is not a binary tracking data file." % filename)
+        if header["version"] > FORMAT_VERSION:
+            raise TrackingDataException("File '%s' uses version %d of the binary format, this program only reads up "
+                                        "to version %d." % (filename, header["version"], FORMAT_VERSION))
+        self.header = header
+        self.images_name = header["images"]
+
+    def close(self):
+        if not isinstance(self._archive, dict):
+            self._archive.close()
+
+    def __getitem__(self, name):
+        """
+        :returns: the section called `name`, reading it if necessary
+        :returntype: ndarray
+        """
+        sections = self._sections
+        if name not in sections:
+            sections[name] = self._archive[name]
+        return sections[name]
+
+    def mapped(self, name):
+        """
+        :returns: the section called `name`, mapped in memory if it is stored uncompressed in a file, or read
+            otherwise
+        :returntype: ndarray
+        """
+        if self._filename is None or name in self._sections:
+            return self[name]
+        info = self._archive.zip.getinfo(name + ".npy")
+        if info.compress_type != zipfile.ZIP_STORED:
+            return self[name]
+        with open(self._filename, "rb") as f:
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = numpy.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+        if dtype.hasobject or 0 in shape:
+            return self[name]
+        return numpy.memmap(self._filename, dtype=dtype, mode="r", shape=shape,
+                            order="F" if fortran_order else "C", offset=offset)
+
+    def positions(self, img_num):
+        """
+        :returns: the positions of the points present in the image number `img_num`, or an empty dictionary if the
+            positions of the image were not stored. The positions are only converted when first needed.
+        :returntype: dict of int*QPointF
+        """
+        if "positions_%d" % img_num not in self._archive:
+            return {}
+        present = self["presence_%d" % img_num]
+        ids = tuple(self["point_ids"][present].tolist())
+        coords = self.mapped("positions_%d" % img_num)
+        positions = LazyPositions(ids, coords)
+        if isinstance(coords, numpy.memmap):
+            _addMapped(self._filename, positions)
+        return positions
+
+    def cells(self):
+        """
+        :returns: the points of each cell
+        :returntype: dict of int*(tuple of int)
+        """
+        indptr = self["cell_indptr"].tolist()
+        points = self["cell_points"].tolist()
+        return dict((cid, tuple(points[start:end]))
+                    for cid, start, end in zip(self["cell_ids"].tolist(), indptr[:-1], indptr[1:]))
+
+    def lifespans(self):
+        """
+        :returns: the life span of each cell, including the divisions
+        :returntype: dict of int*`LifeSpan`
+        """
+        cells_lifespan = {}
+        for cid, (start, end, parent) in zip(self["cell_ids"].tolist(), self["lifespans"].tolist()):
+            cells_lifespan[cid] = LifeSpan(start, end if end >= 0 else EndOfTime(), parent if parent >= 0 else None)
+        for cid, d1, d2, p1, p2 in self["divisions"].tolist():
+            ls = cells_lifespan[cid]
+            ls.daughters = (d1, d2)
+            ls.division = (p1, p2)
+        return cells_lifespan
+
+    def walls(self):
+        """
+        :returntype: `WallShapes`
+        """
+        wall_shapes = WallShapes()
+        keys = self["wall_keys"]
+        indptr = self["wall_indptr"]
+        coords = self.mapped("wall_coords")
+        order = numpy.argsort(keys[:, 0], kind="mergesort")
+        bounds = numpy.searchsorted(keys[order, 0], numpy.arange(len(self.images_name) + 1))
+        for t in range(len(self.images_name)):
+            idx = order[bounds[t]:bounds[t+1]]
+            if not len(idx):
+                wall_shapes.add_time(t)
+                continue
+            starts = indptr[idx]
+            lengths = indptr[idx + 1] - starts
+            mapped = isinstance(coords, numpy.memmap) and (idx[1:] == idx[:-1] + 1).all()
+            if mapped:
+                # The walls of the time follow each other in the file: their points are read when first needed
+                wall_coords = coords[starts[0]:starts[0] + lengths.sum()]
+            else:
+                wall_coords = numpy.asarray(coords)[numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths) +
+                                                    numpy.arange(lengths.sum())]
+            walls = [(p1, p2) for p1, p2 in keys[idx, 1:].tolist()]
+            storage = wall_shapes.setLazyTimeWalls(t, walls, wall_coords, lengths)
+            if mapped:
+                _addMapped(self._filename, storage)
+        return wall_shapes
+
+
+def sections(data, images=None, point_ids=None, topology=True):
+    """
+    Convert the tracking data into the arrays stored in the binary format.
+
+    :Parameters:
+        data : `TrackingData`
+            data to convert
+        images : list of str
+            If not None, only the positions and walls of these images are converted
+        point_ids : ndarray of int
+            Sorted ids of all the points, if already known
+        topology : bool
+            If False, the header, the point ids, the cells and their life spans are not converted
+
+    :returns: the arrays, by name of section
+    :returntype: dict of str*ndarray
+    """
+    all_images = list(data.images_name)
+    if images is None:
+        images = all_images
+    sections = {}
+    if point_ids is None:
+        pts = set()
+        for img in all_images:
+            pts.update(data.data[img])
+        point_ids = numpy.array(sorted(pts), dtype=int)
+    if topology:
+        header = {"format": FORMAT_NAME,
+                  "version": FORMAT_VERSION,
+                  "images": all_images,
+                  "times": list(data.images_time),
+                  "shifts": [(data.images_shift[img][0].x(), data.images_shift[img][0].y(), data.images_shift[img][1])
+                             for img in all_images],
+                  "scales": [tuple(data.images_scale[img]) for img in all_images],
+                  "last_point_id": data._last_pt_id,
+                  "last_cell_id": data._last_cell_id}
+        sections["header"] = numpy.array(json.dumps(header))
+        sections["point_ids"] = point_ids
+    times = set()
+    for img in images:
+        img_num = all_images.index(img)
+        times.add(img_num)
+        pids, coords = data[img].coordinates()
+        order = numpy.argsort(numpy.array(pids, dtype=int), kind="mergesort")
+        present = numpy.zeros(point_ids.shape, dtype=bool)
+        present[numpy.searchsorted(point_ids, numpy.array(pids, dtype=int))] = True
+        sections["presence_%d" % img_num] = present
+        sections["positions_%d" % img_num] = coords[order]
+    if topology:
+        cids, lengths, points = data.cells.arrays()
+        sections["cell_ids"] = cids
+        sections["cell_indptr"] = numpy.concatenate(([0], numpy.cumsum(lengths)))
+        sections["cell_points"] = points
+        cells_lifespan = data.cells_lifespan
+        lifespans = [(ls[0], ls[1], ls[2]) for ls in (cells_lifespan[cid] for cid in cids.tolist())]
+        sections["lifespans"] = numpy.array(lifespans, dtype=int).reshape(-1, 3)
+        divisions = [(cid,) + ls.daughters + ls.division
+                     for cid, ls in ((cid, cells_lifespan[cid]) for cid in cids.tolist()) if ls.daughters is not None]
+        sections["divisions"] = numpy.array(divisions, dtype=int).reshape(-1, 5)
+    walls = data.walls
+    wall_keys = [key for key in walls if key[0] in times]
+    wall_coords = [walls.coordinates(t, p1, p2) for t, p1, p2 in wall_keys]
+    sections["wall_keys"] = numpy.array(wall_keys, dtype=int).reshape(-1, 3)
+    sections["wall_indptr"] = numpy.concatenate(([0], numpy.cumsum([len(w) for w in wall_coords], dtype=int)))
+    sections["wall_coords"] = numpy.concatenate(wall_coords + [numpy.empty((0, 2), dtype=float)])
+    return sections
+
+
+def save(data, filename):
+    """
+    Save the tracking data in the binary format.
+
+    :Parameters:
+        data : `TrackingData`
+            data to save
+        filename : str
+            file to write
+    """
+    filename = path(filename)
+    arrays = sections(data)
+    # The file may be mapped by data loaded from it: it is replaced rather than overwritten
+    part = path(filename + ".part")
+    with open(part, "wb") as f:
+        numpy.savez(f, **arrays)
+    release(filename)
+    if filename.exists():
+        filename.remove()
+    part.rename(filename)
+
+
+def load(filename):
+    """
+    Read a binary file.
+
+    :Parameters:
+        filename : str | dict of str*ndarray
+            file to read, or its sections as returned by `sections`
+
+    :returns: the arguments for `TrackingData._set_data`, and the last point and cell ids used
+    :returntype: (tuple, int, int)
+    """
+    trk = BinaryTrackingFile(filename)
+    try:
+        header = trk.header
+        images = trk.images_name
+        data = dict((img, trk.positions(img_num)) for img_num, img in enumerate(images))
+        shifts = dict((img, [QPointF(x, y), a]) for img, (x, y, a) in zip(images, header["shifts"]))
+        scales = dict((img, tuple(sc)) for img, sc in zip(images, header["scales"]))
+        args = (data, shifts, scales, trk.cells(), trk.lifespans(), header["times"], trk.walls())
+        return args, header["last_point_id"], header["last_cell_id"]
+    finally:
+        trk.close()
+
+
+def fromSections(sections):
+    """
+    Build a data set from the arrays returned by `sections`.
+
+    The cells are not cleaned, as they come from a valid data set. The images whose positions were not converted
+    have no point.
+
+    :returntype: `TrackingData`
+    """
+    args, last_pt_id, last_cell_id = load(sections)
+    data = TrackingData()
+    data._last_pt_id = last_pt_id
+    data._last_cell_id = last_cell_id
+    data._set_data(*args, clean=False)
+    return data
+
+
+def loadFrames(data, sections):
+    """
+    Replace the positions and walls of a data set built by `fromSections` by those of the images in `sections`. The
+    sections must also hold the header and point ids of the data set. The other images are left without point, so
+    only the images given stay in memory.
+
+    :returns: the images whose positions were given
+    :returntype: list of str
+    """
+    trk = BinaryTrackingFile(sections)
+    images = trk.images_name
+    data.setFrames(dict((img, trk.positions(img_num)) for img_num, img in enumerate(images)), trk.walls())
+    return [img for img_num, img in enumerate(images) if "positions_%d" % img_num in sections]
+
+
+def convert(source, target):
+    """
+    Convert a file between the text and the binary formats. The format of each file is guessed from its extension.
+    """
+    data = TrackingData()
+    data.load(source)
+    data.save(target)
@@ -9,14 +9,86 @@ from PyQt4.QtCore import QPointF, QObject, Signal
 from PyQt4.QtGui import QTransform
 from .path import path
 import csv
+import io
+import sys
+import threading
 import numpy
 from .utils import compare_versions
-from .debug import log_debug
-from .geometry import cross
+from .debug import log_debug, lazy, timed, count
+from .geometry import affineMatrix, transformCoordinates, polygonsSignedArea
+from .spatial_index import PointIndex
 from functools import total_ordering
+from collections import Counter
+from bisect import bisect_left
+try:
+    from collections.abc import Mapping, MutableMapping, MutableSet
+except ImportError:
+    from collections import Mapping, MutableMapping, MutableSet
 from .sys_utils import cleanQObject
 
 
+def _openCsv(filename, mode):
+    """
+    Open a file to be used with the csv module: in binary mode for Python 2, and as text without newline translation
+    for Python 3.
+    """
+    if sys.version_info[0] < 3:
+        return open(filename, mode + "b")
+    return io.open(filename, mode, newline="")
+
+
+def _readPositions(data, images, pids, rows):
+    """
+    Convert the lines of the point block of a TRK file into positions, converting all the coordinates at once.
+
+    :Parameters:
+        data : dict of str*(dict of int*QPointF)
+            Positions of the points in each image, to be filled
+        images : list of str
+            Name of the images, in the order of the columns
+        pids : list of int
+            Id of the point described on each line
+        rows : list of (list of str)
+            Lines of the point block, starting with the name of the point. Empty cells mark the points absent from an
+            image.
+    """
+    values = numpy.array(rows)[:, 1:]
+    missing = values == ''
+    if (missing[:, ::2] != missing[:, 1::2]).any():
+        raise TrackingDataException("Incorrect point block: some positions have a single coordinate.")
+    values[missing] = 'nan'
+    values = values.astype(float)
+    present = ~missing[:, ::2]
+    pids = numpy.array(pids)
+    for j, img in enumerate(images):
+        sel = present[:, j]
+        xs = values[sel, 2*j].tolist()
+        ys = values[sel, 2*j+1].tolist()
+        data[img].update(zip(pids[sel].tolist(), map(QPointF, xs, ys)))
+
+
+def _formatPositions(data, invert_images, invert_pts, num_columns):
+    """
+    Format the positions of the points as in the point block of a TRK file: one line per point, two columns per image,
+    coordinates converted with `str` and empty cells for the missing points.
+
+    The first column is left for the names of the points.
+
+    :returntype: ndarray of object
+    """
+    array = numpy.empty((len(invert_pts), num_columns), dtype=object)
+    array[...] = ''
+    for img, d in data.items():
+        if not d:
+            continue
+        col = 2*invert_images[img]+1
+        rows = [invert_pts[p] for p in d]
+        positions = list(d.values())
+        array[rows, col] = list(map(str, [p.x() for p in positions]))
+        array[rows, col+1] = list(map(str, [p.y() for p in positions]))
+    return array
+
+
 class TrackingDataException(Exception):
     """
     Exception launched by the `TrackingData` object when an error linked to the
@@ -44,6 +116,8 @@ class EndOfTime(object):
 
     Implemented as a singleton.
     """
+    __slots__ = ()
+
     def __new__(cls):
         if cls.instance is None:
             cls.instance = object.__new__(cls)
@@ -73,6 +147,9 @@ class EndOfTime(object):
 
 class LifeSpan(object):
     """
+    Once stored in a `TrackingData`, a life span is frozen: it may be shared with snapshots of the data set, so
+    modifying it raises an AttributeError. Modify a `copy` and store it back instead.
+
     Instance Variables
     ------------------
     start : int
@@ -80,10 +157,13 @@ class LifeSpan(object):
     parent : int|None
         id of the parent cell
     """
+    __slots__ = ('_start', '_end', '_parent', '_daughters', '_division', '_frozen')
+
     def __init__(self, start=0, end=EndOfTime(), parent=None, daughters=None, division=None):
-        self.start = start
+        self._frozen = False
+        self._start = start
         self._end = end
-        self.parent = parent
+        self._parent = parent
         if daughters is None:
             self._daughters = None
         else:
@@ -100,8 +180,55 @@ class LifeSpan(object):
         return txt.format(self.start, self.end, self.parent, self.daughters, self.division)
 
     def copy(self):
+        """
+        :returns: a modifiable copy of the life span
+        :returntype: `LifeSpan`
+        """
         return LifeSpan(self.start, self.end, self.parent, self.daughters, self.division)
 
+    def frozen(self):
+        """
+        :returns: the life span if it is frozen, or else a frozen copy
+        :returntype: `LifeSpan`
+        """
+        if self._frozen:
+            return self
+        ls = self.copy()
+        ls._frozen = True
+        return ls
+
+    def _checkWritable(self):
+        if self._frozen:
+            raise AttributeError("The life span is shared by the data set and cannot be modified: modify a copy")
+
+    @property
+    def start(self):
+        """
+        Start of the life span of the cell
+
+        :returntype: int
+        """
+        return self._start
+
+    @start.setter
+    def start(self, value):
+        self._checkWritable()
+        self._start = value
+
+    @property
+    def parent(self):
+        """
+        id of the parent cell
+
+        :returntype: int|None
+        """
+        return self._parent
+
+    @parent.setter
+    def parent(self, value):
+        self._checkWritable()
+        self._parent = value
+
     @property
     def end(self):
         """
@@ -116,12 +243,14 @@ class LifeSpan(object):
 
     @end.setter
     def end(self, value):
+        self._checkWritable()
         if value < 0:
             value = EndOfTime()
         self._end = value
 
     @end.deleter
     def end(self):
+        self._checkWritable()
         self._end = EndOfTime()
 
     @property
@@ -135,11 +264,13 @@ class LifeSpan(object):
 
     @daughters.setter
     def daughters(self, ds):
+        self._checkWritable()
         (d1, d2) = ds
         self._daughters = (d1, d2)
 
     @daughters.deleter
     def daughters(self):
+        self._checkWritable()
         self._daughters = None
 
     @property
@@ -153,11 +284,13 @@ class LifeSpan(object):
 
     @division.setter
     def division(self, ps):
+        self._checkWritable()
         (p1, p2) = ps
         self._division = (p1, p2)
 
     @division.deleter
     def division(self):
+        self._checkWritable()
         self._division = None
 
     def slice(self):
@@ -246,60 +379,793 @@ class LifeSpan(object):
             raise IndexError(idx)
 
 
+class LifeSpansView(Mapping):
+    """
+    Read-only view on the life spans of the cells of a data set.
+
+    The table is shared with the snapshots of the data set, and so are its `LifeSpan`, which are frozen.
+    """
+    __slots__ = ('_lifespans',)
+
+    def __init__(self, lifespans):
+        self._lifespans = lifespans
+
+    def __getitem__(self, cid):
+        return self._lifespans[cid]
+
+    def __iter__(self):
+        return iter(self._lifespans)
+
+    def __len__(self):
+        return len(self._lifespans)
+
+    def __contains__(self, cid):
+        return cid in self._lifespans
+
+    def get(self, cid, default=None):
+        return self._lifespans.get(cid, default)
+
+    def keys(self):
+        return self._lifespans.keys()
+
+    def values(self):
+        return self._lifespans.values()
+
+    def items(self):
+        return self._lifespans.items()
+
+    def __repr__(self):
+        return "LifeSpansView(%r)" % (self._lifespans,)
+
+
+class CellsStore(MutableMapping):
+    """
+    Mapping from cell ids to the tuple of their points ids.
+
+    The points of all the cells are packed in a single array of 32 bits integers. The offsets table associates to
+    each cell the slice of the buffer containing its points. As for the walls, changing a cell appends its new points
+    to the buffer and the buffer is compacted when too much space is wasted.
+
+    Copies share the buffer and the offsets table until one of them is modified.
+    """
+    __slots__ = ('_buffer', '_size', '_offsets', '_wasted', '_shared')
+
+    def __init__(self, cells=()):
+        self._buffer = numpy.empty((0,), dtype=numpy.int32)
+        self._size = 0
+        self._offsets = {}
+        self._wasted = 0
+        self._shared = False
+        if cells:
+            self.update(cells)
+
+    def __getitem__(self, cid):
+        start, end = self._offsets[cid]
+        return tuple(self._buffer[start:end].tolist())
+
+    def __setitem__(self, cid, pt_ids):
+        pt_ids = list(pt_ids)
+        n = len(pt_ids)
+        self._unshare()
+        if cid in self._offsets:
+            start, end = self._offsets.pop(cid)
+            self._wasted += end - start
+        if self._size + n > self._buffer.shape[0]:
+            self._reserve(n)
+        start = self._size
+        self._buffer[start:start+n] = pt_ids
+        self._size += n
+        self._offsets[cid] = (start, start+n)
+
+    def __delitem__(self, cid):
+        self._unshare()
+        start, end = self._offsets.pop(cid)
+        self._wasted += end - start
+
+    def __contains__(self, cid):
+        return cid in self._offsets
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def clear(self):
+        self._buffer = numpy.empty((0,), dtype=numpy.int32)
+        self._size = 0
+        self._offsets = {}
+        self._wasted = 0
+        self._shared = False
+
+    def __repr__(self):
+        return "CellsStore({%s})" % ", ".join("%s: %s" % (cid, pts) for cid, pts in self.items())
+
+    def copy(self):
+        """
+        :returns: a copy sharing the tables with this object
+        :returntype: `CellsStore`
+        """
+        copy = CellsStore()
+        copy._buffer = self._buffer
+        copy._size = self._size
+        copy._offsets = self._offsets
+        copy._wasted = self._wasted
+        copy._shared = self._shared = True
+        return copy
+
+    def _unshare(self):
+        """
+        Copy the offsets table if it is shared. Only the used part of the buffer is kept, so the next points are
+        written in a new buffer and the other owners are not affected.
+        """
+        if self._shared:
+            self._buffer = self._buffer[:self._size]
+            self._offsets = dict(self._offsets)
+            self._shared = False
+
+    def arrays(self):
+        """
+        :returns: the ids of the cells, the number of points in each cell and the points of all the cells, one cell
+            after the other
+        :returntype: (ndarray of int, ndarray of int, ndarray of int32)
+        """
+        offsets = self._offsets
+        cids = numpy.array(list(offsets), dtype=int)
+        slices = [offsets[cid] for cid in cids.tolist()]
+        lengths = numpy.array([end - start for start, end in slices], dtype=int)
+        buf = self._buffer
+        points = numpy.concatenate([buf[start:end] for start, end in slices] + [buf[:0]])
+        return cids, lengths, points
+
+    def _reserve(self, n):
+        """
+        Allocate a new buffer, large enough for n more points, and move the used points in it.
+        """
+        capacity = max(64, 2*(self._size - self._wasted + n))
+        buf = numpy.empty((capacity,), dtype=numpy.int32)
+        pos = 0
+        old_buf = self._buffer
+        offsets = self._offsets
+        for cid, (start, end) in offsets.items():
+            l = end - start
+            buf[pos:pos+l] = old_buf[start:end]
+            offsets[cid] = (pos, pos+l)
+            pos += l
+        self._buffer = buf
+        self._size = pos
+        self._wasted = 0
+
+
+class _PointCellsView(MutableSet):
+    """
+    Set of the cells containing a point, as stored in the compressed table of a `PointCells` object.
+
+    The set is copied in the table the first time it is modified.
+    """
+    __slots__ = ('_table', '_pt_id', '_row')
+
+    def __init__(self, table, pt_id, row):
+        self._table = table
+        self._pt_id = pt_id
+        self._row = row
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def _cells(self):
+        cells = self._table._changed.get(self._pt_id)
+        if cells is None:
+            return self._table._rowCells(self._row)
+        return cells
+
+    def __contains__(self, cid):
+        return cid in self._cells()
+
+    def __iter__(self):
+        return iter(self._cells())
+
+    def __len__(self):
+        return len(self._cells())
+
+    def __repr__(self):
+        return "{%s}" % ", ".join(str(cid) for cid in self._cells())
+
+    def add(self, cid):
+        self._table._detach(self._pt_id).add(cid)
+
+    def discard(self, cid):
+        self._table._detach(self._pt_id).discard(cid)
+
+
+class PointCells(MutableMapping):
+    """
+    Mapping from point ids to the set of cells containing them.
+
+    The bulk of the table is stored in compressed sparse rows: the sorted points ids, and for each of them the slice
+    of an array of cell ids. Points whose set of cells is modified are moved into a dictionary of sets, so changes
+    don't require rebuilding the arrays. The arrays are never modified in place, so copies share them, and share
+    the dictionary of sets until one of them is accessed.
+    """
+    __slots__ = ('_ids', '_indptr', '_cells', '_removed', '_changed', '_shared')
+
+    def __init__(self, content=()):
+        self._ids = numpy.empty((0,), dtype=int)
+        self._indptr = numpy.zeros((1,), dtype=int)
+        self._cells = numpy.empty((0,), dtype=numpy.int32)
+        self._removed = set()
+        self._changed = {}
+        self._shared = False
+        for pt_id, cells in dict(content).items():
+            self._changed[pt_id] = set(cells)
+
+    @staticmethod
+    def fromCells(cells, pt_ids=()):
+        """
+        Build the table of the cells containing each point.
+
+        :Parameters:
+            cells : `CellsStore`
+                Cells of the data set
+            pt_ids : iter of int
+                Points to include in the table, even if they are not part of any cell
+
+        :returntype: `PointCells`
+        """
+        table = PointCells()
+        cids, lengths, points = cells.arrays()
+        pairs = numpy.unique((points.astype(numpy.int64) << 32) | numpy.repeat(cids, lengths))
+        pair_points = pairs >> 32
+        ids = numpy.union1d(pair_points, numpy.fromiter(pt_ids, dtype=int))
+        table._ids = ids
+        table._indptr = numpy.concatenate(([0], numpy.searchsorted(pair_points, ids, side='right')))
+        table._cells = (pairs & 0xffffffff).astype(numpy.int32)
+        return table
+
+    def _row(self, pt_id):
+        ids = self._ids
+        row = int(ids.searchsorted(pt_id))
+        if row < len(ids) and ids[row] == pt_id and pt_id not in self._removed:
+            return row
+        return None
+
+    def _rowCells(self, row):
+        return self._cells[self._indptr[row]:self._indptr[row+1]].tolist()
+
+    def _detach(self, pt_id):
+        """
+        Move the cells of the point from the compressed table to the dictionary of sets.
+        """
+        self._unshare()
+        cells = self._changed.get(pt_id)
+        if cells is None:
+            row = self._row(pt_id)
+            cells = set(self._rowCells(row)) if row is not None else set()
+            if row is not None:
+                self._removed.add(pt_id)
+            self._changed[pt_id] = cells
+        return cells
+
+    def __getitem__(self, pt_id):
+        # The sets are returned to the caller, who may modify them
+        self._unshare()
+        cells = self._changed.get(pt_id)
+        if cells is not None:
+            return cells
+        row = self._row(pt_id)
+        if row is None:
+            raise KeyError(pt_id)
+        return _PointCellsView(self, pt_id, row)
+
+    def __setitem__(self, pt_id, cells):
+        self._unshare()
+        if self._row(pt_id) is not None:
+            self._removed.add(pt_id)
+        self._changed[pt_id] = cells if isinstance(cells, set) else set(cells)
+
+    def __delitem__(self, pt_id):
+        self._unshare()
+        if pt_id in self._changed:
+            del self._changed[pt_id]
+        elif self._row(pt_id) is not None:
+            self._removed.add(pt_id)
+        else:
+            raise KeyError(pt_id)
+
+    def __contains__(self, pt_id):
+        return pt_id in self._changed or self._row(pt_id) is not None
+
+    def __iter__(self):
+        removed = self._removed
+        for pt_id in self._ids.tolist():
+            if pt_id not in removed:
+                yield pt_id
+        for pt_id in list(self._changed):
+            yield pt_id
+
+    def __len__(self):
+        return len(self._ids) - len(self._removed) + len(self._changed)
+
+    def pairs(self):
+        """
+        :returns: the point and cell of each pair of a point and a cell containing it
+        :returntype: (ndarray of int64, ndarray of int64)
+        """
+        counts = numpy.diff(self._indptr)
+        pts = numpy.repeat(self._ids.astype(numpy.int64), counts)
+        cids = self._cells.astype(numpy.int64)
+        if self._removed:
+            # The removed points all have a row in the table
+            kept = numpy.ones(len(self._ids), dtype=bool)
+            kept[self._ids.searchsorted(numpy.fromiter(self._removed, dtype=int))] = False
+            kept = numpy.repeat(kept, counts)
+            pts = pts[kept]
+            cids = cids[kept]
+        changed = self._changed
+        if changed:
+            changed_counts = [len(cells) for cells in changed.values()]
+            pts = numpy.concatenate((pts, numpy.repeat(numpy.fromiter(changed, dtype=numpy.int64, count=len(changed)),
+                                                       changed_counts)))
+            cids = numpy.concatenate((cids, numpy.fromiter((c for cells in changed.values() for c in cells),
+                                                           dtype=numpy.int64, count=sum(changed_counts))))
+        return pts, cids
+
+    def clear(self):
+        self._ids = numpy.empty((0,), dtype=int)
+        self._indptr = numpy.zeros((1,), dtype=int)
+        self._cells = numpy.empty((0,), dtype=numpy.int32)
+        self._removed = set()
+        self._changed = {}
+        self._shared = False
+
+    def __repr__(self):
+        return "PointCells({%s})" % ", ".join("%s: %s" % (pt_id, self[pt_id]) for pt_id in self)
+
+    def copy(self):
+        """
+        :returns: a copy sharing the tables with this object
+        :returntype: `PointCells`
+        """
+        copy = PointCells()
+        copy._ids = self._ids
+        copy._indptr = self._indptr
+        copy._cells = self._cells
+        copy._removed = self._removed
+        copy._changed = self._changed
+        copy._shared = self._shared = True
+        return copy
+
+    def _unshare(self):
+        """
+        Copy the dictionary of sets if it is shared.
+        """
+        if self._shared:
+            self._removed = set(self._removed)
+            self._changed = dict((pt_id, set(cells)) for pt_id, cells in self._changed.items())
+            self._shared = False
+
+
+def _wallCoordinates(pts):
+    """
+    Convert a wall shape given as a `WallShape`, a list of `QPointF` or an array into a (N,2) array of floats.
+    """
+    if isinstance(pts, WallShape):
+        return pts.coordinates()
+    if isinstance(pts, numpy.ndarray):
+        return pts.reshape(-1, 2).astype(float)
+    return numpy.array([(p.x(), p.y()) for p in pts], dtype=float).reshape(-1, 2)
+
+
+class WallShape(object):
+    """
+    Read-only view on the intermediate points of a wall.
+
+    The view behaves like a sequence of `QPointF`, but the positions are only converted when accessed. Adding a view
+    to a list (or a list to a view) creates a new list. The reversed wall is itself a view on the same memory.
+    """
+    __slots__ = ('_coords',)
+
+    def __init__(self, coords):
+        self._coords = coords
+
+    def coordinates(self):
+        """
+        :returns: the read-only array of coordinates, one point per line
+        :returntype: ndarray(N,2)
+        """
+        return self._coords
+
+    def __len__(self):
+        return self._coords.shape[0]
+
+    def __bool__(self):
+        return self._coords.shape[0] > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for x, y in self._coords.tolist():
+            yield QPointF(x, y)
+
+    def __reversed__(self):
+        return iter(self[::-1])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return WallShape(self._coords[idx])
+        x, y = self._coords[idx]
+        return QPointF(x, y)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        try:
+            return numpy.array_equal(self._coords, _wallCoordinates(other))
+        except (AttributeError, TypeError, ValueError):
+            return False
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __repr__(self):
+        return "WallShape(%s)" % (self._coords.tolist(),)
+
+
+_empty_coords = numpy.zeros((0, 2), dtype=float)
+_empty_coords.flags.writeable = False
+
+
+class _TimeWalls(object):
+    """
+    Storage of the walls at a given time.
+
+    All the intermediate points are packed in a single array of coordinates. The offsets table associates to each wall
+    (p1,p2), with p1 < p2, the slice of the buffer containing its points.
+
+    Wall shapes are never overwritten: a new shape is appended to the buffer and the old slice becomes unreachable.
+    This way, views returned to the caller are never modified. The buffer is compacted when too much space is wasted.
+    """
+    __slots__ = ('buffer', 'size', 'offsets', 'wasted')
+
+    def __init__(self):
+        self.buffer = _empty_coords
+        self.size = 0
+        self.offsets = {}
+        self.wasted = 0
+
+    def copy(self):
+        """
+        :returns: a copy sharing the used part of the buffer, so the copy writes its next walls in a new buffer
+        :returntype: `_TimeWalls`
+        """
+        copy = _TimeWalls()
+        copy.buffer = self.buffer[:self.size]
+        copy.size = self.size
+        copy.offsets = dict(self.offsets)
+        copy.wasted = self.wasted
+        return copy
+
+    def fill(self, walls, coords, lengths):
+        """
+        Replace the walls by walls given as packed arrays, see `WallShapes.setTimeWalls`.
+        """
+        ends = numpy.cumsum(lengths, dtype=int)
+        buf = numpy.array(coords, dtype=float).reshape(-1, 2)
+        buf.flags.writeable = False
+        self.buffer = buf
+        self.size = buf.shape[0]
+        self.offsets = dict(zip(walls, zip((ends - lengths).tolist(), ends.tolist())))
+        self.wasted = self.size - sum(end - start for start, end in self.offsets.values())
+
+    def view(self, key):
+        start, end = self.offsets[key]
+        return self.buffer[start:end]
+
+    def set(self, key, coords):
+        n = coords.shape[0]
+        if key in self.offsets:
+            start, end = self.offsets.pop(key)
+            self.wasted += end - start
+        if n == 0:
+            self.offsets[key] = (0, 0)
+            return
+        if self.size + n > self.buffer.shape[0]:
+            self._reserve(n)
+        start = self.size
+        buf = self.buffer
+        buf.flags.writeable = True
+        buf[start:start+n] = coords
+        buf.flags.writeable = False
+        self.size += n
+        self.offsets[key] = (start, start+n)
+
+    def remove(self, key):
+        start, end = self.offsets.pop(key)
+        self.wasted += end - start
+
+    def transform(self, mat):
+        """
+        Apply the 2x3 affine matrix on all the points at once.
+        """
+        if self.size:
+            buf = transformCoordinates(mat, self.buffer[:self.size])
+            buf.flags.writeable = False
+            self.buffer = buf
+
+    def _reserve(self, n):
+        """
+        Allocate a new buffer, large enough for n more points, and move the used points in it.
+        """
+        used = self.size - self.wasted
+        capacity = max(16, 2*(used + n))
+        buf = numpy.empty((capacity, 2), dtype=float)
+        pos = 0
+        offsets = self.offsets
+        old_buf = self.buffer
+        for key, (start, end) in offsets.items():
+            l = end - start
+            if l:
+                buf[pos:pos+l] = old_buf[start:end]
+                offsets[key] = (pos, pos+l)
+                pos += l
+        buf.flags.writeable = False
+        self.buffer = buf
+        self.size = pos
+        self.wasted = 0
+
+
+_lazy_lock = threading.RLock()
+"""
+Lock protecting the first access to the lazy storages, which can be shared between threads through snapshots
+"""
+
+
+class _LazyTimeWalls(_TimeWalls):
+    """
+    Storage of the walls at a given time, filled from packed arrays the first time it is accessed.
+
+    The arrays can be mapped from a file: they are only read when one of the attributes of `_TimeWalls` is needed.
+    """
+    __slots__ = ('_source', '__weakref__')
+
+    def __init__(self, walls, coords, lengths):
+        self._source = (walls, coords, lengths)
+
+    def packed(self):
+        """
+        :returns: the arrays the walls are read from, as given to `fill`, or None if they were already read
+        :returntype: (list of (int,int), ndarray(N,2), ndarray of int)
+        """
+        return self._source
+
+    def release(self):
+        """
+        Copy in memory the coordinates of the walls, if they are mapped from a file.
+        """
+        with _lazy_lock:
+            source = self._source
+            if source is not None:
+                walls, coords, lengths = source
+                self._source = (walls, numpy.array(coords), lengths)
+
+    def __getattr__(self, name):
+        if name not in _TimeWalls.__slots__:
+            raise AttributeError(name)
+        with _lazy_lock:
+            source = self._source
+            if source is not None:
+                self.fill(*source)
+                self._source = None
+        return object.__getattribute__(self, name)
+
+
+class _Positions(dict):
+    """
+    Positions of the points of an image, once the positions of a `LazyPositions` are created.
+    """
+    __slots__ = ('_ids', '_coords', '__weakref__')
+
+    def __reduce__(self):
+        return (dict, (dict(self.items()),))
+
+    def release(self):
+        """
+        Copy in memory the coordinates of the points, if they are mapped from a file.
+        """
+        with _lazy_lock:
+            if self._ids is not None:
+                self._coords = numpy.array(self._coords)
+
+
+class LazyPositions(_Positions):
+    """
+    Positions of the points of an image, whose `QPointF` are only created the first time a position is needed.
+
+    The ids of the points are known from the start, so iterating on the points, counting them or testing if a point
+    is present doesn't create the positions, and `positionsArray` reads the coordinates directly. Any other access
+    creates all of them, after which the object becomes a normal dictionary.
+    """
+    __slots__ = ()
+
+    def __init__(self, ids, coords):
+        """
+        :Parameters:
+            ids : tuple of int
+                Ids of the points
+            coords : ndarray(N,2)
+                Positions of the points, in the same order
+        """
+        dict.__init__(self)
+        self._ids = ids
+        self._coords = coords
+
+    def _load(self):
+        with _lazy_lock:
+            if self._ids is not None:
+                coords = numpy.asarray(self._coords)
+                dict.update(self, zip(self._ids, map(QPointF, coords[:, 0].tolist(), coords[:, 1].tolist())))
+                self._coords = None
+                self._ids = None
+                self.__class__ = _Positions
+
+    def __iter__(self):
+        ids = self._ids
+        if ids is not None:
+            return iter(ids)
+        return dict.__iter__(self)
+
+    def __len__(self):
+        ids = self._ids
+        if ids is not None:
+            return len(ids)
+        return dict.__len__(self)
+
+    def keys(self):
+        ids = self._ids
+        if ids is not None:
+            return ids
+        return dict.keys(self)
+
+    def __contains__(self, key):
+        ids = self._ids
+        if ids is not None:
+            pos = bisect_left(ids, key)
+            return pos < len(ids) and ids[pos] == key
+        return dict.__contains__(self, key)
+
+    def __missing__(self, key):
+        if self._ids is None:
+            raise KeyError(key)
+        self._load()
+        return dict.__getitem__(self, key)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyPositions):
+            other._load()
+        self._load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    __hash__ = None
+
+
+def positionsArray(positions, pt_ids):
+    """
+    :Parameters:
+        positions : dict of int*QPointF
+            Positions of the points of an image
+        pt_ids : iterable of int
+            Ids of points of the image
+
+    :returns: the coordinates of the points `pt_ids`
+    :returntype: ndarray(N,2)
+    """
+    pt_ids = numpy.asarray(pt_ids).tolist()
+    if isinstance(positions, LazyPositions):
+        with _lazy_lock:
+            ids = positions._ids
+            if ids is not None:
+                # Few points are looked up one by one, rather than converting all the ids of the image
+                if len(pt_ids) * 16 < len(ids):
+                    index = [bisect_left(ids, pt_id) for pt_id in pt_ids]
+                else:
+                    index = numpy.array(ids, dtype=numpy.int64).searchsorted(pt_ids).tolist()
+                for pt_id, i in zip(pt_ids, index):
+                    if i == len(ids) or ids[i] != pt_id:
+                        raise KeyError(pt_id)
+                return numpy.array(positions._coords[index], dtype=float).reshape(-1, 2)
+    pos = [positions[pt_id] for pt_id in pt_ids]
+    return numpy.array([(p.x(), p.y()) for p in pos], dtype=float).reshape(-1, 2)
+
+
+def _loadPositions(name):
+    """
+    :returns: the method `name` of the dictionary, creating the positions of a `LazyPositions` first
+    """
+    method = getattr(dict, name)
+
+    def loaded(self, *args, **kwords):
+        if self._ids is not None:
+            self._load()
+        return method(self, *args, **kwords)
+    loaded.__name__ = name
+    loaded.__doc__ = method.__doc__
+    return loaded
+
+for _name in ["__repr__", "__setitem__", "__delitem__", "get", "values", "items", "copy", "pop",
+              "popitem", "setdefault", "update", "clear", "iterkeys", "itervalues", "iteritems", "has_key",
+              "viewkeys", "viewvalues", "viewitems"]:
+    if hasattr(dict, _name):
+        setattr(LazyPositions, _name, _loadPositions(_name))
+del _name
+
+
 class TimedWallShapes(object):
     """
     Represent the wall shapes at a given time
     """
     def __init__(self, ws, time):
-        self._data = ws[time]
+        self._walls = ws
+        self._time = time
 
     def __contains__(self, ps):
         (p1, p2) = ps
-        return (p1, p2) in self._data
+        return (self._time, p1, p2) in self._walls
 
     def __getitem__(self, ps):
         (p1, p2) = ps
-        try:
-            if p1 < p2:
-                return self._data[p1, p2][:]
-            else:
-                return self._data[p2, p1][::-1]
-        except KeyError:
-            return []
+        return self._walls[self._time, p1, p2]
+
+    def coordinates(self, p1, p2):
+        """
+        :returns: the read-only array of coordinates of the wall (p1,p2)
+        :returntype: ndarray(N,2)
+        """
+        return self._walls.coordinates(self._time, p1, p2)
 
     def __setitem__(self, ps, values):
         (p1, p2) = ps
-        if p1 < p2:
-            self._data[p1, p2] = values[:]
-        else:
-            self._data[p2, p1] = values[::-1]
+        self._walls.setWall(self._time, p1, p2, values)
 
     def __delitem__(self, ps):
-        (t, p1, p2) = ps
-        if (p1, p2) in self._data:
-            del self._data[p1, p2]
+        (p1, p2) = ps
+        self._walls.removeWall(self._time, p1, p2)
 
     def __iter__(self):
-        return iter(self._data)
+        return self._walls.walls(self._time)
 
     def __len__(self):
-        return len(self._data)
+        return self._walls.nbWalls(self._time)
 
 
 class WallShapes(object):
     """
-    Store wall shapes without duplication. The real data structure is a dictionnary associating,
-    for each time, a dictionnary.
+    Store wall shapes without duplication. For each time, the intermediate points of all the walls are packed in a
+    single array of coordinates and an offset table associates each couple of points with its part of the array.
 
-    The inner dictionnary stores, for each couple of points, the list of intermediate points.
+    Note that the __getitem__ returns a *read-only view* on the points, as a `WallShape`. To change a wall, use
+    `setWall` (or the item assignment) and `removeWall` (or `del`).
 
-    Note that the __getitem__ returns a *copy* of the points.
+    :IVariables:
+        changes : list of (set of (int,int,int))
+            The walls (t,p1,p2), with p1 < p2, modified are added to each of these sets.
+        _shared : set of int
+            times whose storage is shared with a snapshot, and must be copied before being modified
     """
     def __init__(self, content=None):
         self._walls = {}
+        self._shared = set()
+        self.changes = []
         if content is not None:
             for t, p1, p2 in content:
-                self[t, p1, p2] = content[t, p1, p2]
+                self.setWall(t, p1, p2, content.coordinates(t, p1, p2))
 
     def __repr__(self):
         return "WallShapes({%s})" % ", ".join(["%s: %s" % (val, self[val]) for val in self])
@@ -308,65 +1174,200 @@ class WallShapes(object):
         s = "WallShapes:"
         for t in self._walls:
             s += "\n\tTime %s:" % t
-            s += "".join("\n\t\t%s - %s: %s" % (p1, p2, self._walls[t][p1, p2])
-                         for p1, p2 in self._walls[t])
+            tw = self._walls[t]
+            s += "".join("\n\t\t%s - %s: %s" % (p1, p2, tw.view((p1, p2)).tolist())
+                         for p1, p2 in tw.offsets)
         if not self._walls:
             s += "\n\tempty"
         return s
 
     def add_time(self, t):
         if t not in self._walls:
-            self._walls[t] = {}
+            self._walls[t] = _TimeWalls()
+
+    def snapshot(self):
+        """
+        :returns: a copy sharing the storage of each time with this object until one of them modifies it
+        :returntype: `WallShapes`
+        """
+        snapshot = WallShapes()
+        snapshot._walls = dict(self._walls)
+        snapshot._shared = set(self._walls)
+        self._shared.update(self._walls)
+        return snapshot
+
+    def _writable(self, t):
+        """
+        :returns: the storage of the walls at time t, copied first if it is shared
+        :returntype: `_TimeWalls`
+        """
+        tw = self._walls.get(t)
+        if tw is not None and t in self._shared:
+            tw = tw.copy()
+            self._walls[t] = tw
+            self._shared.discard(t)
+        return tw
 
     def __delitem__(self, ps):
         (t, p1, p2) = ps
-        if t in self._walls:
-            if (p1, p2) in self._walls[t]:
-                del self._walls[t][p1, p2]
+        self.removeWall(t, p1, p2)
+
+    def removeWall(self, t, p1, p2):
+        """
+        Remove the wall (p1,p2) at time t, if it exists.
+        """
+        if p1 > p2:
+            p1, p2 = p2, p1
+        tw = self._walls.get(t)
+        if tw is not None and (p1, p2) in tw.offsets:
+            tw = self._writable(t)
+            tw.remove((p1, p2))
+            for changes in self.changes:
+                changes.add((t, p1, p2))
 
     def __contains__(self, ps):
         (t, p1, p2) = ps
-        return t in self._walls and (p1, p2) in self._walls[t]
+        return t in self._walls and (p1, p2) in self._walls[t].offsets
+
+    def coordinates(self, t, p1, p2):
+        """
+        :returns: the read-only array of coordinates of the wall (p1,p2) at time t. If p1 > p2, the array is a
+            reversed view.
+        :returntype: ndarray(N,2)
+        """
+        tw = self._walls.get(t)
+        if p1 > p2:
+            if tw is None or (p2, p1) not in tw.offsets:
+                return _empty_coords
+            return tw.view((p2, p1))[::-1]
+        if tw is None or (p1, p2) not in tw.offsets:
+            return _empty_coords
+        return tw.view((p1, p2))
 
     def __getitem__(self, i):
         try:
             time, p1, p2 = i
-            revert = False
-            if p1 > p2:
-                p1, p2 = p2, p1
-                revert = True
-            if revert:
-                return self._walls[time][p1, p2][::-1]
-            else:
-                return self._walls[time][p1, p2][:]  # Force copy of the points
-        except KeyError:
-            return []
-        except:
-            if not i in self._walls:
-                self._walls[i] = {}
-            return self._walls[i]
+        except TypeError:
+            self.add_time(i)
+            return TimedWallShapes(self, i)
+        return WallShape(self.coordinates(time, p1, p2))
 
     def __setitem__(self, ps, pts):
         (time, p1, p2) = ps
+        self.setWall(time, p1, p2, pts)
+
+    def setWall(self, t, p1, p2, pts):
+        """
+        Set the shape of the wall (p1,p2) at time t.
+
+        :Parameters:
+            pts : `WallShape` | list of `QPointF` | ndarray(N,2)
+                Intermediate points, from p1 to p2
+        """
+        coords = _wallCoordinates(pts)
         if p1 > p2:
             p1, p2 = p2, p1
-            pts = pts[::-1]
-        if not time in self._walls:
-            self._walls[time] = {(p1, p2): pts}
-        else:
-            self._walls[time][p1, p2] = pts
+            coords = coords[::-1]
+        self.add_time(t)
+        self._writable(t).set((p1, p2), coords)
+        for changes in self.changes:
+            changes.add((t, p1, p2))
+
+    def setTimeWalls(self, t, walls, coords, lengths):
+        """
+        Replace all the walls at time t by walls given as packed arrays.
+
+        :Parameters:
+            walls : list of (int,int)
+                Walls (p1,p2), with p1 < p2. If a wall is given twice, the last shape is kept.
+            coords : ndarray(N,2)
+                Intermediate points of all the walls, one wall after the other
+            lengths : ndarray of int
+                Number of intermediate points of each wall
+        """
+        tw = _TimeWalls()
+        tw.fill(walls, coords, lengths)
+        self._walls[t] = tw
+        self._shared.discard(t)
+        for changes in self.changes:
+            changes.update((t, p1, p2) for p1, p2 in walls)
+
+    def setLazyTimeWalls(self, t, walls, coords, lengths):
+        """
+        Replace all the walls at time t by walls given as packed arrays, like `setTimeWalls`, but only read the
+        arrays the first time the walls at time t are accessed.
+
+        The modified walls are not recorded in `changes`.
+
+        :returns: the storage of the walls at time t, see `tracking_binary.release`
+        :returntype: `_LazyTimeWalls`
+        """
+        storage = self._walls[t] = _LazyTimeWalls(walls, coords, lengths)
+        self._shared.discard(t)
+        return storage
+
+    def transform(self, t, mat):
+        """
+        Apply the 2x3 affine matrix `mat` on all the wall shapes at time t, in a single operation.
+
+        Views obtained before the transformation keep the old positions.
+        """
+        tw = self._writable(t)
+        if tw is not None:
+            tw.transform(mat)
+            for changes in self.changes:
+                changes.update((t, p1, p2) for p1, p2 in tw.offsets)
+
+    def walls(self, t):
+        """
+        Iterate over the walls (p1,p2) existing at time t
+        """
+        tw = self._walls.get(t)
+        if tw is None:
+            return iter(())
+        return iter(list(tw.offsets))
+
+    def packedWalls(self, t):
+        """
+        :returns: the coordinates of the intermediate points of the walls at time t, then the walls (p1,p2) encoded as
+            ``p1 << 32 | p2`` in increasing order, with the slice of the coordinates of each one
+        :returntype: (ndarray(N,2), ndarray(M) of int64, ndarray(M) of int, ndarray(M) of int)
+        """
+        tw = self._walls.get(t)
+        source = tw.packed() if isinstance(tw, _LazyTimeWalls) else None
+        if source is not None and len(source[0]):
+            # The walls are not read, the arrays they would be read from are used directly
+            walls, coords, lengths = source
+            keys = numpy.array(walls, dtype=numpy.int64).reshape(-1, 2)
+            ends = numpy.cumsum(lengths, dtype=int)
+            codes = (keys[:, 0] << 32) | keys[:, 1]
+            order = numpy.argsort(codes)
+            return (numpy.asarray(coords, dtype=float).reshape(-1, 2), codes[order], (ends - lengths)[order],
+                    ends[order])
+        if tw is None or not tw.offsets:
+            empty = numpy.empty((0,), dtype=int)
+            return _empty_coords, empty.astype(numpy.int64), empty, empty
+        keys = numpy.array(list(tw.offsets), dtype=numpy.int64).reshape(-1, 2)
+        slices = numpy.array(list(tw.offsets.values()), dtype=int).reshape(-1, 2)
+        codes = (keys[:, 0] << 32) | keys[:, 1]
+        order = numpy.argsort(codes)
+        return tw.buffer[:tw.size], codes[order], slices[order, 0], slices[order, 1]
+
+    def nbWalls(self, t):
+        tw = self._walls.get(t)
+        if tw is None:
+            return 0
+        return len(tw.offsets)
 
     def __iter__(self):
-        for t in self._walls:
-            for (p1, p2) in self._walls[t]:
+        for t in list(self._walls):
+            for (p1, p2) in list(self._walls[t].offsets):
                 yield (t, p1, p2)
 
     def empty(self):
-        for t in self._walls:
-            w = self._walls[t]
-            for (p1, p2) in w:
-                if w[p1, p2]:
-                    return False
+        for tw in self._walls.values():
+            if tw.size > tw.wasted:
+                return False
         return True
 
 
@@ -420,8 +1421,8 @@ class TrackingData(QObject):
             position of the points for each image name
         cells : dict of int*(tuple of int)
             description of the cells
-        cells_lifespan : dict of int * `LifeSpan`
-            describe the lifespan of the cell whose id is the key. LifeSpan
+        cells_lifespan : `LifeSpansView`
+            read-only view describing the lifespan of the cell whose id is the key. LifeSpan
             describe the start and end of the existence of the cell, as well as
             the parent and daughter cells (it any) and the division points if
             the cell divide.
@@ -430,6 +1431,13 @@ class TrackingData(QObject):
         walls : `WallShapes`
             List of walls. The two points are such that the first id is always smaller than the
             second.
+        _shared_positions : set of str
+            images whose positions are shared with a snapshot, and must be copied before being modified
+        _shared_lifespans : bool
+            True if the table of the life spans is shared with a snapshot, and must be copied before being modified.
+            The life spans themselves are frozen, so they are always shared.
+        _point_indexes : dict of str*`spatial_index.PointIndex`
+            spatial index of the points of the images, created when first queried
     """
     def __init__(self, project_dir=path("")):
         """
@@ -468,6 +1476,94 @@ class TrackingData(QObject):
         copy.walls = WallShapes(self.walls)
         return copy
 
+    def snapshot(self):
+        """
+        Take a snapshot of the whole data set, including the cells.
+
+        The snapshot shares the positions, cells and walls with this object. Each table is copied by the first
+        object modifying it, so taking a snapshot doesn't depend on the size of the data set.
+
+        :returns: a copy of the data set, unaffected by later modifications, to be read by another thread
+        :returntype: `TrackingData`
+        """
+        snapshot = TrackingData()
+        snapshot._last_pt_id = self._last_pt_id
+        snapshot._last_cell_id = self._last_cell_id
+        snapshot.project_dir = self.project_dir
+        snapshot._data_file = self._data_file
+        snapshot.images_shift = dict((name, [QPointF(pos), a]) for name, (pos, a) in self.images_shift.items())
+        snapshot.images_scale = dict(self.images_scale)
+        snapshot.images_name = list(self.images_name)
+        snapshot._images_time = list(self._images_time)
+        if hasattr(self, '_min_scale'):
+            snapshot._min_scale = self._min_scale
+        snapshot.data = dict(self.data)
+        snapshot._shared_positions = set(self.data)
+        self._shared_positions.update(self.data)
+        snapshot.cells = self.cells.copy()
+        snapshot.cell_points = self.cell_points.copy()
+        snapshot._cells_lifespan = self._cells_lifespan
+        snapshot._shared_lifespans = self._shared_lifespans = True
+        snapshot.walls = self.walls.snapshot()
+        return snapshot
+
+    @property
+    def cells_lifespan(self):
+        """
+        Read-only view of the life spans of the cells. Use `setCells` or `changeCellsLifespan` to modify them.
+
+        :returntype: `LifeSpansView`
+        """
+        return LifeSpansView(self._cells_lifespan)
+
+    @cells_lifespan.setter
+    def cells_lifespan(self, value):
+        if value is not None:
+            for ls in value.values():
+                ls._frozen = True
+        self._cells_lifespan = value
+        self._shared_lifespans = False
+
+    def _writableLifespans(self):
+        """
+        :returns: the table of the life spans, copied first if it is shared with a snapshot
+        :returntype: dict of int*`LifeSpan`
+        """
+        if self._shared_lifespans:
+            self._cells_lifespan = dict(self._cells_lifespan)
+            self._shared_lifespans = False
+        return self._cells_lifespan
+
+    def _setLifespan(self, cid, ls):
+        """
+        Set the life span of the cell `cid`. The life span is frozen, or a frozen copy is stored if it isn't already.
+        """
+        self._writableLifespans()[cid] = ls.frozen()
+
+    def _writablePositions(self, image_name, copy=True):
+        """
+        :returns: the positions of the points in the image, copied first if they are shared with a snapshot
+        :returntype: dict of int*QPointF
+
+        The `QPointF` stored are never modified in place, only replaced, so a copy shares them with the snapshot.
+
+        :Parameters:
+            copy : bool
+                If False, shared positions are replaced by an empty dictionary
+        """
+        data = self.data[image_name]
+        if image_name in self._shared_positions:
+            if copy:
+                data = dict(data.items())
+            else:
+                data = {}
+            self.data[image_name] = data
+            self._shared_positions.discard(image_name)
+            view = self._image_views.get(image_name)
+            if view is not None:
+                view._current_data = data
+        return data
+
     @property
     def valid(self):
         """
@@ -494,10 +1590,13 @@ class TrackingData(QObject):
         """
         self._last_pt_id = -1
         self._last_cell_id = -1
+        self._image_views = {}
+        self._point_indexes = {}
+        self._shared_positions = set()
         self.data = {}
-        self.cells = {}
+        self.cells = CellsStore()
         self.cells_lifespan = {}
-        self.cell_points = {}
+        self.cell_points = PointCells()
         self.walls = WallShapes()
         for t in range(len(self.images_name)):
             self.walls.add_time(t)
@@ -554,21 +1653,33 @@ class TrackingData(QObject):
         return self._set_data(data, shifts, scales)
 
     def _set_data(self, data, shifts, scales, cells={}, cells_lifespan=None,
-                  times=None, wall_shapes=None):
+                  times=None, wall_shapes=None, clean=True):
         """
         Private method finalizing the data after the file has been loaded
 
+        The cells and the table of the cells of each point are checked to be consistent. If `clean` is False, the
+        cells are assumed to come from a valid data set and are not cleaned.
+
         :returns: wether the data was unchanged or not
         :returntype: bool
         """
+        self._image_views = {}
+        self._point_indexes = {}
+        old_data = self.data
+        self._shared_positions = set(img for img in self._shared_positions if data.get(img) is old_data.get(img))
         self.data = data
+        cells = CellsStore(cells)
         self.cells = cells
         self.cells_lifespan = cells_lifespan
         if wall_shapes:
             self.walls = wall_shapes
         else:
             self.walls = WallShapes()
-        cell_points = {}
+        pt_ids = set()
+        for d in data.values():
+            pt_ids.update(d)
+        cell_points = PointCells.fromCells(cells, pt_ids)
+        del pt_ids
         self.cell_points = cell_points
         self.images_shift = shifts
         for img in scales:
@@ -588,8 +1699,6 @@ class TrackingData(QObject):
             self._imageMoved(img, scales[img], pos, angle)
         for img, d in data.items():
             self._dataChanged(img)
-            for p in d.keys():
-                cell_points.setdefault(p, set())
             self._pointsAdded(img, d.keys())
         if cells_lifespan is None:
             cells_lifespan = {}
@@ -612,18 +1721,16 @@ class TrackingData(QObject):
                             prev = i
             self.walls = wall_shapes
         if cells:
-            for cid in cells:
-                for p in cells[cid]:
-                    cell_points[p].add(cid)
-            self._cellsAdded(cells.keys())
-        log_debug("TrackingData loaded with %d images, %d points and %d cells." % (len(self.data),
-                                                                                   len(cell_points),
-                                                                                   len(cells)))
-        cells_changed, _ = self.cleanCells()
+            self._cellsAdded(list(cells.keys()))
+        log_debug("TrackingData loaded with %d images, %d points and %d cells.", len(self.data), len(cell_points),
+                  len(cells))
         self.checkCells()
+        if not clean:
+            return False
+        cells_changed, _ = self.cleanCells()
         if cells_changed:
-            log_debug("Correction of the data:\n%s" % ("\n".join("Cell %d was invalid" % cid
-                                                                 for cid in cells_changed),))
+            log_debug("Correction of the data:\n%s", lazy("\n".join, ("Cell %d was invalid" % cid
+                                                                    for cid in cells_changed)))
             return True
         return False
 
@@ -785,6 +1892,7 @@ class TrackingData(QObject):
         cell_list = False
         cells = {}
         cells_lifespan = {}
+        rows = []
         for i, l in enumerate(r):
             if len(l) == 1 and l[0].lower() == "cells":
                 cell_list = True
@@ -792,11 +1900,11 @@ class TrackingData(QObject):
             if len(l) != num_columns+1:
                 s = "Incorrect number of columns in line %d: %d instead of %d expected"
                 raise TrackingDataException(s % (i+1, len(l), num_columns+1))
-            pos = [(img, QPointF(float(x), float(y)))
-                   for img, x, y in zip(images, l[1::2], l[2::2]) if x != '' or y != '']
-            for img, p in pos:
-                data[img][i] = p
-            self._last_pt_id = i
+            rows.append(l)
+        if rows:
+            self._last_pt_id = len(rows)-1
+            _readPositions(data, images, list(range(len(rows))), rows)
+        del rows
         cell_division = False
         if cell_list:
             for cell, l in enumerate(r):
@@ -879,6 +1987,7 @@ class TrackingData(QObject):
         cell_list = False
         cells = {}
         cells_lifespan = {}
+        rows = []
         for i, l in enumerate(r):
             if len(l) == 1 and l[0].lower() == "cells":
                 cell_list = True
@@ -886,11 +1995,11 @@ class TrackingData(QObject):
             if len(l) != num_columns+1:
                 s = "Incorrect number of columns in line %d: %d instead of %d expected"
                 raise TrackingDataException(s % (i+1, len(l), num_columns+1))
-            pos = [(img, QPointF(float(x), float(y)))
-                   for img, x, y in zip(images, l[1::2], l[2::2]) if x != '' or y != '']
-            for img, p in pos:
-                data[img][i] = p
-            self._last_pt_id = i
+            rows.append(l)
+        if rows:
+            self._last_pt_id = len(rows)-1
+            _readPositions(data, images, list(range(len(rows))), rows)
+        del rows
         cell_division = False
         if cell_list:
             for cell, l in enumerate(r):
@@ -988,6 +2097,7 @@ class TrackingData(QObject):
         cell_list = False
         cells = {}
         cells_lifespan = {}
+        rows = []
         for i, l in enumerate(r):
             if len(l) == 1 and l[0].lower() == "cells":
                 cell_list = True
@@ -995,11 +2105,11 @@ class TrackingData(QObject):
             if len(l) != num_columns+1:
                 s = "Incorrect number of columns in line %d: %d instead of %d expected"
                 raise TrackingDataException(s % (i+1, len(l), num_columns+1))
-            pos = [(img, QPointF(float(x), float(y)))
-                   for img, x, y in zip(images, l[1::2], l[2::2]) if x != '' or y != '']
-            for img, p in pos:
-                data[img][i] = p
-            self._last_pt_id = i
+            rows.append(l)
+        if rows:
+            self._last_pt_id = len(rows)-1
+            _readPositions(data, images, list(range(len(rows))), rows)
+        del rows
         cell_division = False
         if cell_list:
             for cell, l in enumerate(r):
@@ -1098,6 +2208,8 @@ class TrackingData(QObject):
         cells = {}
         cells_lifespan = {}
         delta = 0
+        pids = []
+        rows = []
         for i, l in enumerate(r):
             if not l:
                 delta += 1
@@ -1112,12 +2224,12 @@ class TrackingData(QObject):
             elif len(l) != num_columns+1:
                 s = "Incorrect number of columns in line %d: %d instead of %d expected"
                 raise TrackingDataException(s % (i+1, len(l), num_columns+1))
-            pid = i - delta
-            pos = [(img, QPointF(float(x), float(y)))
-                   for img, x, y in zip(images, l[1::2], l[2::2]) if x != '' or y != '']
-            for img, p in pos:
-                data[img][pid] = p
-            self._last_pt_id = pid
+            pids.append(i - delta)
+            rows.append(l)
+        if pids:
+            self._last_pt_id = pids[-1]
+            _readPositions(data, images, pids, rows)
+        del rows
         cell_division = False
         if cell_list:
             delta = 0
@@ -1191,6 +2303,8 @@ class TrackingData(QObject):
         wall_shapes = None
         if has_wall_shapes:
             wall_shapes = WallShapes()
+            # The walls of each time are gathered, then converted and stored at once
+            time_walls = {}
             for l in r:
                 if not l:
                     continue
@@ -1199,13 +2313,18 @@ class TrackingData(QObject):
                 time = int(l[1])
                 p1 = int(l[2])
                 p2 = int(l[3])
-                pos = [float(f) for f in l[4:] if f]
+                pos = [f for f in l[4:] if f]
                 assert len(pos) % 2 == 0
-                pos = [QPointF(pos[i], pos[i+1]) for i in range(0, len(pos), 2)]
-                wall_shapes[time, p1, p2] = pos
-                log_debug("wall shape from %d to %d at time %d =\n%s" % (p1, p2, time,
-                                                                         ", ".join("%f,%f" % (p.x(), p.y())
-                                                                                   for p in pos)))
+                if p1 > p2:
+                    p1, p2 = p2, p1
+                    pos = [v for i in range(len(pos)-2, -1, -2) for v in pos[i:i+2]]
+                walls, values, lengths = time_walls.setdefault(time, ([], [], []))
+                walls.append((p1, p2))
+                values.extend(pos)
+                lengths.append(len(pos) // 2)
+            for time, (walls, values, lengths) in time_walls.items():
+                wall_shapes.setTimeWalls(time, walls, numpy.array(values, dtype=float),
+                                         numpy.array(lengths, dtype=int))
         else:
             log_debug("No wall shape!")
         return self._set_data(data, shifts, scales, cells, cells_lifespan, times, wall_shapes)
@@ -1233,22 +2352,38 @@ class TrackingData(QObject):
     :type: str
     """
 
-    def load(self, data_file=None, f=None, **opts):
+    @timed("TrackingData.load")
+    def load(self, data_file=None, f=None, journal=True, **opts):
         """
         Read the data from the data file
 
+        :Parameters:
+            journal : bool
+                If True, the modifications saved in the journal of the data file are applied, see `tracking_journal`
+
         :raise TrackingDataException:
         :returns: True if the data were changed while loading (typically if invalid data were corrected
         :returntype: bool
         """
+        changed = self._loadFile(data_file, f, **opts)
+        if f is None and journal:
+            from . import tracking_journal
+            tracking_journal.replay(self, data_file, unsaved=False)
+        return changed
+
+    def _loadFile(self, data_file, f, **opts):
         if f is None:
             if data_file is None:
                 raise TrackingDataException("You need to provide either a data file path or an opened file object")
-            f = open(data_file, "r")
             # if there is no project specified, try to find it
             if not self.project_dir:
                 p = path(data_file).dirname()
                 self.project_dir = p.parent
+            from . import tracking_binary
+            if tracking_binary.isBinaryFile(data_file):
+                self.clear()
+                return self.load_binary(data_file)
+            f = open(data_file, "r")
         r = csv.reader(f)
         first_line = next(r)
         if first_line and first_line[0] == "TRK_VERSION":
@@ -1269,14 +2404,69 @@ class TrackingData(QObject):
         else:
             return TrackingData.versions_loader[TrackingData.CURRENT_VERSION](self, f, has_version=has_version, **opts)
 
+    def load_binary(self, data_file):
+        """
+        Read the data from a file in the binary format.
+
+        The cells are cleaned and checked as for the text format. The cleaning reads the coordinates of the points
+        and walls directly from the file, so the positions are still only converted when first used.
+
+        :returns: True if the data were changed while loading (typically if invalid data were corrected)
+        :returntype: bool
+        """
+        from . import tracking_binary
+        args, last_pt_id, last_cell_id = tracking_binary.load(data_file)
+        self._last_pt_id = last_pt_id
+        self._last_cell_id = last_cell_id
+        return self._set_data(*args)
+
+    @timed("TrackingData.save")
     def save(self, data_file=None, f=None):
-        if self.walls.empty():
+        """
+        Save the data. If the file name has the extension of the binary format, the data are saved in that format,
+        otherwise the TRK text format is used.
+
+        :returns: the ids of points and cells in the file
+        :returntype: (dict of int*int, dict of int*int)
+        """
+        from . import tracking_binary
+        if f is None and data_file is not None and path(data_file).ext == tracking_binary.EXTENSION:
+            result = self.save_binary(data_file)
+        elif self.walls.empty():
             result = self.save_0_5(data_file, f)
         else:
             result = self.save_0_6(data_file, f)
         self.saved.emit()
         return result
 
+    def fileIds(self, binary=False):
+        """
+        The ids of points and cells in a file of the TRK text format, or of the binary format if `binary` is True,
+        known before the file is written.
+
+        :returns: the ids of points and cells in the file
+        :returntype: (dict of int*int, dict of int*int)
+        """
+        pts = set()
+        for d in self.data.values():
+            pts.update(d)
+        if binary:
+            return dict((p, p) for p in pts), dict((c, c) for c in self.cells)
+        invert_pts = dict((p, i) for i, p in enumerate(sorted(pts)))
+        invert_cells = dict((c, i) for i, c in enumerate(sorted(self.cells)))
+        return invert_pts, invert_cells
+
+    def save_binary(self, data_file):
+        """
+        Save the data in the binary format. Points and cells keep their ids.
+
+        :returns: the ids of points and cells in the file
+        :returntype: (dict of int*int, dict of int*int)
+        """
+        from . import tracking_binary
+        tracking_binary.save(self, data_file)
+        return self.fileIds(binary=True)
+
     def save_0_6(self, data_file, f=None):
         num_img = len(self.images_name)
         pts = set()
@@ -1289,16 +2479,7 @@ class TrackingData(QObject):
         invert_images = dict((img, i) for i, img in enumerate(self.images_name))
         num_pts = len(pts)
         num_columns = num_img*2+1
-        array = numpy.zeros((num_pts, num_columns), dtype='S20')
-        for img in data:
-            d = data[img]
-            img_num = 2*invert_images[img]
-            col = img_num+1
-            column = array[:, col:col+2]  # Just a view on the column
-            for p in d:
-                i = invert_pts[p]
-                pos = d[p]
-                column[i] = [str(pos.x()), str(pos.y())]
+        array = _formatPositions(data, invert_images, invert_pts, num_columns)
         cells = self.cells
         ordered_cells = list(cells.keys())
         ordered_cells.sort()
@@ -1319,6 +2500,8 @@ class TrackingData(QObject):
             life_spans.append([cell_name, ls[0], ls[1]])
         invert_cells = dict((c, i) for i, c in enumerate(cells_ids))
         array[:, 0] = ["Point %d" % i for i in range(num_pts)]
+        point_block = "".join(",".join(row) + "\r\n" for row in array.tolist())
+        del array
         # Now, prepare walls
         walls = self.walls
         wall_list = []
@@ -1328,10 +2511,10 @@ class TrackingData(QObject):
             wall_name = "Wall %d" % wid
             wid += 1
             wall_list.append([wall_name, t, invert_pts[p1], invert_pts[p2]] +
-                             sum([[p.x(), p.y()] for p in walls[t, p1, p2]], []))
+                             walls.coordinates(t, p1, p2).ravel().tolist())
 
         if f is None:
-            f = open(data_file, "wb")
+            f = _openCsv(data_file, "w")
         w = csv.writer(f, delimiter=",")
         w.writerow(["TRK_VERSION", "0.6"])
         title = ['']*num_columns
@@ -1352,7 +2535,7 @@ class TrackingData(QObject):
         scales = self.images_scale
         sc_row = ("Scaling",) + sum([scales[img] for img in self.images_name], ())
         w.writerow(sc_row)
-        w.writerows(array)
+        f.write(point_block)
         w.writerow(["Cells"])
         for c in new_cells:
             w.writerow(c)
@@ -1385,16 +2568,7 @@ class TrackingData(QObject):
         invert_images = dict((img, i) for i, img in enumerate(self.images_name))
         num_pts = len(pts)
         num_columns = num_img*2+1
-        array = numpy.zeros((num_pts, num_columns), dtype='S20')
-        for img in data:
-            d = data[img]
-            img_num = 2*invert_images[img]
-            col = img_num+1
-            column = array[:, col:col+2]  # Just a view on the column
-            for p in d:
-                i = invert_pts[p]
-                pos = d[p]
-                column[i] = [str(pos.x()), str(pos.y())]
+        array = _formatPositions(data, invert_images, invert_pts, num_columns)
         cells = self.cells
         ordered_cells = list(cells.keys())
         ordered_cells.sort()
@@ -1416,8 +2590,10 @@ class TrackingData(QObject):
         invert_cells = dict((c, i) for i, c in enumerate(cells_ids))
 
         array[:, 0] = ["Point %d" % i for i in range(num_pts)]
+        point_block = "".join(",".join(row) + "\r\n" for row in array.tolist())
+        del array
         if f is None:
-            f = open(data_file, "wb")
+            f = _openCsv(data_file, "w")
         w = csv.writer(f, delimiter=",")
         w.writerow(["TRK_VERSION", "0.5"])
         title = ['']*num_columns
@@ -1438,7 +2614,7 @@ class TrackingData(QObject):
         scales = self.images_scale
         sc_row = ("Scaling",) + sum([scales[img] for img in self.images_name], ())
         w.writerow(sc_row)
-        w.writerows(array)
+        f.write(point_block)
         w.writerow(["Cells"])
         for c in new_cells:
             w.writerow(c)
@@ -1475,16 +2651,17 @@ class TrackingData(QObject):
         self.walls = WallShapes()
         for t in range(len(self.images_name)):
             self.walls.add_time(t)
-        for img, pts in data.items():
+        self._point_indexes = {}
+        for img, pts in list(data.items()):
             self.pointsDeleted.emit(img, pts.keys())
-            pts.clear()
+            self._writablePositions(img, copy=False).clear()
             self.imageMoved.emit(img, (1, 1), QPointF(0, 0), 0)
             shifts[img] = [QPointF(0, 0), 0]
             scales[img] = (1, 1)
         if cells:
             self.cellsRemoved.emit(cells.keys(), None)
         cells.clear()
-        self.cells_lifespan.clear()
+        self._writableLifespans().clear()
         self.cell_points.clear()
         self._min_scale = 1.0
         for data in self:
@@ -1514,9 +2691,9 @@ class TrackingData(QObject):
                 image_name
         """
         try:
-            return ImageData(self, self.images_name[image_name])
+            return self._imageData(self.images_name[image_name])
         except TypeError:
-            return ImageData(self, image_name)
+            return self._imageData(image_name)
 
     def __contains__(self, image_name):
         return image_name in self.data
@@ -1532,15 +2709,77 @@ class TrackingData(QObject):
         Iterate over the images
         """
         for img in self.images_name:
-            yield ImageData(self, img)
+            yield self._imageData(img)
+
+    def _imageData(self, image_name):
+        """
+        Get the cached view on an image, creating it if needed.
+
+        :returntype: `ImageData`
+        """
+        view = self._image_views.get(image_name)
+        if view is None or not view._valid():
+            view = ImageData(self, image_name)
+            self._image_views[view.image_name] = view
+        return view
 
     def deletePointInAll(self, pt_id):
         """
         Delete a point in all the images
         """
-        for img in self.data.values():
-            if pt_id in img:
-                del img[pt_id]
+        self.deletePoints([pt_id])
+
+    def deletePoints(self, pt_ids, images=None):
+        """
+        Delete a set of points from a range of images.
+
+        Points absent from an image are ignored. The cells are updated once for all the points that don't exist
+        anymore in any image, and a single notification is sent per kind of change.
+
+        :Parameters:
+            pt_ids : iter of int
+                Points to delete
+            images : list of str
+                Images to delete the points from. If None, all the images are used.
+
+        :returns: the list of changed cells and the list of removed cells
+        :returntype: (list of int, list of int)
+        """
+        pt_ids = set(pt_ids)
+        if images is None:
+            images = self.images_name
+        data = self.data
+        for img in images:
+            img_data = data[img]
+            deleted = [pt for pt in pt_ids if pt in img_data]
+            if deleted:
+                self._pointsDeleted(img, deleted)
+                img_data = self._writablePositions(img)
+                for pt in deleted:
+                    del img_data[pt]
+        # Points not existing anymore have to be removed from the cells
+        all_data = list(data.values())
+        orphans = set(pt for pt in pt_ids if not any(pt in d for d in all_data))
+        cell_points = self.cell_points
+        cells = self.cells
+        changed_cells = set()
+        for pt in orphans:
+            changed_cells.update(cell_points.pop(pt, ()))
+        delete_cells = []
+        for cid in changed_cells:
+            cell = tuple(pt for pt in cells[cid] if pt not in orphans)
+            cells[cid] = cell
+            if not cell:
+                delete_cells.append(cid)
+        changed_cells = list(changed_cells)
+        if changed_cells:
+            self._cellsChanged(changed_cells)
+        if delete_cells:
+            self._cellsRemoved(delete_cells)
+            for cid in delete_cells:
+                del cells[cid]
+        self.checkCells()
+        return changed_cells, delete_cells
 
     def imagesWithPoint(self, pt_id):
         """
@@ -1551,14 +2790,34 @@ class TrackingData(QObject):
         return [img for img in self.images_name if pt_id in self.data[img]]
 
     def _pointsAdded(self, image_name, ids):
+        self._invalidateIndex(image_name, ids)
         self.pointsAdded.emit(image_name, ids)
 
     def _pointsMoved(self, image_name, ids):
+        self._invalidateIndex(image_name, ids)
         self.pointsMoved.emit(image_name, ids)
 
     def _pointsDeleted(self, image_name, ids):
+        self._invalidateIndex(image_name, ids)
         self.pointsDeleted.emit(image_name, ids)
 
+    def _invalidateIndex(self, image_name, ids):
+        index = self._point_indexes.get(image_name)
+        if index is not None:
+            index.invalidate(ids)
+
+    def pointIndex(self, image_name):
+        """
+        :returns: the spatial index of the points of an image, up to date with the positions
+        :returntype: `spatial_index.PointIndex`
+        """
+        index = self._point_indexes.get(image_name)
+        if index is None:
+            index = PointIndex()
+            self._point_indexes[image_name] = index
+        index.update(self.data[image_name])
+        return index
+
     def _imageMoved(self, image_name, scale, pos, angle):
         self.imageMoved.emit(image_name, scale, pos, angle)
 
@@ -1589,6 +2848,7 @@ class TrackingData(QObject):
         ls = cells_lifespan[cid]
         while ls.parent is not None:
             cid = ls.parent
+            ls = cells_lifespan[cid]
         return cid
 
     def cellAtImage(self, cid, img):
@@ -1812,7 +3072,8 @@ class TrackingData(QObject):
             if lifespans is not None:
                 return self.setCells([cell_ids], [pt_ids_list], [lifespans])
             return self.setCells([cell_ids], [pt_ids_list])
-        log_debug("Settings cells: %s" % ", ".join("%d" % c for c in cell_ids))
+        log_debug("Settings cells: %s", lazy(", ".join, ("%d" % c for c in cell_ids)))
+        count("TrackingData.setCells", len(cell_ids))
         cells_added = {}
         cells_changed = []
         cells_deleted = {}
@@ -1838,7 +3099,7 @@ class TrackingData(QObject):
                     cell_points.setdefault(p, set()).add(cell)
                 cells_added[cell] = self.imagesWithLifespan(ls)
             cells[cell] = tuple(pt_ids)
-            cells_lifespan[cell] = ls
+            self._setLifespan(cell, ls)
         if cells_added:
             #print "Cells added: %s" % (cells_added,)
             self._cellsAdded(cells_added.keys(), cells_added.values())
@@ -1849,14 +3110,20 @@ class TrackingData(QObject):
         self.checkCells()
 
     def checkCells(self):
-        cells = self.cells
-        cell_points = self.cell_points
-        for cid in cells:
-            for p in cells[cid]:
-                assert cid in cell_points[p]
-        for p in cell_points:
-            for cid in cell_points[p]:
-                assert p in cells[cid]
+        """
+        Check the cells and the table of the cells containing each point describe the same pairs of points and cells.
+
+        The check is done on the arrays of both structures.
+        """
+        def sortedPairs(pts, cids):
+            pairs = numpy.sort((pts.astype(numpy.int64) << 32) | cids)
+            if len(pairs):
+                pairs = pairs[numpy.concatenate(([True], pairs[1:] != pairs[:-1]))]
+            return pairs
+        cids, lengths, points = self.cells.arrays()
+        expected = sortedPairs(points, numpy.repeat(cids, lengths))
+        found = sortedPairs(*self.cell_points.pairs())
+        assert numpy.array_equal(expected, found), "The cells and the cells of the points are inconsistent"
 
     def changeCellsLifespan(self, cells, lifespans):
         """
@@ -1873,7 +3140,7 @@ class TrackingData(QObject):
             new_lst = set(self.images_name[ls.slice()])
             add_cells = new_lst - cur_lst
             del_cells = cur_lst - new_lst
-            cells_lifespan[cid] = ls
+            self._setLifespan(cid, ls)
             if add_cells:
                 self._cellsAdded([cid], [add_cells])
             if del_cells:
@@ -1893,7 +3160,8 @@ class TrackingData(QObject):
             iter(cell_ids)
         except TypeError:
             return self.removeCells([cell_ids])
-        log_debug("Removing cells: %s" % ", ".join("%d" % c for c in cell_ids))
+        log_debug("Removing cells: %s", lazy(", ".join, ("%d" % c for c in cell_ids)))
+        count("TrackingData.removeCells", len(cell_ids))
         cells = self.cells
         cells_lifespan = self.cells_lifespan
         cell_points = self.cell_points
@@ -1912,7 +3180,7 @@ class TrackingData(QObject):
             for p in cells[cell]:
                 cell_points[p].remove(cell)
             del cells[cell]
-            del cells_lifespan[cell]
+            del self._writableLifespans()[cell]
         parents = list(parents)
         parents_newls = []
         for cid in parents:
@@ -1924,6 +3192,27 @@ class TrackingData(QObject):
         self.changeCellsLifespan(parents, parents_newls)
         self.checkCells()
 
+    def setFrames(self, data, wall_shapes):
+        """
+        Replace the positions of the points in every image, and the walls, keeping the cells and their life spans.
+
+        The cells are not checked: this is meant for a data set receiving the positions of a few images at a time,
+        as in `growth_parallel`.
+
+        :Parameters:
+            data : dict of str*(dict of int*QPointF)
+                Positions of the points, for each image of the data set
+            wall_shapes : `WallShapes`
+                Shapes of the walls
+        """
+        self._image_views = {}
+        self._point_indexes = {}
+        self._shared_positions = set()
+        self.data = data
+        self.walls = wall_shapes
+        for img in data:
+            self._dataChanged(img)
+
     def setTimes(self, times):
         assert len(times) == len(self.images_time), "You can only use this function to reset the times of all images"
         self._images_time = [float(t) for t in times]
@@ -1934,16 +3223,10 @@ class TrackingData(QObject):
             size = tuple(scales[data.index])
             ratio_x = size[0] / data.scale[0]
             ratio_y = size[1] / data.scale[1]
-            pids = list(data)
             self.images_scale[data.image_name] = size
             self._imageMoved(data.image_name, size, *data.shift)
-            new_pos = [QPointF(data[pid].x()*ratio_x, data[pid].y()*ratio_y) for pid in pids]
-            self._pointsMoved(data.image_name, pids)
-            data[pids] = new_pos
-            for (p1, p2) in data.walls:
-                w = data.walls[p1, p2]
-                new_w = [QPointF(p.x()*ratio_x, p.y()*ratio_y) for p in w]
-                data.walls[p1, p2] = new_w
+            data.transform(numpy.array([[ratio_x, 0, 0], [0, ratio_y, 0]], dtype=float))
+            self._pointsMoved(data.image_name, list(data))
 
     def copyAlignementAndScale(self, other):
         for img_data in self:
@@ -1955,106 +3238,271 @@ class TrackingData(QObject):
             scale = other_data.scale
             self._imageMoved(img_data._current_image, scale, pos, angle)
             shift = [pos, angle]
-            # Change position of the points
+            # Change position of the points and walls
             self.images_shift[img_data.image_name] = shift
             self.images_scale[img_data.image_name] = scale
-            mat = inv_old_mat*img_data.matrix()
-            for pos in img_data.positions():
-                npos = mat.map(pos)
-                pos.setX(npos.x())
-                pos.setY(npos.y())
-            # Change position of the walls
-            for w in img_data.walls:
-                wall = img_data.walls[w]
-                new_wall = [mat.map(pt) for pt in wall]
-                img_data.walls[w] = new_wall
+            img_data.transform(affineMatrix(inv_old_mat*img_data.matrix()))
             self._pointsMoved(img_data.image_name, img_data.points())
 
     def minScale(self):
         return self._min_scale
 
-    def cleanCells(self):
+    @timed("TrackingData.findCellsCleaning")
+    def findCellsCleaning(self, cells=None, processes=None):
+        """
+        Find the cells having duplicated points or oriented clockwise, without modifying them.
+
+        The orientation of a cell is tested on the first image where it has at least 3 points, and on the following
+        images only if its area is null there. The cells are first examined on arrays, see `_screenCells`; only the
+        ones left undecided are tested on their full geometry, with the areas computed for all of them at once.
+
+        :Parameters:
+            cells : dict of int*(tuple of int)
+                Cells to examine. If None, all the cells are examined.
+            processes : int
+                Number of processes used to compute the areas of the cells. If None, they are computed in the current
+                process.
+
+        :returns: the list of cells to change, their current shape and their cleaned shape
+        :returntype: (list of int, list of (tuple of int), list of (tuple of int))
+        """
+        if cells is None:
+            cells = self.cells
+        duplicated, reversed_cells, undecided = self._screenCells(cells)
+        new_cells = {}
+        for cid in duplicated:
+            pt_ids = cells[cid]
+            counts = Counter(pt_ids)
+            to_remove = set(pt_id for pt_id, nb in counts.items() if nb > 1)
+            new_cells[cid] = self._removeDuplicatedPoints(cid, list(pt_ids), to_remove, counts)
+        # Then, check the cells are oriented counter-clockwise
+        # Remember, the reference system is inverted
+        pending = [(cid, self._cellPolygons(new_cells.get(cid, cells[cid]), self.cells_lifespan[cid]))
+                   for cid in duplicated + undecided]
+        while pending:
+            polygons = []
+            for cid, cell_polygons in pending:
+                poly = next(cell_polygons, None)
+                if poly is not None:
+                    polygons.append((cid, cell_polygons, poly))
+            if not polygons:
+                break
+            starts = numpy.cumsum([0] + [len(poly) for _, _, poly in polygons[:-1]])
+            coords = numpy.concatenate([poly for _, _, poly in polygons])
+            areas = polygonsSignedArea(coords, starts, processes)
+            pending = []
+            for (cid, cell_polygons, _), area in zip(polygons, areas):
+                if area < 0:
+                    reversed_cells.add(cid)
+                elif area == 0:
+                    pending.append((cid, cell_polygons))
+        changed_cells = [cid for cid in cells if cid in new_cells or cid in reversed_cells]
+        saved_cells = [tuple(cells[cid]) for cid in changed_cells]
+        cleaned_cells = []
+        for cid, pt_ids in zip(changed_cells, saved_cells):
+            pt_ids = new_cells.get(cid, pt_ids)
+            if cid in reversed_cells:
+                pt_ids = pt_ids[::-1]
+            cleaned_cells.append(tuple(pt_ids))
+        return changed_cells, saved_cells, cleaned_cells
+
+    def _screenCells(self, cells):
+        """
+        Examine the cells on arrays, to find the ones that may need cleaning.
+
+        The polygons of the cells without duplicated point, with their wall shapes, are built on the first image of
+        their lifespan where they have at least 3 points. The images are visited in order: the cells are tested on the
+        image starting their lifespan, and the ones with less than 3 points there are tested again on the next image,
+        so only the points of the cells being tested are looked up in an image. The orientation of a cell is known
+        from the sign of its area, unless the area is null.
+
+        :returns: the cells with duplicated points, the cells oriented clockwise, and the cells whose orientation must
+            be tested on their full geometry
+        :returntype: (list of int, set of int, list of int)
+        """
+        cids = list(cells)
+        shapes = [cells[cid] for cid in cids]
+        nb_cells = len(cids)
+        lengths = numpy.fromiter((len(pt_ids) for pt_ids in shapes), dtype=int, count=nb_cells)
+        points = numpy.fromiter((pt_id for pt_ids in shapes for pt_id in pt_ids), dtype=numpy.int64,
+                                count=int(lengths.sum()))
+        del shapes
+        indptr = numpy.cumsum(lengths) - lengths
+        owner = numpy.repeat(numpy.arange(nb_cells), lengths)
+        pairs = numpy.sort((owner.astype(numpy.int64) << 32) | points)
+        dup_rows = numpy.unique(pairs[1:][pairs[1:] == pairs[:-1]] >> 32)
+        del owner, pairs
+        duplicated = [cids[row] for row in dup_rows.tolist()]
+        images_name = self.images_name
+        nb_images = len(images_name)
+        cells_lifespan = self.cells_lifespan
+        windows = numpy.array([cells_lifespan[cid].slice().indices(nb_images)[:2] for cid in cids],
+                              dtype=int).reshape(-1, 2)
+        screened = windows[:, 0] < windows[:, 1]
+        screened[dup_rows] = False
+        # Cells to test, by image starting their lifespan
+        starting = numpy.flatnonzero(screened)
+        starting = starting[numpy.argsort(windows[starting, 0], kind="mergesort")]
+        bounds = windows[starting, 0].searchsorted(numpy.arange(nb_images + 1))
+        reversed_cells = set()
+        undecided = []
+        carried = numpy.empty((0,), dtype=int)
+        for t, img in enumerate(images_name):
+            rows = numpy.concatenate((carried, starting[bounds[t]:bounds[t+1]]))
+            if not len(rows):
+                continue
+            img_data = self.data[img]
+            # Points of the cells tested, one cell after the other
+            nb_pts = lengths[rows]
+            row_of_pt = numpy.repeat(numpy.arange(len(rows)), nb_pts)
+            cell_pts = points[numpy.repeat(indptr[rows] - (numpy.cumsum(nb_pts) - nb_pts), nb_pts) +
+                              numpy.arange(int(nb_pts.sum()))]
+            img_pts = numpy.sort(numpy.fromiter(img_data, dtype=numpy.int64, count=len(img_data)))
+            if len(img_pts):
+                pos = numpy.minimum(img_pts.searchsorted(cell_pts), len(img_pts) - 1)
+                in_img = img_pts[pos] == cell_pts
+            else:
+                in_img = numpy.zeros(len(cell_pts), dtype=bool)
+            del img_pts
+            counts = numpy.bincount(row_of_pt[in_img], minlength=len(rows))
+            tested = counts >= 3
+            carried = rows[~tested]
+            carried = carried[windows[carried, 1] > t + 1]
+            if not tested.any():
+                continue
+            pts = cell_pts[in_img & tested[row_of_pt]]
+            nb_pts = counts[tested]
+            ends = numpy.cumsum(nb_pts)
+            starts = ends - nb_pts
+            # Each point is preceded by the wall from the previous point of the polygon
+            prev = numpy.arange(len(pts)) - 1
+            prev[starts] = ends - 1
+            prev_pts = pts[prev]
+            buf, codes, wall_starts, wall_ends = self.walls.packedWalls(t)
+            walls = (numpy.minimum(pts, prev_pts) << 32) | numpy.maximum(pts, prev_pts)
+            w_start = numpy.zeros(len(pts), dtype=int)
+            w_end = numpy.zeros(len(pts), dtype=int)
+            if len(codes):
+                pos = numpy.minimum(codes.searchsorted(walls), len(codes) - 1)
+                found = codes[pos] == walls
+                w_start[found] = wall_starts[pos[found]]
+                w_end[found] = wall_ends[pos[found]]
+            nb_inter = w_end - w_start
+            nb_coords = nb_inter + 1
+            coords_start = numpy.cumsum(nb_coords) - nb_coords
+            k = numpy.arange(int(nb_coords.sum())) - numpy.repeat(coords_start, nb_coords)
+            # The walls are stored from their smallest point, so they are reversed when going from the largest one
+            walls_index = numpy.where(numpy.repeat(prev_pts > pts, nb_coords),
+                                      numpy.repeat(w_end - 1, nb_coords) - k, numpy.repeat(w_start, nb_coords) + k)
+            source = numpy.concatenate((buf, positionsArray(img_data, pts)))
+            source_index = numpy.where(k == numpy.repeat(nb_inter, nb_coords),
+                                       len(buf) + numpy.repeat(numpy.arange(len(pts)), nb_coords), walls_index)
+            coords = source[source_index]
+            areas = polygonsSignedArea(coords, coords_start[starts])
+            for row, area in zip(rows[tested].tolist(), areas.tolist()):
+                if area == 0:
+                    undecided.append(cids[row])
+                elif area < 0:
+                    reversed_cells.add(cids[row])
+        return duplicated, reversed_cells, undecided
+
+    def _removeDuplicatedPoints(self, cid, pt_ids, to_remove, counts):
+        """
+        :returns: the cell `cid`, with points `pt_ids`, without its duplicated points `to_remove`
+        :returntype: tuple of int
+        """
+        cells = self.cells
+        cell_points = self.cell_points
+        pos_to_remove = set()
+        for pt_id in to_remove:
+            pos = -1
+            nb_pt_id = counts[pt_id]
+            nb_removed = 0
+            while nb_pt_id > nb_removed+1:
+                try:
+                    pos = pt_ids.index(pt_id, pos+1)
+                    # Always remove successive points
+                    if pt_ids[pos-1] == pt_id:
+                        pos_to_remove.add(pos)
+                        nb_removed += 1
+                    else:  # Try to figure out if the edge exist somewhere else
+                        other_cids = list(cell_points[pt_id])
+                        other_cids.remove(cid)
+                        for pcids in self.parentCells(cid):
+                            if pcids in other_cids:
+                                other_cids.remove(pcids)
+                        prev_pt_id = pt_ids[pos-1]
+                        next_pt_id = pt_ids[(pos+1) % len(pt_ids)]
+                        for ocid in other_cids:
+                            o_ptids = list(cells[ocid])
+                            oi = o_ptids.index(pt_id)
+                            prev_opt_id = o_ptids[oi-1]
+                            next_opt_id = o_ptids[(oi+1) % len(o_ptids)]
+                            if next_pt_id == prev_opt_id or prev_pt_id == next_opt_id:
+                                break
+                        else:
+                            pos_to_remove.add(pos)
+                            nb_removed += 1
+                except ValueError:
+                    pos = pt_ids.index(pt_id)
+                    while pos in pos_to_remove:
+                        pos = pt_ids.index(pt_id, pos+1)
+                    pos_to_remove.add(pos)
+                    nb_removed += 1
+        pos_to_remove = list(pos_to_remove)
+        pos_to_remove.sort(reverse=True)
+        for pos in pos_to_remove:
+            del pt_ids[pos]
+        return tuple(pt_ids)
+
+    def _cellPolygons(self, pt_ids, ls):
+        """
+        Iterate over the geometry of a cell, including the wall shapes, in each image of its lifespan where it has at
+        least 3 points.
+
+        :returntype: iter of ndarray(N,2)
+        """
+        images_name = self.images_name
+        walls = self.walls
+        for t in range(*ls.slice().indices(len(images_name))):
+            img_data = self.data[images_name[t]]
+            pts = [pid for pid in pt_ids if pid in img_data]
+            if len(pts) < 3:
+                continue
+            coords = []
+            prev = pts[-1]
+            for pid, pos in zip(pts, positionsArray(img_data, pts).tolist()):
+                coords.extend(walls.coordinates(t, prev, pid).tolist())
+                coords.append(pos)
+                prev = pid
+            yield numpy.array(coords, dtype=float)
+
+    @timed("TrackingData.cleanCells")
+    def cleanCells(self, cleaning=None):
         """
         Clean the cells from duplicated or invalid points and return what has been done.
         Also checks if the cells are oriented counter-clockwise or not.
         In case they are, reorient them correctly.
 
+        :Parameters:
+            cleaning : (list of int, list of (tuple of int), list of (tuple of int))
+                Cleaning to apply, as returned by `findCellsCleaning`. If None, it is computed first. Cells whose
+                shape changed since the cleaning was computed are left untouched.
+
         :returns: The list of cells changed, and the shape of the cells before the change.
         :returntype: (list of int, list of (list of int))
         """
-        saved_cells = []
-        changed_cells = []
+        if cleaning is None:
+            cleaning = self.findCellsCleaning()
         cells = self.cells
-        cell_points = self.cell_points
-        for cid in cells:
-            pt_ids = list(cells[cid])
-            # First, find duplicate points
-            to_remove = set(pt_id for pt_id in pt_ids if pt_ids.count(pt_id) > 1)
-            if to_remove:
-                saved_cells.append(cells[cid])
-                changed_cells.append(cid)
-                pos_to_remove = set()
-                for pt_id in to_remove:
-                    pos = -1
-                    nb_pt_id = pt_ids.count(pt_id)
-                    nb_removed = 0
-                    while nb_pt_id > nb_removed+1:
-                        try:
-                            pos = pt_ids.index(pt_id, pos+1)
-                            # Always remove successive points
-                            if pt_ids[pos-1] == pt_id:
-                                pos_to_remove.add(pos)
-                                nb_removed += 1
-                            else:  # Try to figure out if the edge exist somewhere else
-                                other_cids = list(cell_points[pt_id])
-                                other_cids.remove(cid)
-                                for pcids in self.parentCells(cid):
-                                    if pcids in other_cids:
-                                        other_cids.remove(pcids)
-                                prev_pt_id = pt_ids[pos-1]
-                                next_pt_id = pt_ids[(pos+1) % len(pt_ids)]
-                                for ocid in other_cids:
-                                    o_ptids = list(cells[ocid])
-                                    oi = o_ptids.index(pt_id)
-                                    prev_opt_id = o_ptids[oi-1]
-                                    next_opt_id = o_ptids[(oi+1) % len(o_ptids)]
-                                    if next_pt_id == prev_opt_id or prev_pt_id == next_opt_id:
-                                        break
-                                else:
-                                    pos_to_remove.add(pos)
-                                    nb_removed += 1
-                        except ValueError:
-                            pos = pt_ids.index(pt_id)
-                            while pos in pos_to_remove:
-                                pos = pt_ids.index(pt_id, pos+1)
-                            pos_to_remove.add(pos)
-                            nb_removed += 1
-                pos_to_remove = list(pos_to_remove)
-                pos_to_remove.sort(reverse=True)
-                for pos in pos_to_remove:
-                    del pt_ids[pos]
-                cells[cid] = tuple(pt_ids)
-            # Then, check the cell is oriented counter-clockwise
-            # Remember, the reference system is inverted
-            for img in self.imagesWithCell(cid):
-                imgdata = self[img]
-                walls = imgdata.walls
-                pts = self.cellAtTime(cid, img)
-                if len(pts) < 3:
-                    continue
-                geometry = sum([walls[pts[i-1], pts[i]] + [imgdata[pts[i]]] for i in range(len(pts))], [])
-                area = 0
-                for i in range(len(geometry)):
-                    p1 = geometry[i-1]
-                    p2 = geometry[i]
-                    area += cross(p1, p2)
-                if area < 0:
-                    saved_cells.append(cells[cid])
-                    changed_cells.append(cid)
-                    cells[cid] = cells[cid][::-1]
-                    break
-                elif area > 0:
-                    break
+        changed_cells = []
+        saved_cells = []
+        for cid, old_pt_ids, new_pt_ids in zip(*cleaning):
+            if tuple(cells.get(cid, ())) != tuple(old_pt_ids):
+                continue
+            changed_cells.append(cid)
+            saved_cells.append(cells[cid])
+            cells[cid] = tuple(new_pt_ids)
         if changed_cells:
             self._cellsChanged(changed_cells)
         self.checkCells()
@@ -2072,10 +3520,16 @@ class TrackingData(QObject):
         return result
 
 
-class ImageData(QObject):
+class ImageData(object):
     """
     Class representing the data specific of one image in a data set.
 
+    This is a lightweight view on the `TrackingData` object. Views are cached per image by the data set, so
+    accessing an image repeatedly doesn't allocate new objects.
+
+    The positions returned are shared with the snapshots of the data set and must not be modified in place: assign
+    the new positions instead.
+
     :IVariables:
         parent : `TrackingData`
             data set the image is part of
@@ -2094,8 +3548,9 @@ class ImageData(QObject):
         walls : `TimedWallShapes`
             walls existing in the image
     """
+    __slots__ = ('parent', '_current_image', '_current_data', '_current_index', 'cells', 'walls')
+
     def __init__(self, parent, image_name):
-        QObject.__init__(self)
         self.parent = parent
         if image_name not in parent:
             try:
@@ -2108,8 +3563,16 @@ class ImageData(QObject):
         self.cells = TimedCells(self)
         self.walls = TimedWallShapes(parent.walls, self._current_index)
 
-    def __del__(self):
-        cleanQObject(self)
+    def _valid(self):
+        """
+        Check the view still reflects the state of the data set
+        """
+        parent = self.parent
+        idx = self._current_index
+        names = parent.images_name
+        return (idx < len(names) and names[idx] == self._current_image and
+                parent.data.get(self._current_image) is self._current_data and
+                self.walls._walls is parent.walls)
 
     @property
     def index(self):
@@ -2179,7 +3642,8 @@ class ImageData(QObject):
             iter(pt_id)
         except TypeError:
             return self.__setitem__([pt_id], [value])
-        data = self._current_data
+        data = self.parent._writablePositions(self._current_image)
+        self._current_data = data
         moved = []
         added = []
         for i, val in zip(pt_id, value):
@@ -2187,7 +3651,7 @@ class ImageData(QObject):
                 moved.append(i)
             else:
                 added.append(i)
-            data[i] = val
+            data[i] = QPointF(val)
             self.parent.cell_points.setdefault(i, set())
         if moved:
             self.parent._pointsMoved(self._current_image, moved)
@@ -2206,38 +3670,11 @@ class ImageData(QObject):
             iter(pt_id)
         except TypeError:
             return self.__delitem__([pt_id])
-        parent = self.parent
-        parent._pointsDeleted(self._current_image, pt_id)
         data = self._current_data
         for pt in pt_id:
-            del data[pt]
-# Figure out if the point still exists at all, and if not, if any cell has to
-# be deleted
-        cell_points = parent.cell_points
-        cells = parent.cells
-        delete_cells = set()
-        change_cells = set()
-        saved_cells = {}
-        for pt in pt_id:
-            imgs = parent.imagesWithPoint(pt)
-            if not imgs:
-                for cid in cell_points[pt]:
-                    for cid in saved_cells:
-                        saved_cells[cid] = cells[cid]
-                    cells[cid] = tuple(p for p in cells[cid] if p != pt)
-                    change_cells.add(cid)
-                    if not cells[cid]:
-                        delete_cells.add(cid)
-                del cell_points[pt]
-        if change_cells:
-            cc = list(change_cells)
-            parent._cellsChanged(cc)
-        if delete_cells:
-            dc = list(delete_cells)
-            parent._cellsRemoved(dc)
-            for cid in delete_cells:
-                del cells[cid]
-        parent.checkCells()
+            if pt not in data:
+                raise KeyError(pt)
+        self.parent.deletePoints(pt_id, [self._current_image])
 
     def simulate_delete(self, pt_id):
         """
@@ -2317,18 +3754,39 @@ class ImageData(QObject):
             shift = [pos, angle]
             # Change position of the points
             self.parent.images_shift[self._current_image] = shift
-            mat = inv_old_mat*self.matrix()
-            for pos in self.positions():
-                npos = mat.map(pos)
-                pos.setX(npos.x())
-                pos.setY(npos.y())
-            # Change position of the walls
-            for w in self.walls:
-                wall = self.walls[w]
-                new_wall = [mat.map(pt) for pt in wall]
-                self.walls[w] = new_wall
+            self.transform(affineMatrix(inv_old_mat*self.matrix()))
             self.parent._pointsMoved(self._current_image, self.points())
 
+    def coordinates(self):
+        """
+        Positions of the points in the current image, as an array.
+
+        Returns: (list of int, ndarray(N,2))
+            the ids of the points and their positions, in the same order
+        """
+        cd = self._current_data
+        pids = list(cd)
+        coords = numpy.array([(p.x(), p.y()) for p in cd.values()], dtype=float).reshape(-1, 2)
+        return pids, coords
+
+    def transform(self, mat):
+        """
+        Apply an affine transformation on all the points and walls of the current image.
+
+        No signal is sent, this is left to the caller.
+
+        Arguments:
+          - mat, ndarray(2,3): affine matrix, as returned by `geometry.affineMatrix`
+        """
+        data = self.parent._writablePositions(self._current_image)
+        self._current_data = data
+        pids = list(data)
+        if pids:
+            coords = numpy.array([(p.x(), p.y()) for p in data.values()], dtype=float)
+            for pid, (x, y) in zip(pids, transformCoordinates(mat, coords).tolist()):
+                data[pid] = QPointF(x, y)
+        self.parent.walls.transform(self._current_index, mat)
+
     @property
     def shift(self):
         return self.parent.images_shift[self.image_name]
@@ -2450,7 +3908,7 @@ class TimedCells(object):
         parent = image_data.parent
         idx = image_data._current_index
         cells = parent.cells
-        cells_lifespan = parent.cells_lifespan
+        cells_lifespan = parent._writableLifespans()
         cell_points = parent.cell_points
         ls = cells_lifespan[cid]
         if ls.end != idx:
@@ -2466,9 +3924,11 @@ class TimedCells(object):
                 cell_points[pt].remove(c)
             del cells[c]
             del cells_lifespan[c]
+        ls = ls.copy()
         ls.end = EndOfTime()
         del ls.daughters
         del ls.division
+        parent._setLifespan(cid, ls)
         parent._cellsAdded([cid], parent.images_name[idx:])
         parent.checkCells()
 
@@ -2494,12 +3954,13 @@ class TimedCells(object):
         except ValueError:
             raise ValueError("The division must be done by points contained by the polygon."
                              " Points %d and %d are not part of the cell %d." % (p1, p2, cid))
-        ls = cells_lifespan[cid]
+        ls = ls.copy()
         ls.end = idx
         ls.division = (p1, p2)
         ls.daughters = (cid1, cid2)
-        cells_lifespan[cid1] = LifeSpan(start=idx, parent=cid)
-        cells_lifespan[cid2] = LifeSpan(start=idx, parent=cid)
+        parent._setLifespan(cid, ls)
+        parent._setLifespan(cid1, LifeSpan(start=idx, parent=cid))
+        parent._setLifespan(cid2, LifeSpan(start=idx, parent=cid))
         cell_points = parent.cell_points
         if i1 < i2:
             poly1 = poly[i1:i2+1]
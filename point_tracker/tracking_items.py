@@ -606,7 +606,8 @@ class CellItem(QGraphicsItem):
                 j = (i+1) % len(polygon)
                 while polygon[j] is None:
                     j = (j+1) % len(polygon)
-                w = [QPointF(p.x()*real_scale_x, p.y()*real_scale_y) for p in walls[polygon_id[i], polygon_id[j]]]
+                w = [QPointF(x*real_scale_x, y*real_scale_y)
+                     for x, y in walls.coordinates(polygon_id[i], polygon_id[j]).tolist()]
                 sides[i] = [polygon[i]] + w + [polygon[j]]
         prev = real_polygon[-1]
         polygon_shape = []
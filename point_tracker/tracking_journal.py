@@ -0,0 +1,467 @@
+from __future__ import print_function, division, absolute_import
+"""
+Append-only journal of the modifications made on a data file.
+
+The journal is a text file next to the data file, with one JSON record per line. The first line identifies the data
+file the journal applies to, by the SHA-1 digest of its content. Each following line is either the new state of the
+points, images, cells and walls modified by one command, or a checkpoint marking the records saved by the user. The
+records use the ids of the points and cells in the data file, which are not those in memory once the data were
+saved in the text format.
+
+Loading a data file replays the records of its journal saved by the user, so every reader of the file sees the saved
+data. Records after the last checkpoint are unsaved modifications: they are only replayed when the project is opened,
+to recover them after a crash. Compacting the journal rewrites the data file and removes the journal. A journal
+which doesn't match its data file anymore (e.g. the file was replaced) is set aside rather than removed.
+"""
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+import hashlib
+import json
+import os
+from PyQt4.QtCore import QPointF
+from .path import path
+from .debug import log_debug, log_warning
+from .tracking_data import LifeSpan
+from . import tracking_binary
+
+JOURNAL_VERSION = 2
+"""
+Version of the journal format. Journals of version 1 identify their data file by its size and modification time.
+
+:type: int
+"""
+
+
+def journalFile(data_file):
+    """
+    :returns: the path of the journal of a data file
+    :returntype: `path`
+    """
+    return path(data_file + ".journal")
+
+
+def discardedJournalFile(data_file):
+    """
+    :returns: the path a journal which doesn't match its data file is moved to
+    :returntype: `path`
+    """
+    return path(data_file + ".journal.discarded")
+
+
+_snapshot_ids = {}
+"""
+Digest of the data files already read, with the size and modification time they had
+
+:type: dict of `path` * ((int, float), str)
+"""
+
+
+def _snapshotId(data_file):
+    """
+    :returns: the SHA-1 digest of the content of `data_file`. The digest is only computed again if the size or
+        modification time of the file changed.
+    :returntype: str
+    """
+    data_file = path(data_file).abspath()
+    st = os.stat(data_file)
+    key = (st.st_size, st.st_mtime)
+    known = _snapshot_ids.get(data_file)
+    if known is not None and known[0] == key:
+        return known[1]
+    digest = hashlib.sha1()
+    with open(data_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest = digest.hexdigest()
+    _snapshot_ids[data_file] = (key, digest)
+    return digest
+
+
+def _matches(header, data_file):
+    """
+    :returns: True if the journal header identifies the current content of `data_file`
+    :returntype: bool
+    """
+    version = header.get("journal")
+    if version == 1:
+        st = os.stat(data_file)
+        return header.get("snapshot") == [st.st_size, st.st_mtime]
+    return version == JOURNAL_VERSION and header.get("snapshot") == _snapshotId(data_file)
+
+
+def _readRecords(data_file):
+    """
+    :returns: the records of the journal of `data_file`, the number of records saved and the size of the part of the
+        journal holding them, or None if there is no valid journal for this file
+    :returntype: (list of dict, int, int) | None
+    """
+    jfile = journalFile(data_file)
+    if not jfile.exists() or not path(data_file).exists():
+        return None
+    with open(jfile, "rb") as f:
+        lines = f.read().split(b"\n")
+    try:
+        header = json.loads(lines[0].decode("ascii"))
+    except ValueError:
+        log_warning("Invalid journal header in %s, the journal is ignored.", jfile)
+        return None
+    if not _matches(header, data_file):
+        log_warning("Journal %s doesn't match the content of %s, it is ignored.", jfile, data_file)
+        return None
+    records = []
+    nb_saved = 0
+    size = saved_size = len(lines[0]) + 1
+    for l in lines[1:]:
+        try:
+            record = json.loads(l.decode("ascii"))
+        except ValueError:  # Last line interrupted by a crash
+            break
+        size += len(l) + 1
+        if record.get("checkpoint"):
+            nb_saved = len(records)
+            saved_size = size
+        else:
+            records.append(record)
+    return records, nb_saved, saved_size
+
+
+def isValid(data_file):
+    """
+    :returns: True if `data_file` has a journal which applies to its current content
+    :returntype: bool
+    """
+    return _readRecords(data_file) is not None
+
+
+def setAside(data_file):
+    """
+    Move the journal of `data_file` to `discardedJournalFile`, replacing any journal set aside before.
+
+    :returns: the new path of the journal
+    :returntype: `path`
+    """
+    discarded = discardedJournalFile(data_file)
+    if discarded.exists():
+        discarded.remove()
+    journalFile(data_file).rename(discarded)
+    return discarded
+
+
+def saveData(data, data_file):
+    """
+    Save `data` in `data_file` through a temporary file, so the data file is never half written: the journal of the
+    previous content stays usable until the new content is complete.
+
+    :returns: the ids of points and cells in the file
+    :returntype: (dict of int*int, dict of int*int)
+    """
+    data_file = path(data_file)
+    part = data_file.stripext() + ".part" + data_file.ext
+    ids = data.save(part)
+    if data_file.ext == tracking_binary.EXTENSION:
+        tracking_binary.release(data_file)
+    if data_file.exists():
+        data_file.remove()
+    part.rename(data_file)
+    return ids
+
+
+def savedSize(data_file):
+    """
+    :returns: the size of the part of the journal of `data_file` saved by the user, or None if there is no valid
+        journal
+    :returntype: int | None
+    """
+    result = _readRecords(data_file)
+    if result is None:
+        return None
+    return result[2]
+
+
+def replay(data, data_file, unsaved=True):
+    """
+    Apply the journal of `data_file`, if any, on the data just loaded from it.
+
+    :Parameters:
+        unsaved : bool
+            If True, the records after the last checkpoint are also applied
+
+    :returns: True if modifications not saved by the user were recovered
+    :returntype: bool
+    """
+    result = _readRecords(data_file)
+    if result is None:
+        return False
+    records, nb_saved, _ = result
+    if not unsaved:
+        records = records[:nb_saved]
+    if not records:
+        return False
+    log_debug("Replaying %d records of the journal of %s" % (len(records), data_file))
+    positions = dict((img, dict(d)) for img, d in data.data.items())
+    shifts = dict((img, list(sh)) for img, sh in data.images_shift.items())
+    scales = dict(data.images_scale)
+    times = list(data.images_time)
+    cells = dict(data.cells.items())
+    cells_lifespan = dict(data.cells_lifespan)
+    walls = data.walls
+    last_pt_id = data._last_pt_id
+    last_cell_id = data._last_cell_id
+    for record in records:
+        for img, (moved, deleted) in record.get("points", {}).items():
+            d = positions[img]
+            for pid, x, y in moved:
+                d[pid] = QPointF(x, y)
+            for pid in deleted:
+                d.pop(pid, None)
+        for img, (x, y, angle, sx, sy) in record.get("images", {}).items():
+            shifts[img] = [QPointF(x, y), angle]
+            scales[img] = (sx, sy)
+        if "times" in record:
+            times = record["times"]
+        for cid, pt_ids, ls in record.get("cells", ()):
+            cells[cid] = tuple(pt_ids)
+            lifespan = LifeSpan()
+            for i, v in enumerate(ls):
+                lifespan[i] = v
+            cells_lifespan[cid] = lifespan
+        for cid in record.get("deleted_cells", ()):
+            cells.pop(cid, None)
+            cells_lifespan.pop(cid, None)
+        for t, p1, p2, coords in record.get("walls", ()):
+            if coords is None:
+                walls.removeWall(t, p1, p2)
+            else:
+                walls.setWall(t, p1, p2, [QPointF(x, y) for x, y in zip(coords[::2], coords[1::2])])
+        last_pt_id, last_cell_id = record["last_ids"]
+    data._set_data(positions, shifts, scales, cells, cells_lifespan, times, walls)
+    data._last_pt_id = last_pt_id
+    data._last_cell_id = last_cell_id
+    return len(records) > nb_saved
+
+
+class EditJournal(object):
+    """
+    Journal recording the modifications of a data set.
+
+    The journal listens to the signals of the data set to know what is modified. Each call to `commit` appends the
+    current state of what was modified since the previous call.
+
+    :IVariables:
+        data : `TrackingData`
+            data set recorded
+        data_file : `path`
+            data file the journal applies to
+        filename : `path`
+            file of the journal
+        file_ids : (dict of int*int, dict of int*int) | None
+            ids of the points and cells of the data in the data file, as returned by `TrackingData.save`, or None if
+            they are the same as in memory. Points and cells created since are given the next ids.
+    """
+    def __init__(self, data, data_file, file_ids=None):
+        self.data = data
+        self.data_file = path(data_file)
+        self.filename = journalFile(data_file)
+        self.file_ids = file_ids
+        self._saved_size = None
+        self._points = {}
+        self._images = set()
+        self._cells = set()
+        self._times = list(data.images_time)
+        self._last_ids = [data._last_pt_id, data._last_cell_id]
+        self._walls = data.walls
+        self._wall_changes = set()
+        self._walls.changes.append(self._wall_changes)
+        data.pointsAdded.connect(self._pointsChanged)
+        data.pointsMoved.connect(self._pointsChanged)
+        data.pointsDeleted.connect(self._pointsChanged)
+        data.imageMoved.connect(self._imageMoved)
+        data.cellsAdded.connect(self._cellsChanged)
+        data.cellsRemoved.connect(self._cellsChanged)
+        data.cellsChanged.connect(self._cellsChanged)
+        if self.filename.exists():
+            self._saved_size = savedSize(data_file)
+            if self._saved_size is None:
+                self._saved_size = self.filename.getsize()
+
+    def close(self):
+        """
+        Stop recording the modifications
+        """
+        data = self.data
+        data.pointsAdded.disconnect(self._pointsChanged)
+        data.pointsMoved.disconnect(self._pointsChanged)
+        data.pointsDeleted.disconnect(self._pointsChanged)
+        data.imageMoved.disconnect(self._imageMoved)
+        data.cellsAdded.disconnect(self._cellsChanged)
+        data.cellsRemoved.disconnect(self._cellsChanged)
+        data.cellsChanged.disconnect(self._cellsChanged)
+        self._walls.changes.remove(self._wall_changes)
+
+    def _pointsChanged(self, image_name, ids):
+        self._points.setdefault(image_name, set()).update(ids)
+
+    def _imageMoved(self, image_name, scale, pos, angle):
+        self._images.add(image_name)
+
+    def _cellsChanged(self, cells, image_list=None):
+        self._cells.update(cells)
+
+    @property
+    def file_ids(self):
+        return self._file_ids
+
+    @file_ids.setter
+    def file_ids(self, ids):
+        self._file_ids = ids
+        if ids is None:
+            self._next_ids = None
+        else:
+            self._next_ids = [max(m.values()) + 1 if m else 0 for m in ids]
+
+    def _fileId(self, kind, mem_id):
+        """
+        :Parameters:
+            kind : int
+                0 for a point, 1 for a cell
+
+        :returns: the id in the data file of the point or cell `mem_id`
+        :returntype: int
+        """
+        if self._file_ids is None:
+            return mem_id
+        ids = self._file_ids[kind]
+        fid = ids.get(mem_id)
+        if fid is None:
+            fid = ids[mem_id] = self._next_ids[kind]
+            self._next_ids[kind] += 1
+        return fid
+
+    def _fileLifespan(self, ls):
+        values = [ls[i] for i in range(len(ls))]
+        if self._file_ids is None:
+            return values
+        fileId = self._fileId
+        if values[2] != -1:
+            values[2] = fileId(1, values[2])
+        if len(values) > 3:
+            values[3:5] = [fileId(1, c) for c in values[3:5]]
+            values[5:7] = [fileId(0, p) for p in values[5:7]]
+        return values
+
+    def _record(self):
+        """
+        :returns: the record of the modifications since the last commit, or None if there is none
+        :returntype: dict | None
+        """
+        data = self.data
+        fileId = self._fileId
+        record = {}
+        points = {}
+        for img, ids in self._points.items():
+            d = data.data.get(img)
+            if d is None:
+                continue
+            moved = [(fileId(0, pid), d[pid].x(), d[pid].y()) for pid in ids if pid in d]
+            deleted = [fileId(0, pid) for pid in ids if pid not in d]
+            points[img] = (moved, deleted)
+        if points:
+            record["points"] = points
+        images = {}
+        for img in self._images:
+            if img in data.images_shift:
+                pos, angle = data.images_shift[img]
+                images[img] = (pos.x(), pos.y(), angle) + tuple(data.images_scale[img])
+        if images:
+            record["images"] = images
+        times = list(data.images_time)
+        if times != self._times:
+            record["times"] = times
+            self._times = times
+        cells = data.cells
+        changed_cells = [cid for cid in self._cells if cid in cells]
+        if changed_cells:
+            lifespans = data.cells_lifespan
+            record["cells"] = [(fileId(1, cid), [fileId(0, pid) for pid in cells[cid]],
+                                self._fileLifespan(lifespans[cid])) for cid in changed_cells]
+        deleted_cells = [fileId(1, cid) for cid in self._cells if cid not in cells]
+        if deleted_cells:
+            record["deleted_cells"] = deleted_cells
+        walls = data.walls
+        if walls is not self._walls:
+            # The walls have been replaced, record all of them
+            self._walls.changes.remove(self._wall_changes)
+            self._walls = walls
+            walls.changes.append(self._wall_changes)
+            changed_walls = set(walls)
+        else:
+            changed_walls = set(self._wall_changes)
+        self._wall_changes.clear()
+        if changed_walls:
+            record["walls"] = [(t, fileId(0, p1), fileId(0, p2), walls.coordinates(t, p1, p2).ravel().tolist()
+                                if (t, p1, p2) in walls else None) for t, p1, p2 in changed_walls]
+        last_ids = [data._last_pt_id, data._last_cell_id]
+        if record or last_ids != self._last_ids:
+            if self._file_ids is None:
+                record["last_ids"] = last_ids
+            else:
+                record["last_ids"] = [n - 1 for n in self._next_ids]
+            self._last_ids = last_ids
+        self._points = {}
+        self._images = set()
+        self._cells = set()
+        return record or None
+
+    def _append(self, record):
+        jfile = self.filename
+        if not jfile.exists():
+            with open(jfile, "w") as f:
+                f.write(json.dumps({"journal": JOURNAL_VERSION, "snapshot": _snapshotId(self.data_file)}) + "\n")
+            self._saved_size = jfile.getsize()
+        with open(jfile, "a") as f:
+            f.write(json.dumps(record, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def commit(self):
+        """
+        Append the modifications since the last commit to the journal.
+        """
+        record = self._record()
+        if record is not None:
+            self._append(record)
+
+    def checkpoint(self):
+        """
+        Commit the pending modifications and mark all the records as saved by the user.
+        """
+        self.commit()
+        if self.filename.exists():
+            self._append({"checkpoint": True})
+            self._saved_size = self.filename.getsize()
+
+    def rollback(self):
+        """
+        Drop the records not saved by the user.
+        """
+        self._record()
+        jfile = self.filename
+        if not jfile.exists():
+            return
+        if self._saved_size is None:
+            jfile.remove()
+        else:
+            with open(jfile, "r+") as f:
+                f.truncate(self._saved_size)
+
+    def compact(self):
+        """
+        Rewrite the data file with the current state of the data and remove the journal.
+
+        Only the saved modifications must be in memory: call `rollback` first if unsaved modifications were undone.
+        """
+        self._record()
+        self.file_ids = saveData(self.data, self.data_file)
+        if self.filename.exists():
+            self.filename.remove()
+        self._saved_size = None
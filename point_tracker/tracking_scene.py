@@ -14,7 +14,7 @@ from .tracking_undo import (AddPoints, RemovePoints, MovePoints, RemovePointsInA
 from . import parameters
 from .tracking_items import PointItem, OldPointItem, ArrowItem, TemplateItem, CellItem
 from .geometry import makeStarShaped
-from .debug import log_debug
+from .debug import log_debug, lazy
 from .sys_utils import createForm, cleanQObject
 from .tracking_data import EndOfTime
 
@@ -268,7 +268,7 @@ class TrackingScene(QGraphicsScene):
         self.undo_stack.push(DivideCellCommand(self.data_manager, self.image_name, cell_id, cid1, cid2, p1, p2))
 
     def planRemoveCells(self, cell_ids):
-        log_debug("Planning remove cells %s" % ", ".join("%d" % c for c in cell_ids))
+        log_debug("Planning remove cells %s", lazy(", ".join, ("%d" % c for c in cell_ids)))
         self.undo_stack.push(RemoveCellsCommand(self.data_manager, cell_ids))
 
     def mouseReleaseEvent(self, event):
@@ -292,32 +292,53 @@ class TrackingScene(QGraphicsScene):
             QGraphicsScene.mouseReleaseEvent(self, event)
             if event.isAccepted():
                 return
-            items = self.items(event.scenePos())
-            if items:
-                pt = items[0]
-                if isinstance(pt, PointItem):
-                    pt_id = pt.pt_id
-                    cells = self.current_data.cells
-                    if self.has_current_cell:
-                        cid = self.current_cell
-                        cell_shape = list(cells[cid])
-                        if pt_id in cell_shape:
-                            cell_shape.remove(pt_id)
-                            self.planChangeCell(cid, cell_shape)
-                        else:
-                            cell_shape.append(pt_id)
-                            self.planChangeCell(cid, cell_shape)
+            pt_id = self.pointAt(event.scenePos())
+            if pt_id is not None:
+                cells = self.current_data.cells
+                if self.has_current_cell:
+                    cid = self.current_cell
+                    cell_shape = list(cells[cid])
+                    if pt_id in cell_shape:
+                        cell_shape.remove(pt_id)
+                        self.planChangeCell(cid, cell_shape)
                     else:
-                        cid = self.current_cell
-                        cell_shape = [pt_id]
-                        self.planAddCell(cid, cell_shape)
+                        cell_shape.append(pt_id)
+                        self.planChangeCell(cid, cell_shape)
+                else:
+                    cid = self.current_cell
+                    cell_shape = [pt_id]
+                    self.planAddCell(cid, cell_shape)
             return
         QGraphicsScene.mouseReleaseEvent(self, event)
 
+    def pointAt(self, scene_pos):
+        """
+        :returns: the id of the point drawn at a position of the scene, the closest one if they overlap, or None
+        :returntype: int | None
+        """
+        if self.current_data is None:
+            return None
+        radius = parameters.instance.point_size*max(self.scale)
+        index = self.data_manager.pointIndex(self.image_name)
+        pts = index.nearest(scene_pos*self.min_scale, 1, radius)
+        if pts:
+            return pts[0]
+        return None
+
+    def pointsIn(self, region):
+        """
+        :returns: the ids of the points whose center is inside a polygon of the scene
+        :returntype: list of int
+        """
+        if self.current_data is None:
+            return []
+        index = self.data_manager.pointIndex(self.image_name)
+        return index.withinPolygon([p*self.min_scale for p in region])
+
     def setPointCellSelection(self, region):
         add_pts = []
         remove_pts = []
-        items = [p.pt_id for p in self.items(region) if isinstance(p, PointItem)]
+        items = self.pointsIn(region)
         if items:
             #print "New cell with: %s" % (items,)
             cells = self.current_data.cells
@@ -438,10 +459,9 @@ class TrackingScene(QGraphicsScene):
     #        return pts
 
     def addPointToCell(self, cid, side, pt):
-        pts = [p.pt_id for p in self.items(pt) if isinstance(p, PointItem)]
-        if pts:
+        pt_id = self.pointAt(pt)
+        if pt_id is not None:
             data = self.data_manager
-            pt_id = pts[0]
             #print "Add point %d to cell %d in side %d" % (pt_id, cid, side)
             cell_points = list(self.current_data.cells[cid])
             prev_pt = cell_points[side-1]
@@ -646,7 +666,7 @@ class TrackingScene(QGraphicsScene):
                         cell.setGeometry()
 
     def addCells(self, cell_ids, image_list=None):
-        log_debug("addCell signal with images: (%s,%s)" % (cell_ids, image_list))
+        log_debug("addCell signal with images: (%s,%s)", cell_ids, image_list)
         if image_list is not None:
             used_ids = []
             used_il = []
@@ -659,18 +679,18 @@ class TrackingScene(QGraphicsScene):
                 return
             cell_ids = used_ids
             image_list = used_il
-        log_debug("Adding cells %s to image %s" % (','.join("%d" % c for c in cell_ids), self.image_name))
+        log_debug("Adding cells %s to image %s", lazy(",".join, ("%d" % c for c in cell_ids)), self.image_name)
         data = self.data_manager
         current_data = self.current_data
         cell_ids = [cid for cid in cell_ids if cid in current_data.cells]
-        log_debug("cell_ids = %s" % (cell_ids,))
+        log_debug("cell_ids = %s", cell_ids)
         points = self.points
         cells = self.cells
         cell_points = data.cell_points
         for cid in cell_ids:
             if cid in cells or not [pid for pid in current_data.cells[cid] if pid in current_data]:
                 continue
-            log_debug("-- Add cell %d with points %s" % (cid, current_data.cells[cid]))
+            log_debug("-- Add cell %d with points %s", cid, current_data.cells[cid])
             ci = CellItem(self.img_scale, self.min_scale, cid, current_data.cells[cid], points, current_data.walls)
             self.addItem(ci)
             cells[cid] = ci
@@ -690,7 +710,7 @@ class TrackingScene(QGraphicsScene):
                     pt.setCells(cells[i] for i in cell_points[pid] if i in cells)
 
     def removeCells(self, cell_ids, image_list=None):
-        log_debug("removeCells signal with images: (%s,%s)" % (cell_ids, image_list))
+        log_debug("removeCells signal with images: (%s,%s)", cell_ids, image_list)
         if image_list is not None:
             used_ids = []
             used_il = []
@@ -703,7 +723,7 @@ class TrackingScene(QGraphicsScene):
                 return
             cell_ids = used_ids
             image_list = used_il
-        log_debug("Removing cells %s to image %s" % (','.join("%d" % c for c in cell_ids), self.image_name))
+        log_debug("Removing cells %s to image %s", lazy(",".join, ("%d" % c for c in cell_ids)), self.image_name)
         if self.has_current_cell and self.current_cell in cell_ids:
             del self.current_cell
         cells = self.cells
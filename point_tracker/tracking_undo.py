@@ -45,6 +45,46 @@ class MovePoints(PointsCommand):
             data[pt_id] = mvt[1]
 
 
+def changeParent(data, cell_ids, parent):
+    """
+    Change the parent of the cells `cell_ids`.
+
+    The life spans of the data set are frozen, so they are changed through copies.
+    """
+    lifespans = []
+    for cid in cell_ids:
+        ls = data.lifespan(cid).copy()
+        ls.parent = parent
+        lifespans.append(ls)
+    data.changeCellsLifespan(cell_ids, lifespans)
+
+
+def changeDaughter(data, cell_id, daughter, new_daughter):
+    """
+    Replace the daughter `daughter` of the cell `cell_id` with `new_daughter`.
+    """
+    ls = data.lifespan(cell_id).copy()
+    dgtrs = list(ls.daughters)
+    if dgtrs[0] == daughter:
+        dgtrs[0] = new_daughter
+    else:
+        dgtrs[1] = new_daughter
+    ls.daughters = dgtrs
+    data.changeCellsLifespan([cell_id], [ls])
+
+
+def changeDivision(data, cell_id, pos, pt_id):
+    """
+    :returns: a copy of the life span of `cell_id`, whose division point `pos` is replaced with `pt_id`
+    :returntype: `LifeSpan`
+    """
+    ls = data.lifespan(cell_id).copy()
+    div = list(ls.division)
+    div[pos] = pt_id
+    ls.division = div
+    return ls
+
+
 def cellsToWatch(data, pts_id):
     """
     :returns: A dictionnary of the cells to watch with their current state
@@ -132,6 +172,7 @@ class RemovePointsInImages(PointsCommand):
     def __init__(self, title, data_manager, image_name, pts_id, image_list, cmd_id=-1, parent=None):
         PointsCommand.__init__(self, title, data_manager, image_name, cmd_id, parent)
         self.pts_id = pts_id
+        self.image_list = image_list
         self.images = [[im
                         for im in image_list
                         if pt in data_manager[im]] for pt in pts_id]
@@ -142,18 +183,21 @@ class RemovePointsInImages(PointsCommand):
 
     def undo(self):
         data = self.data_manager
+        per_image = {}
         for img, pt, poss in zip(self.images, self.pts_id, self.pos):
             for image, pos in zip(img, poss):
-                data[image][pt] = pos
+                pts, positions = per_image.setdefault(image, ([], []))
+                pts.append(pt)
+                positions.append(pos)
+        for image, (pts, positions) in per_image.items():
+            data[image][pts] = positions
         if self.modified_cells:
             data.setCells(*self.modified_cells)
 
     def redo(self):
         data = self.data_manager
         self.presence = {}
-        for imgs, pt in zip(self.images, self.pts_id):
-            for image in imgs:
-                del data[image][pt]
+        data.deletePoints(self.pts_id, self.image_list)
         if self.first_run:
             self.first_run = False
             self.modified_cells = modifiedCells(data, self.watching_cells)
@@ -220,10 +264,7 @@ class SplitCells(PointsCommand):
 
     def undo(self):
         if self.ls.daughters:
-            ls0 = self.data_manager.lifespan(self.ls.daughters[0])
-            ls1 = self.data_manager.lifespan(self.ls.daughters[1])
-            ls0.parent = self.cell_id
-            ls1.parent = self.cell_id
+            changeParent(self.data_manager, self.ls.daughters, self.cell_id)
         self.data_manager.removeCells(self.new_cell_id)
         self.data_manager.setCells(self.cell_id, self.cell, self.ls)
 
@@ -231,10 +272,7 @@ class SplitCells(PointsCommand):
         first_ls = LifeSpan(start=self.ls.start, end=self.split_time, parent=self.ls.parent)
         second_ls = LifeSpan(start=self.split_time, end=self.ls.end, daughters=self.ls.daughters)
         if self.ls.daughters:
-            ls0 = self.data_manager.lifespan(self.ls.daughters[0])
-            ls1 = self.data_manager.lifespan(self.ls.daughters[1])
-            ls0.parent = self.new_cell_id
-            ls1.parent = self.new_cell_id
+            changeParent(self.data_manager, self.ls.daughters, self.new_cell_id)
         first_cell = []
         second_cell = []
         first_images = set(self.data_manager.imagesWithLifespan(first_ls))
@@ -272,18 +310,9 @@ class MergeCells(PointsCommand):
 
     def undo(self):
         if self.ls_cid.parent:
-            lsp = self.data_manager.lifespan(self.ls_cid.parent)
-            dgtrs = list(lsp.daughters)
-            if dgtrs[0] == self.new_cell_id:
-                dgtrs[0] = self.cell_id
-            else:
-                dgtrs[1] = self.cell_id
-            lsp.daughters = dgtrs
+            changeDaughter(self.data_manager, self.ls_cid.parent, self.new_cell_id, self.cell_id)
         if self.ls_cid.daughters:
-            ls0 = self.data_manager.lifespan(self.ls_cid.daughters[0])
-            ls1 = self.data_manager.lifespan(self.ls_cid.daughters[1])
-            ls0.parent = self.cell_id
-            ls1.parent = self.cell_id
+            changeParent(self.data_manager, self.ls_cid.daughters, self.cell_id)
         log_debug("Restoring cells %d and %d" % (self.cell_id, self.new_cell_id))
         self.data_manager.setCells([self.cell_id, self.new_cell_id],
                                    [self.cell, self.new_cell],
@@ -319,19 +348,10 @@ class MergeCells(PointsCommand):
                 new_cell.insert(i+1, v)
                 i = i + 1
         if self.ls_cid.parent:
-            ls_parent = self.data_manager.lifespan(self.ls_cid.parent)
-            dgtrs = list(ls_parent.daughters)
-            if dgtrs[0] == self.cell_id:
-                dgtrs[0] = self.new_cell_id
-            else:
-                dgtrs[1] = self.new_cell_id
-            ls_parent.daughters = dgtrs
-            self.data_manager.lifespan(self.cell_id).parent = None
+            changeDaughter(self.data_manager, self.ls_cid.parent, self.cell_id, self.new_cell_id)
+            changeParent(self.data_manager, [self.cell_id], None)
         if self.ls_cid.daughters:
-            lf0 = self.data_manager.lifespan(self.ls_cid.daughters[0])
-            lf1 = self.data_manager.lifespan(self.ls_cid.daughters[1])
-            lf0.parent = self.new_cell_id
-            lf1.parent = self.new_cell_id
+            changeParent(self.data_manager, self.ls_cid.daughters, self.new_cell_id)
         log_debug("Merging cell %d with cell %d" % (self.cell_id, self.new_cell_id))
         self.data_manager.removeCells(self.cell_id)
         self.data_manager.setCells(self.new_cell_id, new_cell, new_ls)
@@ -378,14 +398,11 @@ class SplitPointsId(PointsCommand):
         lifespans = []
         # First, change cells
         for cid in self.cells:
-            lifespans.append(dm.lifespan(cid))
+            ls = dm.lifespan(cid)
             # Next, change division points if needed
             if cid in self.dividing:
-                pos = self.dividing[cid]
-                ls = lifespans[-1]
-                div = list(ls.division)
-                div[pos] = new_pt_id
-                ls.division = div
+                ls = changeDivision(dm, cid, self.dividing[cid], new_pt_id)
+            lifespans.append(ls)
         dm.setCells(self.cells, self.cell_shape, lifespans)
         # Then, walls
         for (t, p1, p2) in self.walls:
@@ -413,7 +430,6 @@ class SplitPointsId(PointsCommand):
         for cid in self.cells:
             log_debug("Inserting point %d in cell %d" % (new_pt_id, cid))
             ls = dm.lifespan(cid)
-            lifespans.append(ls)
             cell_shape = list(dm.cells[cid])
             idx = cell_shape.index(pt_id)
             if ls.start <= tid and ls.end > tid:
@@ -423,11 +439,8 @@ class SplitPointsId(PointsCommand):
             cell_shapes.append(cell_shape)
             # Next, change division points if needed
             if cid in self.dividing:
-                pos = self.dividing[cid]
-                ls = lifespans[-1]
-                div = list(ls.division)
-                div[pos] = new_pt_id
-                ls.division = div
+                ls = changeDivision(dm, cid, self.dividing[cid], new_pt_id)
+            lifespans.append(ls)
         dm.setCells(self.cells, cell_shapes, lifespans)
         # Then, walls
         for (t, p1, p2) in self.walls:
@@ -500,10 +513,7 @@ class ChangePointsId(PointsCommand):
                 del dm.walls[t, p1, new_pt_id]
         # And then, the cell divisions
         for cid, pos in self.divisions:
-            lf = dm.lifespan(cid)
-            div = list(lf.division)
-            div[pos] = pt_id
-            lf.division = div
+            dm.changeCellsLifespan([cid], [changeDivision(dm, cid, pos, pt_id)])
         # Then, the cells
         dm.setCells(self.cells, self.cell_shape)
         # At last, replace the points
@@ -536,10 +546,7 @@ class ChangePointsId(PointsCommand):
             cell_shapes.append(cell)
         # And then, the cell divisions
         for cid, pos in self.divisions:
-            lf = dm.lifespan(cid)
-            div = list(lf.division)
-            div[pos] = new_pt_id
-            lf.division = div
+            dm.changeCellsLifespan([cid], [changeDivision(dm, cid, pos, new_pt_id)])
         dm.setCells(self.cells, cell_shapes)
         # At last, replace points
         for image in images:
@@ -777,30 +784,32 @@ class ResetAlignment(QUndoCommand):
 
 
 class CleanCells(QUndoCommand):
-    def __init__(self, data_manager, parent=None):
+    def __init__(self, data_manager, cleaning=None, parent=None):
         QUndoCommand.__init__(self, "Cleaning cells", parent)
         self.data_manager = data_manager
+        self.cleaning = cleaning
         self.first_run = True
 
     def redo(self):
-        changed_cells, saved_cells = self.data_manager.cleanCells()
+        changed_cells, saved_cells = self.data_manager.cleanCells(self.cleaning)
         self.changed_cells = changed_cells
         self.saved_cells = saved_cells
         if self.first_run:
             self.first_run = False
+            cells = self.data_manager.cells
+            self.cleaning = (changed_cells, saved_cells, [cells[cid] for cid in changed_cells])
             msg = "Nothing to do. Cells are clean."
             if saved_cells:
                 actions = []
                 for cid, old_pt_ids in zip(changed_cells, saved_cells):
                     left_pts = list(old_pt_ids)
-                    new_pts = self.data_manager.cells[cid]
+                    new_pts = cells[cid]
                     for pt_id in new_pts:
                         left_pts.remove(pt_id)
-                    actions.append((cid, left_pts))
                     if left_pts:
                         actions.append("On cell %d, removed duplicated points: %s" %
                                        (cid, ",".join(str(ptid) for ptid in left_pts)))
-                    if old_pt_ids.index(new_pts[0]) > old_pt_ids(new_pts[1]):
+                    if len(new_pts) > 1 and old_pt_ids.index(new_pts[0]) > old_pt_ids.index(new_pts[1]):
                         actions.append("Reversed orientation of cell %d" % cid)
                 msg = "\n".join(actions)
                 msg = "Cleaning actions:\n%s" % msg
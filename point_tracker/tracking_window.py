@@ -3,14 +3,14 @@ from __future__ import print_function, division, absolute_import
 __author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
 __docformat__ = "restructuredtext"
 
-from PyQt4.QtCore import (QRectF, QSignalMapper, pyqtSignature, QPointF)
+from PyQt4.QtCore import (QRectF, QSignalMapper, pyqtSignature, QPointF, QCoreApplication, QEvent)
 from PyQt4.QtGui import (QGraphicsView, QAction, QDialog,
                          QMainWindow, QMessageBox, QUndoStack, QKeySequence, QWidget, QActionGroup,
                          QInputDialog, QMenu, QLabel, QFileDialog, QImageReader, QImageWriter,
                          QPolygonF)
 from PyQt4.QtOpenGL import QGLWidget, QGLFormat, QGL
 from .path import path
-from .project import Project
+from .project import Project, DataSaved
 from .tracking_data import TrackingDataException, RetryTrackingDataException
 from .tracking_scene import TrackingScene, LinkedTrackingScene
 from .tracking_undo import (ChangePointsId, ChangeTiming, CleanCells, ResetAlignment, AlignImages,
@@ -26,9 +26,10 @@ from .alignmentdlg import AlignmentDlg
 from .timeeditdlg import TimeEditDlg
 from .editresdlg import EditResDlg
 from .growth_computation import GrowthComputationDlg
+from .growth_parallel import defaultProcesses
 from .plottingdlg import PlottingDlg
 from .sys_utils import createForm, showException, retryException
-from .debug import log_debug
+from .debug import log_debug, show_instruments
 from .__init__ import __version__, __revision__
 
 
@@ -57,6 +58,14 @@ class TrackingWindow(QMainWindow):
             Object managing the previous pane
         _currentScene : `tracking_scene.LinkedTrackingScene`
             Object managing the current pane
+        clean_thread : `algo.FindCellsCleaning`
+            Thread looking for the cells to clean, if any is running
+        save_thread : `project.SaveData`
+            Thread saving the data in background, if any is running
+        _edits : int
+            number of changes of the undo stack, used to know if the data were modified during a background save
+        _save_edits : int
+            value of `_edits` when the running background save started
     """
     def __init__(self, *args, **kwords):
         QMainWindow.__init__(self, *args)
@@ -65,6 +74,10 @@ class TrackingWindow(QMainWindow):
         self.ui.setupUi(self)
         self._project = None
         self._data = None
+        self.clean_thread = None
+        self.save_thread = None
+        self._edits = 0
+        self._save_edits = 0
         self.toolGroup = QActionGroup(self)
         self.toolGroup.addAction(self.ui.actionAdd_point)
         self.toolGroup.addAction(self.ui.action_Move_point)
@@ -178,6 +191,7 @@ class TrackingWindow(QMainWindow):
         self.undo_stack.redoTextChanged["const QString&"].connect(self.changeRedoText)
         self.undo_stack.undoTextChanged["const QString&"].connect(self.changeUndoText)
         self.undo_stack.cleanChanged[bool].connect(self.ui.action_Save.setDisabled)
+        self.undo_stack.indexChanged[int].connect(self.commitJournal)
 
 #        link_icon = QIcon()
 #        pix = QPixmap(":/icons/link.png")
@@ -245,6 +259,8 @@ class TrackingWindow(QMainWindow):
                                      " Are you sure you want to exit?"):
             event.ignore()
             return
+        if self._project is not None:
+            self._project.compactJournal()
         QMainWindow.closeEvent(self, event)
         #sys.exit(0)
 
@@ -372,25 +388,61 @@ class TrackingWindow(QMainWindow):
 
     @pyqtSignature("")
     def on_action_Save_triggered(self):
-        self.save_data()
+        self.save_data(background=True)
 
     @pyqtSignature("")
     def on_actionSave_as_triggered(self):
         fn = QFileDialog.getSaveFileName(self, "Select a data file to save in", self._project.data_dir,
                                                "CSV Files (*.csv);;All files (*.*)")
         if fn:
-            self.save_data(path(fn))
+            self.save_data(path(fn), background=True)
 
-    def save_data(self, data_file=None):
+    def save_data(self, data_file=None, background=False):
+        """
+        Save the data. In background, a snapshot of the data is written by a thread and the undo stack is marked
+        clean only if nothing was modified in the meantime. A journaled data file is saved at once in its journal,
+        and the data file is then rewritten in background to compact it.
+        """
         if self._data is None:
             raise TrackingDataException("Trying to save data when none have been loaded")
         try:
-            self._project.save(data_file)
+            if background and not self._project.isJournaled(data_file):
+                if self.save_thread is not None:
+                    return False
+                self._save_edits = self._edits
+                self.save_thread = self._project.saveInBackground(self, data_file)
+            else:
+                self.waitSave()
+                journaled = self._project.isJournaled(data_file)
+                self._project.save(data_file)
+                if background and journaled:
+                    self._save_edits = self._edits
+                    self.save_thread = self._project.saveInBackground(self, data_file)
             return True
         except TrackingDataException as ex:
             showException(self, "Error while saving data", ex)
             return False
 
+    def waitSave(self):
+        """
+        Wait for the background save to finish, if any is running.
+        """
+        if self.save_thread is not None:
+            self.save_thread.wait()
+            QCoreApplication.sendPostedEvents(self, QEvent.User)
+
+    def finishSave(self, event):
+        self.save_thread.wait()
+        self.save_thread = None
+        project = event.project
+        if project is not self._project:
+            event.journal.close()
+            return
+        if not project.finishSave(event):
+            showException(self, "Error while saving data", event.error)
+        elif self._edits == self._save_edits:
+            project.data.saved.emit()
+
     def load_data(self, **opts):
         if self._project is None:
             raise TrackingDataException("Trying to load data when no project have been loaded")
@@ -401,6 +453,20 @@ class TrackingWindow(QMainWindow):
             else:
                 log_debug("Data file is clean.")
                 self.ui.action_Save.setEnabled(False)
+            if self._project.discarded_journal is not None:
+                QMessageBox.warning(self, "Journal discarded",
+                                    "The data file changed since its journal of modifications was written, so the "
+                                    "journal cannot be applied. It was moved to:\n%s" %
+                                    self._project.discarded_journal)
+            if self._project.recovered:
+                button = QMessageBox.question(self, "Unsaved modifications recovered",
+                                              "Modifications of the data file that were not saved have been "
+                                              "recovered. Do you want to keep them?",
+                                              QMessageBox.Yes | QMessageBox.Discard)
+                if button == QMessageBox.Discard:
+                    self._project.discardJournal()
+                    return self.load_data(**opts)
+                self.ui.action_Save.setEnabled(True)
             return True
         except TrackingDataException as ex:
             showException(self, "Error while loading data", ex)
@@ -412,13 +478,20 @@ class TrackingWindow(QMainWindow):
                 return self.load_data(**new_opts)
             return False
 
+    def commitJournal(self, index):
+        self._edits += 1
+        if self._project is not None and self._project.journal is not None:
+            self._project.journal.commit()
+
     def ensure_save_data(self, title, reason):
-        if self._data is not None and not self.undo_stack.isClean():
+        self.waitSave()
+        if self._data is not None and (not self.undo_stack.isClean() or self._project.recovered):
             button = QMessageBox.warning(self, title, reason, QMessageBox.Yes | QMessageBox.Save | QMessageBox.Cancel)
             if button == QMessageBox.Save:
                 return self.save_data()
             elif button == QMessageBox.Cancel:
                 return False
+            self._project.discardJournal()
             self.undo_stack.clear()
         return True
 
@@ -710,6 +783,18 @@ class TrackingWindow(QMainWindow):
                 self.cancelCopy()
                 dlg.accept()
             return True
+        elif isinstance(event, DataSaved):
+            self.finishSave(event)
+            return True
+        elif isinstance(event, algo.CellsCleaned):
+            self.clean_thread.wait()
+            self.clean_thread = None
+            self.ui.actionClean_cells.setEnabled(True)
+            if event.error is not None:
+                showException(self, "Error while cleaning the cells", event.error)
+            elif event.data_manager is self._data:
+                self.undo_stack.push(CleanCells(self._data, event.cleaning))
+            return True
         elif isinstance(event, algo.Aborted):
             dlg = self.copy_dlg
             if dlg is not None:
@@ -906,6 +991,10 @@ Copyright 2008
     def on_actionAbout_Qt_triggered(self):
         QMessageBox.aboutQt(self, "About Qt")
 
+    @pyqtSignature("")
+    def on_actionShow_timings_triggered(self):
+        show_instruments(self)
+
     @pyqtSignature("")
     def on_actionReset_alignment_triggered(self):
         self.undo_stack.push(ResetAlignment(self._data))
@@ -990,7 +1079,14 @@ Copyright 2008
 
     @pyqtSignature("")
     def on_actionClean_cells_triggered(self):
-        self.undo_stack.push(CleanCells(self._data))
+        if self.clean_thread is not None:
+            return
+        self.ui.actionClean_cells.setEnabled(False)
+        processes = parameters.instance.growth_processes
+        if not processes:
+            processes = defaultProcesses()
+        self.clean_thread = algo.FindCellsCleaning(self._data, self, processes)
+        self.clean_thread.start()
 
     @pyqtSignature("")
     def on_actionGotoCell_triggered(self):
@@ -96,10 +96,11 @@ class TrackingView(QGraphicsView):
                 if self._second_point is not None:
                     self._second_point.setSelected(False)
                     self._second_point = None
-                for it in scene.items(scene_pos):
-                    if isinstance(it, PointItem) and it.pt_id in scene.data_manager.cells[scene.current_cell]:
-                        it.setSelected(True)
-                        self._second_point = it
+                pt_id = scene.pointAt(scene_pos)
+                if pt_id in scene.points and pt_id in scene.data_manager.cells[scene.current_cell]:
+                    it = scene.points[pt_id]
+                    it.setSelected(True)
+                    self._second_point = it
                 return
         QGraphicsView.mouseMoveEvent(self, event)
 
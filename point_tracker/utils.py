@@ -4,6 +4,7 @@ __author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
 __docformat__ = "restructuredtext"
 import scipy
 from scipy import zeros, concatenate, asarray, array, dtype
+import multiprocessing
 import sys
 
 def padding(A, pad):
@@ -72,3 +73,16 @@ def compare_versions(v1, v2):
         return 1
     return 0
 
+def processPool(processes, initializer=None, initargs=()):
+    """
+    Create a pool of worker processes started from a new interpreter rather than forked: a fork of the interface, or
+    of any process running threads, copies the locks held by the other threads and the state of Qt.
+
+    :returntype: `multiprocessing.pool.Pool`
+    """
+    try:
+        context = multiprocessing.get_context("spawn")
+    except AttributeError:  # Before Python 3.4, the start method cannot be chosen
+        context = multiprocessing
+    return context.Pool(processes, initializer, initargs)
+
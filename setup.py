@@ -135,14 +135,16 @@ setup(name='point-tracker',
                    ],
       platforms=['Linux', 'Windows', 'MacOS'],
       license='LICENSE',
-      install_requires=['numpy >=1.5.0',
-                        'scipy >=0.10.0',
+      install_requires=['numpy >=1.8.0',
+                        'scipy >=0.12.0',
                         'matplotlib',
                         'scikit-image'
                         ],
       url=['https://github.com/PierreBdR/point_tracker'],
       entry_points={
-          'console_scripts': ['track_color = point_tracker.track_color:main'],
+          'console_scripts': ['track_color = point_tracker.track_color:main',
+                              'point_tracker_merge = point_tracker.merge:main',
+                              'point_tracker_growth = point_tracker.batch_growth:main'],
           'gui_scripts': ['point_tracker = point_tracker.tracking:main']},
       test_suite="nose.collector",
       tests_require="nose",
@@ -0,0 +1,82 @@
+from __future__ import print_function, division, absolute_import
+"""
+Tests comparing the batch computation of the growth parameters with the computation cell by cell.
+"""
+
+__author__ = "Pierre Barbier de Reuille <pierre@barbierdereuille.net>"
+__docformat__ = "restructuredtext"
+
+import unittest
+import warnings
+from numpy import array, cos, sin, isnan, pi
+from numpy.random import RandomState
+from point_tracker.growth_algo import growthParams, growthParamsBatch, checkGrowthParamsBatch
+
+
+def randomCells(rng, nb_cells):
+    """
+    :returns: the points of random cells, before and after a random affine transformation with some noise
+    :returntype: (list of ndarray(N_i,2), list of ndarray(N_i,2))
+    """
+    ps = []
+    qs = []
+    for i in range(nb_cells):
+        nb_pts = rng.randint(3, 12)
+        p = rng.rand(nb_pts, 2) * 20
+        angle = rng.uniform(-pi, pi)
+        rot = array([[cos(angle), -sin(angle)], [sin(angle), cos(angle)]])
+        scale = array([[rng.uniform(0.8, 1.5), rng.uniform(-0.2, 0.2)],
+                       [rng.uniform(-0.2, 0.2), rng.uniform(0.8, 1.5)]])
+        q = p.dot(scale.dot(rot).T) + rng.rand(2) * 5 + rng.normal(0, 0.05, p.shape)
+        ps.append(p)
+        qs.append(q)
+    return ps, qs
+
+
+class TestGrowthParamsBatch(unittest.TestCase):
+    def setUp(self):
+        self.rng = RandomState(42)
+
+    def check(self, ps, qs, dt):
+        for exp_correction in (True, False):
+            for at_start in (True, False):
+                wrong = checkGrowthParamsBatch(ps, qs, dt, exp_correction, at_start)
+                self.assertEqual(wrong, [], "exp_correction=%s, at_start=%s" % (exp_correction, at_start))
+
+    def test_random_cells(self):
+        ps, qs = randomCells(self.rng, 200)
+        self.check(ps, qs, 1.)
+        self.check(ps, qs, self.rng.uniform(0.1, 5, len(ps)))
+
+    def test_degenerate_cells(self):
+        ps, qs = randomCells(self.rng, 20)
+        # Aligned points and points all at the same position
+        ps[0] = array([[0., 0.], [1., 1.], [2., 2.], [3., 3.]])
+        qs[0] = ps[0] * 1.2
+        ps[1] = array([[5., 5.]] * 4)
+        qs[1] = ps[1]
+        # Half-turn, for which the vorticity is measured as pi or -pi
+        qs[2] = -ps[2]
+        self.check(ps, qs, 1.)
+
+    def test_null_time(self):
+        ps, qs = randomCells(self.rng, 30)
+        dt = self.rng.uniform(0.5, 2, len(ps))
+        dt[::3] = 0
+        self.check(ps, qs, dt)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", RuntimeWarning)
+            result = growthParamsBatch(ps, qs, dt)
+        self.assertTrue(isnan(result[dt == 0]).all())
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for i in (dt == 0).nonzero()[0]:
+                gp = growthParams(ps[i], qs[i], 0.)
+                self.assertTrue(gp is None or isnan(array(gp, dtype=float)).all())
+
+    def test_empty(self):
+        self.assertEqual(growthParamsBatch([], [], 1.).shape, (0, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()